@@ -7,16 +7,31 @@ from arduino.app_utils import *
 import requests
 import socket
 import time
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "air_quality_led_matrix"
 UNOQ_DEMO_NAME = "air-quality-monitoring"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
+
+def send_event(payload):
+    # Command acks and errors, outside the rate-limited air quality frames
+    payload.setdefault("UnoQdemo", UNOQ_DEMO_NAME)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok, key="event")
+
+
 # Insert your API token here
 API_TOKEN = "demo"
 
@@ -72,16 +87,16 @@ def on_relay_command(command_name: str, parameters):
             city = new_city
             print("City updated to:", city)
             # Send ack-ish telemetry so you can see it happened
-            relay.send_telemetry({"event": "city_updated", "city": city})
+            send_event({"event": "city_updated", "city": city})
         else:
-            relay.send_telemetry({"event": "city_update_failed", "reason": "missing city"})
+            send_event({"event": "city_update_failed", "error": "missing city"})
 
     # Example command: ping
     elif command_name == "ping":
-        relay.send_telemetry({"event": "pong", "ts": int(time.time())})
+        send_event({"event": "pong"})
 
     else:
-        relay.send_telemetry({"event": "unknown_command", "command": command_name})
+        send_event({"event": "unknown_command", "error": command_name})
 
 # Start relay client
 relay = IoTConnectRelayClient(
@@ -108,7 +123,7 @@ def get_air_quality():
         response_json = response.json()
     except Exception as e:
         print("HTTP error:", e)
-        relay.send_telemetry({"city": city, "error": "http_error", "detail": str(e)})
+        send_event({"city": city, "error": f"http_error: {e}"})
         return
 
     status = response_json.get("status")
@@ -116,7 +131,7 @@ def get_air_quality():
 
     if status != "ok" or not data:
         print(f"API Error: {response_json}")
-        relay.send_telemetry({"city": city, "error": "api_error", "raw": response_json})
+        send_event({"city": city, "error": f"api_error: {response_json.get('data')}"})
         return
 
     aqi = data.get("aqi", -1)
@@ -132,9 +147,8 @@ def get_air_quality():
     }
     now = time.time()
     if now - IOTC_LAST_SEND >= IOTC_INTERVAL_SEC:
-        print("IOTCONNECT send:", payload)
-        ok = relay.send_telemetry(payload)
-        print("IOTCONNECT send result:", ok)
+        ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+        log_telemetry(IOTC_LOG, payload, ok)
         globals()["IOTC_LAST_SEND"] = now
 
     return aqi_level
@@ -6,26 +6,46 @@ from arduino.app_utils import *
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.visual_anomaly_detection import VisualAnomalyDetection
 from arduino.app_utils import draw_anomaly_markers
-from PIL import Image
-import io
 import base64
 import time
 import os
 from pathlib import Path
 import json
-import requests
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import DIGEST_FIELDS, instrument, start_digest
+from iotc_inference import BusyError, InferenceExecutor, charge, queue_ms
+from iotc_detection_cache import DetectionCache, to_confidence
+from iotc_fetch import FETCH_FIELDS, fetch_image, timing_fields
+from iotc_decode import decode_image, model_input_size
+from iotc_spans import SPAN_FIELDS, Spans, record, span_summary
+from iotc_result_image import ResultEncoder
+from iotc_upload import upload_endpoint
+from iotc_startup import STARTUP_FIELDS, Startup
+from iotc_detections import parse_results
+from iotc_scene_hash import SCENE_FIELDS, SceneCache
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "concrete_crack_detector"
 UNOQ_DEMO_NAME = "anomaly-detection"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+# Warm-up and relay connect run in the background; see iotc_startup
+STARTUP = Startup()
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 DEFAULT_CONFIDENCE = 0.5
 CURRENT_CONFIDENCE = DEFAULT_CONFIDENCE
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh)
+TELEMETRY = load_encoder(
+    Path(__file__).with_name("iotc_config.json"),
+    defaults={"has_anomaly": "false", "detections_json": "[]"},
+    optional=DIGEST_FIELDS + FETCH_FIELDS + SPAN_FIELDS + STARTUP_FIELDS + SCENE_FIELDS,
+)
+
 
 def on_relay_command(command_name, parameters):
     global IOTC_INTERVAL_SEC, CURRENT_CONFIDENCE
@@ -49,6 +69,12 @@ def on_relay_command(command_name, parameters):
             print(f"IOTCONNECT confidence set to {CURRENT_CONFIDENCE}")
         except Exception as e:
             print(f"IOTCONNECT confidence update failed: {e}")
+    elif command_name == "set-result-format":
+        try:
+            settings = RESULTS.update_from_command(parameters)
+            print(f"IOTCONNECT result format set to {settings.as_dict()}")
+        except Exception as e:
+            print(f"IOTCONNECT result format update failed: {e}")
 
 
 relay = IoTConnectRelayClient(
@@ -56,24 +82,32 @@ relay = IoTConnectRelayClient(
     client_id=RELAY_CLIENT_ID,
     command_callback=on_relay_command
 )
-relay.start()
+STARTUP.start_relay(relay)
+start_digest(relay, UNOQ_DEMO_NAME)
 
 
-def send_telemetry(payload):
+def send_telemetry(payload, key="telemetry", force=False):
+    # force: one-off frames (startup) that neither wait for nor use up the interval
     global IOTC_LAST_SEND
     now = time.time()
-    if now - IOTC_LAST_SEND < IOTC_INTERVAL_SEC:
-        return False
+    if not force:
+        if now - IOTC_LAST_SEND < IOTC_INTERVAL_SEC:
+            return False
+        IOTC_LAST_SEND = now
     payload.setdefault("UnoQdemo", UNOQ_DEMO_NAME)
-    payload["interval_sec"] = int(IOTC_INTERVAL_SEC)
-    IOTC_LAST_SEND = now
-    print("IOTCONNECT send:", payload)
-    ok = relay.send_telemetry(payload)
-    print("IOTCONNECT send result:", ok)
+    payload["interval_sec"] = IOTC_INTERVAL_SEC
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok, key=key)
     return ok
 
 
 anomaly_detection = VisualAnomalyDetection()
+INPUT_SIZE = model_input_size(anomaly_detection)
+STARTUP.warm_up(lambda image: anomaly_detection.detect(image), INPUT_SIZE)
+INFERENCE = InferenceExecutor()
+DETECTIONS = DetectionCache()
+SCENES = SceneCache()
+RESULTS = ResultEncoder()
 
 SCRIPT_DIR = Path(__file__).resolve().parent.parent
 IMAGES_DIR = SCRIPT_DIR / "assets"
@@ -87,172 +121,173 @@ def parse_data(data):
             return {}
     return data if isinstance(data, dict) else {}
 
-def normalize_results(results):
-    """
-    Try to extract a list of detections with confidence and bbox.
-    This is defensive because the result shape can vary by model.
-    """
-    detections = []
-    if results is None:
-        return detections
-
-    # If wrapped in dict with detection key (current model)
-    if isinstance(results, dict) and isinstance(results.get("detection"), list):
-        results_list = results.get("detection")
-    # If wrapped in dict with anomalies key (other models)
-    elif isinstance(results, dict) and isinstance(results.get("anomalies"), list):
-        results_list = results.get("anomalies")
-    elif isinstance(results, list):
-        results_list = results
-    else:
-        results_list = []
-
-    for r in results_list:
-        if not isinstance(r, dict):
-            continue
-        conf = r.get("confidence", r.get("score", r.get("prob", r.get("p"))))
-        bbox = r.get("bbox")
-        bbox_xyxy = r.get("bounding_box_xyxy")
-        det = {}
-        if conf is not None:
-            det["confidence"] = float(conf)
-        if isinstance(bbox_xyxy, (list, tuple)) and len(bbox_xyxy) >= 4:
-            x1, y1, x2, y2 = bbox_xyxy[0], bbox_xyxy[1], bbox_xyxy[2], bbox_xyxy[3]
-            det["x"] = x1
-            det["y"] = y1
-            det["w"] = max(0.0, x2 - x1)
-            det["h"] = max(0.0, y2 - y1)
-        elif isinstance(bbox, (list, tuple)) and len(bbox) >= 4:
-            det["x"], det["y"], det["w"], det["h"] = bbox[0], bbox[1], bbox[2], bbox[3]
-        else:
-            for k in ("x", "y", "w", "h"):
-                if k in r:
-                    det[k] = r.get(k)
-        detections.append(det)
-    return detections
-
-
-def on_detect_anomalies(client_id, data):
+def run_detect_anomalies(client_id, data):
     try:
+        # Requests that arrive during startup wait for the warm-up instead of racing it
+        STARTUP.wait()
         parsed = parse_data(data)
         image_data = parsed.get('image')
         image_url = parsed.get('image_url')
-        confidence = parsed.get('confidence', CURRENT_CONFIDENCE)
+        image_bytes = parsed.get('image_bytes')    # from the binary upload endpoint
+        confidence = to_confidence(parsed.get('confidence'), CURRENT_CONFIDENCE)
 
-        if not image_data and not image_url:
+        if not image_data and not image_url and image_bytes is None:
             ui.send_message('detection_error', {'error': 'No image data'})
             send_telemetry({
                 "status": "error",
-                "detection_count": 0,
-                "processing_time_ms": 0,
-                "has_anomaly": "false",
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                "max_confidence": 0.0,
-                "avg_confidence": 0.0,
-                "detections_json": "[]",
+                "confidence": confidence,
                 "input_type": "none",
             })
             return
 
+        spans = Spans()
         input_type = "upload"
-        if image_url and not image_data:
+        fetch_timings = {}
+        if image_url and not image_data and image_bytes is None:
             input_type = "url"
             try:
-                resp = requests.get(image_url, timeout=10)
-                resp.raise_for_status()
-                image_bytes = resp.content
+                with spans.span("fetch_ms"):
+                    fetched = fetch_image(image_url)
+                image_bytes = fetched.content
+                fetch_timings = timing_fields(fetched)
             except Exception as e:
                 ui.send_message('detection_error', {'error': f'Failed to fetch image_url: {e}'})
                 send_telemetry({
                     "status": "error",
-                    "detection_count": 0,
-                    "processing_time_ms": 0,
-                    "has_anomaly": "false",
-                    "confidence": float(confidence) if confidence is not None else 0.0,
-                    "max_confidence": 0.0,
-                    "avg_confidence": 0.0,
-                    "detections_json": "[]",
+                    "confidence": confidence,
                     "input_type": input_type,
                 })
                 return
-        else:
-            image_bytes = base64.b64decode(image_data)
-        pil_image = Image.open(io.BytesIO(image_bytes))
+        elif image_bytes is None:
+            with spans.span("decode_ms"):
+                image_bytes = base64.b64decode(image_data)
+        # Decoded at roughly the model input size; decoded.to_original() maps boxes back
+        with spans.span("decode_ms"):
+            decoded = decode_image(image_bytes, INPUT_SIZE, reserve=charge)
+        pil_image = decoded.image
+        settings = RESULTS.settings_for(parsed)
+
+        # A near-identical scene with the same size and result settings reuses
+        # the stored result: no inference, markers or encoding
+        reuse = str(parsed.get('reuse', True)).lower() not in ("false", "0", "no", "off")
+        scene = SCENES.lookup(pil_image, decoded.original_size, tuple(settings.as_dict().items()), reuse=reuse)
 
         start_time = time.time() * 1000
-        results = anomaly_detection.detect(pil_image)
-        print("RAW RESULTS:", results)
+        if scene.reused:
+            results, dets, encoded = scene.value
+            cache_hit = False
+        else:
+            # Anomaly scores do not depend on the confidence setting: cache unfiltered.
+            with spans.span("infer_ms"):
+                results, cache_hit = DETECTIONS.detect(
+                    DETECTIONS.key(image_bytes, INPUT_SIZE),
+                    None,
+                    lambda _threshold: anomaly_detection.detect(pil_image),
+                )
+        IOTC_LOG.debug("RAW RESULTS: %s", results)
         diff = time.time() * 1000 - start_time
 
         if results is None:
             ui.send_message('detection_error', {'error': 'No results returned'})
             send_telemetry({
                 "status": "error",
-                "detection_count": 0,
-                "processing_time_ms": int(diff),
-                "has_anomaly": "false",
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                "max_confidence": 0.0,
-                "avg_confidence": 0.0,
-                "detections_json": "[]",
+                "processing_time_ms": diff,
+                "confidence": confidence,
                 "input_type": input_type,
             })
             return
 
-        img_with_markers = draw_anomaly_markers(pil_image, results)
-
-        if img_with_markers is not None:
-            img_buffer = io.BytesIO()
-            img_with_markers.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            b64_result = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
-        else:
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            b64_result = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
+        if not scene.reused:
+            dets = parse_results(decoded.to_original(results))
+            img_with_markers = None
+            if not settings.boxes_only:
+                with spans.span("draw_ms"):
+                    img_with_markers = draw_anomaly_markers(pil_image, results)
+                if img_with_markers is None:
+                    img_with_markers = pil_image
+            encoded = RESULTS.encode(img_with_markers, settings, dets.items, decoded.original_size)
+            spans.add("encode_ms", encoded.encode_ms)
+            SCENES.store(scene, (results, dets, encoded))
+        detections = dets.items
 
         response = {
             'success': True,
-            'result_image': b64_result,
+            **encoded.message,
             'detection_count': len(results.get("detection", [])) if isinstance(results, dict) else (len(results) if results else 0),
+            'reused': scene.reused,
             'processing_time': f"{diff:.2f} ms"
         }
-        ui.send_message('detection_result', response)
+        with spans.span("send_ms"):
+            ui.send_message('detection_result', response)
 
-        detections = normalize_results(results)
-        confs = [d.get("confidence") for d in detections if isinstance(d.get("confidence"), (int, float))]
-        max_conf = max(confs) if confs else float(results.get("anomaly_max_score", 0.0)) if isinstance(results, dict) else 0.0
-        avg_conf = (sum(confs) / len(confs)) if confs else float(results.get("anomaly_mean_score", 0.0)) if isinstance(results, dict) else 0.0
+        stats = dets.stats()
+        if isinstance(results, dict) and not any("confidence" in d for d in detections):
+            # No per-region scores: fall back to the image-level ones
+            stats["max_confidence"] = float(results.get("anomaly_max_score", 0.0))
+            stats["avg_confidence"] = float(results.get("anomaly_mean_score", 0.0))
 
+        relay_start = time.perf_counter()
         send_telemetry({
             "status": "ok",
-            "detection_count": len(detections),
-            "processing_time_ms": int(diff),
-            "has_anomaly": "true" if (detections and len(detections) > 0) else "false",
-            "confidence": float(confidence) if confidence is not None else 0.0,
-            "max_confidence": float(max_conf),
-            "avg_confidence": float(avg_conf),
-            "detections_json": json.dumps(detections),
+            "queue_ms": queue_ms(),
+            "queue_depth": INFERENCE.depth(),
+            "cache_hit": cache_hit,
+            **fetch_timings,
+            **spans.fields(),
+            **scene.fields(),
+            "result_bytes": encoded.result_bytes,
+            **stats,
+            "processing_time_ms": diff,
+            "has_anomaly": bool(detections),
+            "confidence": confidence,
+            "detections_json": detections,
             "input_type": input_type,
         })
+        record(spans, relay_ms=(time.perf_counter() - relay_start) * 1000.0)
+        return response
 
+    except BusyError as e:
+        reject_busy(e, parse_data(data))
+        raise    # so the upload endpoint answers 503, not 422
     except Exception as e:
         ui.send_message('detection_error', {'error': str(e)})
         send_telemetry({
             "status": "error",
-            "detection_count": 0,
-            "processing_time_ms": 0,
-            "has_anomaly": "false",
-            "confidence": float(CURRENT_CONFIDENCE),
-            "max_confidence": 0.0,
-            "avg_confidence": 0.0,
-            "detections_json": "[]",
+            "confidence": CURRENT_CONFIDENCE,
             "input_type": "error",
         })
 
 
+def reject_busy(e, parsed):
+    print(f"on_detect_anomalies rejected: {e}")
+    ui.send_message('detection_error', {'error': 'busy', 'reason': e.reason, 'queue_depth': e.queue_depth})
+    send_telemetry({
+        "status": "busy",
+        "confidence": parsed.get('confidence', CURRENT_CONFIDENCE),
+        "input_type": "url" if parsed.get('image_url') and not parsed.get('image') else "upload",
+        "queue_depth": e.queue_depth,
+    })
+
+
+def on_detect_anomalies(client_id, data):
+    # Runs on the WebUI / relay thread: admit or reject, never block.
+    parsed = parse_data(data)
+    try:
+        INFERENCE.submit(run_detect_anomalies, client_id, parsed, cost_bytes=len(parsed.get('image') or ''))
+    except BusyError as e:
+        reject_busy(e, parsed)
+
+
+def send_startup():
+    send_telemetry({"status": "startup", **STARTUP.fields()}, key="startup", force=True)
+
+
+STARTUP.start(send_startup)
+
 ui = WebUI()
+instrument(ui)
 ui.on_message('detect_anomalies', on_detect_anomalies)
+ui.expose_api('POST', '/detect_anomalies', upload_endpoint(INFERENCE, run_detect_anomalies, reject_busy))
+ui.expose_api('GET', '/spans', span_summary)
 
 App.run()
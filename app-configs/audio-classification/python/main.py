@@ -10,16 +10,23 @@ import os
 import io
 import base64
 import json
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "glass_breaking_sensor"
 UNOQ_DEMO_NAME = "audio-classification"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 # Global state
 AUDIO_DIR = "/app/assets/audio"
 
@@ -60,9 +67,8 @@ def send_telemetry(payload):
     payload.setdefault("UnoQdemo", UNOQ_DEMO_NAME)
     payload["interval_sec"] = int(IOTC_INTERVAL_SEC)
     IOTC_LAST_SEND = now
-    print("IOTCONNECT send:", payload)
-    ok = relay.send_telemetry(payload)
-    print("IOTCONNECT send result:", ok)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
     return ok
 
 
@@ -98,7 +104,7 @@ def on_run_classification(sid, data):
         if input_audio:
             start_time = time.time() * 1000
             results = AudioClassification.classify_from_file(input_audio, confidence)
-            print("RAW RESULTS:", results)
+            IOTC_LOG.debug("RAW RESULTS: %s", results)
             diff = time.time() * 1000 - start_time
 
             response_data = { 'results': results, 'processing_time': diff }
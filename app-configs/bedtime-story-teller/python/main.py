@@ -6,13 +6,17 @@ import re
 from arduino.app_bricks.cloud_llm import CloudLLM, CloudModel
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_utils import App
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "bedtime_story_teller"
 UNOQ_DEMO_NAME = "bedtime-story-teller"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
@@ -20,6 +24,9 @@ relay = IoTConnectRelayClient(
 )
 relay.start()
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 
 def send_telemetry(data, status="ok"):
     payload = {
@@ -33,8 +40,8 @@ def send_telemetry(data, status="ok"):
         "character_count": int(len(data.get('characters', [])) if isinstance(data.get('characters', []), list) else 0),
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 llm = CloudLLM(
@@ -4,13 +4,17 @@
 
 from arduino.app_utils import *
 from arduino.app_bricks.web_ui import WebUI
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "blink_with_ui"
 UNOQ_DEMO_NAME = "blink-with-ui"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
@@ -18,6 +22,9 @@ relay = IoTConnectRelayClient(
 )
 relay.start()
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 # Global state
 led_is_on = False
 
@@ -28,8 +35,8 @@ def send_telemetry(state, status="ok"):
         "led_state": "on" if state else "off",
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 def get_led_status():
@@ -4,16 +4,23 @@
 
 from arduino.app_utils import *
 import time
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "blink"
 UNOQ_DEMO_NAME = "blink"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 1
 IOTC_LAST_SEND = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 led_state = False
 
 
@@ -62,8 +69,8 @@ def send_telemetry():
         "led_state": "on" if led_state else "off",
         "status": "ok",
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 def loop():
@@ -5,13 +5,17 @@
 # EXAMPLE_NAME = "Arduino Cloud LED Blink Example"
 from arduino.app_bricks.arduino_cloud import ArduinoCloud
 from arduino.app_utils import App, Bridge
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "cloud_blink"
 UNOQ_DEMO_NAME = "cloud-blink"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
@@ -19,6 +23,9 @@ relay = IoTConnectRelayClient(
 )
 relay.start()
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 # If secrets are not provided in the class initialization, they will be read from environment variables
 iot_cloud = ArduinoCloud()
 
@@ -30,8 +37,8 @@ def send_telemetry(led_state, source, status="ok"):
         "source": source,
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 def led_callback(client: object, value: bool):
@@ -7,7 +7,6 @@ import io
 import base64
 import json
 import shlex
-import requests
 from PIL.Image import Image
 from PIL import Image as PILImage
 from arduino.app_utils import *
@@ -15,30 +14,51 @@ from arduino.app_peripherals.usb_camera import USBCamera
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.camera_code_detection import CameraCodeDetection, Detection, draw_bounding_box
 from arduino.app_bricks.dbstorage_sqlstore import SQLStore
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import instrument, start_digest
+from iotc_fetch import fetch_image
+from iotc_clip import ClipRecorder
+from iotc_frame_ring import FrameRing
+from iotc_preview import PreviewStream
+from iotc_code_scan import ContinuousScanner, continuous_mode
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "code_detector"
 UNOQ_DEMO_NAME = "code-detector"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
     client_id=RELAY_CLIENT_ID,
 )
 relay.start()
+start_digest(relay, UNOQ_DEMO_NAME)
+SCANNER = None
+if continuous_mode():
+    # IOTC_SCAN_MODE=continuous: report every new code instead of latching on the first
+    SCANNER = ContinuousScanner(lambda frame, detection: handle_detection(frame, detection, force=True))
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
 
-def send_telemetry(content, code_type, status="ok"):
+
+def send_telemetry(content, code_type, status="ok", clip_file=""):
     payload = {
         "UnoQdemo": UNOQ_DEMO_NAME,
         "code_content": content or "",
         "code_type": code_type or "",
         "status": status,
+        "clip_file": clip_file,
+        **RING.fields(),
+        **(SCANNER.fields() if SCANNER is not None else {}),
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 detected = False
@@ -65,11 +85,13 @@ def parse_payload(parameters):
         return payload
     return {}
 
-def handle_detection(frame: Image, detection: Detection, force=False):
+def handle_detection(frame: Image, detection: Detection, force=False, camera=True):
     global detected
     if detected and not force:
         return
 
+    # Camera detections get a pre/post-roll clip; uploaded images have no stream around them
+    clip_file = CLIPS.trigger(detection.type) if camera else ""
     frame = draw_bounding_box(frame, detection)
 
     buffer = io.BytesIO()
@@ -85,31 +107,25 @@ def handle_detection(frame: Image, detection: Detection, force=False):
     }
     store.store("scan_log", entry)
     ui.send_message('code_detected', entry)
-    detected = True
+    if SCANNER is None:
+        detected = True
 
-    send_telemetry(detection.content, detection.type, "ok")
+    send_telemetry(detection.content, detection.type, "ok", clip_file)
 
 
 def on_code_detected(frame: Image, detection: Detection):
+    if SCANNER is not None:
+        SCANNER.submit(frame, detection)
+        return
     handle_detection(frame, detection)
 
 
 def on_frame(frame: Image):
     global detected
+    CLIPS.add_frame(frame)
     if detected:
         return
-
-    buffer = io.BytesIO()
-    frame.save(buffer, format="JPEG", quality=100)
-    b64_frame = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-    entry = {
-        "timestamp": datetime.now(UTC).isoformat(),
-        "image": b64_frame,
-        "image_type": "image/jpeg",
-    }
-
-    ui.send_message('frame_detected', entry)
+    PREVIEW.offer(frame)
 
 
 def on_list_scans():
@@ -120,6 +136,8 @@ def on_list_scans():
 def reset_detection(_, __):
     global detected
     detected = False
+    if SCANNER is not None:
+        SCANNER.reset()
     send_telemetry("", "", "reset")
 
 
@@ -153,9 +171,7 @@ def on_relay_command(command_name, parameters):
 
     try:
         if image_url and not image_data:
-            resp = requests.get(image_url, timeout=10)
-            resp.raise_for_status()
-            image_bytes = resp.content
+            image_bytes = fetch_image(image_url).content
         else:
             image_bytes = base64.b64decode(image_data)
         frame = PILImage.open(io.BytesIO(image_bytes))
@@ -168,7 +184,8 @@ def on_relay_command(command_name, parameters):
         ui.send_message("code_not_found", {"timestamp": datetime.now(UTC).isoformat()})
         send_telemetry("", "", "not_found")
         return
-    handle_detection(frame, detections[0], force=True)
+    for detection in (detections if SCANNER is not None else detections[:1]):
+        handle_detection(frame, detection, force=True, camera=False)
 
 
 def on_error(e: Exception):
@@ -178,12 +195,18 @@ def on_error(e: Exception):
 store = SQLStore("code-scanner.db")
 
 camera = USBCamera(resolution=(640, 480), fps=5)
+RING = FrameRing((640, 480))
+CLIPS = ClipRecorder(RING)
 detector = CameraCodeDetection(camera)
 detector.on_detect(on_code_detected)
 detector.on_frame(on_frame)
 detector.on_error(on_error)
 
 ui = WebUI()
+instrument(ui)
+PREVIEW = PreviewStream(ui, RING)
+ui.on_connect(PREVIEW.on_connect)
+ui.on_disconnect(PREVIEW.on_disconnect)
 ui.expose_api('GET', '/list_scans', on_list_scans)
 ui.on_message('reset_detection', reset_detection)
 relay.command_callback = on_relay_command
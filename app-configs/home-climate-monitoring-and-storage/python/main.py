@@ -7,17 +7,25 @@ import math
 from arduino.app_bricks.dbstorage_tsstore import TimeSeriesStore
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_utils import App, Bridge
+from pathlib import Path
 import time
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import DIGEST_FIELDS, instrument, start_digest
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "home_climate"
 UNOQ_DEMO_NAME = "home-climate-monitoring-and-storage"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh)
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), optional=DIGEST_FIELDS)
+
 def on_relay_command(command_name, parameters):
     global IOTC_INTERVAL_SEC
     print(f"IOTCONNECT command: {command_name} {parameters}")
@@ -37,6 +45,7 @@ relay = IoTConnectRelayClient(
     command_callback=on_relay_command
 )
 relay.start()
+start_digest(relay, UNOQ_DEMO_NAME)
 
 
 db = TimeSeriesStore()
@@ -48,6 +57,7 @@ def on_get_samples(resource: str, start: str, aggr_window: str):
 
 
 ui = WebUI()
+instrument(ui, Bridge)
 ui.expose_api("GET", "/get_samples/{resource}/{start}/{aggr_window}", on_get_samples)
 
 
@@ -108,19 +118,18 @@ def record_sensor_samples(celsius: float, humidity: float):
     # Publish telemetry to IOTCONNECT (rate-limited)
     payload = {
         "UnoQdemo": UNOQ_DEMO_NAME,
-        "interval_sec": int(IOTC_INTERVAL_SEC),
-        "temperature_c": float(celsius),
-        "humidity": float(humidity),
-        "dew_point": float(dew_point) if dew_point is not None else None,
-        "heat_index": float(heat_index) if heat_index is not None else None,
-        "absolute_humidity": float(absolute_humidity) if absolute_humidity is not None else None,
+        "interval_sec": IOTC_INTERVAL_SEC,
+        "temperature_c": T,
+        "humidity": RH,
+        "dew_point": dew_point,
+        "heat_index": heat_index,
+        "absolute_humidity": absolute_humidity,
         "ts": ts,
     }
     now = time.time()
     if now - IOTC_LAST_SEND >= IOTC_INTERVAL_SEC:
-        print("IOTCONNECT send:", payload)
-        ok = relay.send_telemetry(payload)
-        print("IOTCONNECT send result:", ok)
+        ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+        log_telemetry(IOTC_LOG, payload, ok)
         globals()["IOTC_LAST_SEND"] = now
 
 print("Registering 'record_sensor_samples' callback.")
@@ -5,25 +5,48 @@
 from arduino.app_utils import App
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.image_classification import ImageClassification
-from PIL import Image
-import io
 import base64
 import time
 import json
-import requests
 import shlex
 import traceback
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import DIGEST_FIELDS, instrument, start_digest
+from iotc_inference import BusyError, InferenceExecutor, charge, queue_ms
+from iotc_detection_cache import DetectionCache, to_confidence
+from iotc_fetch import FETCH_FIELDS, fetch_image, timing_fields
+from iotc_decode import decode_image, model_input_size
+from iotc_spans import SPAN_FIELDS, Spans, record, span_summary
+from iotc_upload import upload_endpoint
+from iotc_startup import STARTUP_FIELDS, Startup
+from iotc_detections import parse_results
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "image_classification"
 UNOQ_DEMO_NAME = "image-classification"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+# Warm-up and relay connect run in the background; see iotc_startup
+STARTUP = Startup()
 DEFAULT_CONFIDENCE = 0.25
 CURRENT_CONFIDENCE = DEFAULT_CONFIDENCE
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh)
+TELEMETRY = load_encoder(
+    Path(__file__).with_name("iotc_config.json"),
+    defaults={"results_json": "[]"},
+    optional=DIGEST_FIELDS + FETCH_FIELDS + SPAN_FIELDS + STARTUP_FIELDS,
+)
+
 image_classification = ImageClassification()
+INPUT_SIZE = model_input_size(image_classification)
+STARTUP.warm_up(lambda image: image_classification.classify(image, image_type="jpeg"), INPUT_SIZE)
+INFERENCE = InferenceExecutor()
+DETECTIONS = DetectionCache()
 
 
 def on_relay_command(command_name, parameters):
@@ -74,14 +97,14 @@ relay = IoTConnectRelayClient(
     client_id=RELAY_CLIENT_ID,
     command_callback=on_relay_command
 )
-relay.start()
+STARTUP.start_relay(relay)
+start_digest(relay, UNOQ_DEMO_NAME)
 
 
-def send_telemetry(payload):
+def send_telemetry(payload, key="telemetry"):
     payload.setdefault("UnoQdemo", UNOQ_DEMO_NAME)
-    print("IOTCONNECT send:", payload)
-    ok = relay.send_telemetry(payload)
-    print("IOTCONNECT send result:", ok)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok, key=key)
     return ok
 
 
@@ -94,85 +117,77 @@ def parse_data(data):
     return data if isinstance(data, dict) else {}
 
 
-def pick_top_result(results):
-    if isinstance(results, dict) and isinstance(results.get("classification"), list):
-        first = results.get("classification")[0] if results.get("classification") else None
-        if isinstance(first, dict):
-            return first.get("class_name") or first.get("label"), first.get("confidence") or first.get("score")
-    if isinstance(results, dict):
-        if 'class_name' in results and 'confidence' in results:
-            return results.get('class_name'), results.get('confidence')
-    if isinstance(results, list) and results:
-        first = results[0]
-        if isinstance(first, dict):
-            return first.get('class_name') or first.get('label'), first.get('confidence') or first.get('score')
-    return None, None
-
-
-def on_classify_image(client_id, data):
+def run_classify_image(client_id, data):
     try:
+        # Requests that arrive during startup wait for the warm-up instead of racing it
+        STARTUP.wait()
         parsed = parse_data(data)
         image_data = parsed.get('image')
         image_url = parsed.get('image_url')
+        image_bytes = parsed.get('image_bytes')    # from the binary upload endpoint
         image_type_raw = parsed.get('image_type')
         if image_type_raw:
             image_type = image_type_raw.split('/')[-1]
         else:
             image_type = 'jpeg'
-        confidence = parsed.get('confidence', CURRENT_CONFIDENCE)
+        confidence = to_confidence(parsed.get('confidence'), CURRENT_CONFIDENCE)
 
-        if not image_data and not image_url:
+        if not image_data and not image_url and image_bytes is None:
             ui.send_message('classification_error', {'error': 'No image data'})
             send_telemetry({
                 "status": "error",
-                "class_name": "",
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                "processing_time_ms": 0,
+                "confidence": confidence,
                 "input_type": "none",
                 "image_type": image_type,
-                "results_json": "[]",
             })
             return
 
+        spans = Spans()
         input_type = "upload"
-        if image_url and not image_data:
+        fetch_timings = {}
+        if image_url and not image_data and image_bytes is None:
             input_type = "url"
             try:
-                resp = requests.get(image_url, timeout=10)
-                resp.raise_for_status()
-                image_bytes = resp.content
+                with spans.span("fetch_ms"):
+                    fetched = fetch_image(image_url)
+                image_bytes = fetched.content
+                fetch_timings = timing_fields(fetched)
             except Exception as e:
                 ui.send_message('classification_error', {'error': f'Failed to fetch image_url: {e}'})
                 send_telemetry({
                     "status": "error",
-                    "class_name": "",
-                    "confidence": float(confidence) if confidence is not None else 0.0,
-                    "processing_time_ms": 0,
+                    "confidence": confidence,
                     "input_type": input_type,
                     "image_type": image_type,
-                    "results_json": "[]",
                 })
                 return
-        else:
-            image_bytes = base64.b64decode(image_data)
+        elif image_bytes is None:
+            with spans.span("decode_ms"):
+                image_bytes = base64.b64decode(image_data)
 
-        pil_image = Image.open(io.BytesIO(image_bytes))
+        # Decoded at roughly the model input size; decoded.to_original() maps boxes back
+        with spans.span("decode_ms"):
+            decoded = decode_image(image_bytes, INPUT_SIZE, reserve=charge)
+        pil_image = decoded.image
 
         start_time = time.time() * 1000
-        results = image_classification.classify(pil_image, image_type=image_type, confidence=confidence)
-        print("RAW RESULTS:", results)
+        with spans.span("infer_ms"):
+            results, cache_hit = DETECTIONS.detect(
+                DETECTIONS.key(image_bytes, INPUT_SIZE),
+                confidence,
+                lambda threshold: image_classification.classify(pil_image, image_type=image_type, confidence=threshold),
+            )
+        IOTC_LOG.debug("RAW RESULTS: %s", results)
         diff = time.time() * 1000 - start_time
 
         if results is None:
             ui.send_message('classification_error', {'error': 'No results returned'})
             send_telemetry({
                 "status": "error",
-                "class_name": "",
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                "processing_time_ms": int(diff),
+                "confidence": confidence,
+                "processing_time_ms": diff,
                 "input_type": input_type,
                 "image_type": image_type,
-                "results_json": "[]",
             })
             return
 
@@ -181,37 +196,75 @@ def on_classify_image(client_id, data):
             'results': results,
             'processing_time': f"{diff:.2f} ms"
         }
-        ui.send_message('classification_result', response)
+        with spans.span("send_ms"):
+            ui.send_message('classification_result', response)
 
-        class_name, top_conf = pick_top_result(results)
+        class_name, top_conf = parse_results(results).best()
+        top_conf = top_conf if top_conf is not None else confidence
+        relay_start = time.perf_counter()
         send_telemetry({
             "status": "ok",
+            "queue_ms": queue_ms(),
+            "queue_depth": INFERENCE.depth(),
+            "cache_hit": cache_hit,
+            **fetch_timings,
+            **spans.fields(),
             "class_name": class_name or "",
-            "confidence": float(top_conf) if top_conf is not None else float(confidence),
-            "processing_time_ms": int(diff),
+            "confidence": top_conf,
+            "processing_time_ms": diff,
             "input_type": input_type,
             "image_type": image_type,
-            "results_json": json.dumps(results),
+            "results_json": results,
             "top_class_name": class_name or "",
-            "top_confidence": float(top_conf) if top_conf is not None else float(confidence),
+            "top_confidence": top_conf,
         })
+        record(spans, relay_ms=(time.perf_counter() - relay_start) * 1000.0)
+        return response
 
+    except BusyError as e:
+        reject_busy(e, parse_data(data))
+        raise    # so the upload endpoint answers 503, not 422
     except Exception as e:
         print(f"on_classify_image error: {e}")
         print(traceback.format_exc())
         ui.send_message('classification_error', {'error': str(e)})
         send_telemetry({
             "status": "error",
-            "class_name": "",
-            "confidence": float(CURRENT_CONFIDENCE),
-            "processing_time_ms": 0,
+            "confidence": CURRENT_CONFIDENCE,
             "input_type": "error",
-            "image_type": "",
-            "results_json": "[]",
         })
 
 
+def reject_busy(e, parsed):
+    print(f"on_classify_image rejected: {e}")
+    ui.send_message('classification_error', {'error': 'busy', 'reason': e.reason, 'queue_depth': e.queue_depth})
+    send_telemetry({
+        "status": "busy",
+        "confidence": parsed.get('confidence', CURRENT_CONFIDENCE),
+        "input_type": "url" if parsed.get('image_url') and not parsed.get('image') else "upload",
+        "queue_depth": e.queue_depth,
+    })
+
+
+def on_classify_image(client_id, data):
+    # Runs on the WebUI / relay thread: admit or reject, never block.
+    parsed = parse_data(data)
+    try:
+        INFERENCE.submit(run_classify_image, client_id, parsed, cost_bytes=len(parsed.get('image') or ''))
+    except BusyError as e:
+        reject_busy(e, parsed)
+
+
+def send_startup():
+    send_telemetry({"status": "startup", **STARTUP.fields()}, key="startup")
+
+
+STARTUP.start(send_startup)
+
 ui = WebUI()
+instrument(ui)
 ui.on_message('classify_image', on_classify_image)
+ui.expose_api('POST', '/classify_image', upload_endpoint(INFERENCE, run_classify_image, reject_busy))
+ui.expose_api('GET', '/spans', span_summary)
 
 App.run()
@@ -6,17 +6,24 @@ from arduino.app_utils import *
 from arduino.app_bricks.keyword_spotting import KeywordSpotting
 import threading
 import time
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "keyword_spotting"
 UNOQ_DEMO_NAME = "keyword-spotting"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 WAIT_AFTER_DETECT_SEC = 4
 WAITING_TIMER = None
 LAST_DETECTED_TS = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
     client_id=RELAY_CLIENT_ID,
@@ -34,8 +41,8 @@ def send_telemetry(keyword, status="ok", state="", confidence=0.0, last_detected
         "confidence": float(confidence) if confidence is not None else 0.0,
         "last_detected_ts": int(last_detected_ts) if last_detected_ts else 0,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 def schedule_waiting():
     global WAITING_TIMER
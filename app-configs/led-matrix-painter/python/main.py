@@ -7,23 +7,33 @@ from arduino.app_utils import App, Bridge, FrameDesigner, Logger
 from app_frame import AppFrame
 import store
 import threading
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import instrument, start_digest
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "led_matrix_painter"
 UNOQ_DEMO_NAME = "led-matrix-painter"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 
 logger = Logger("led-matrix-painter")
 ui = WebUI()
+instrument(ui)
 designer = FrameDesigner()
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
     client_id=RELAY_CLIENT_ID,
 )
 relay.start()
+start_digest(relay, UNOQ_DEMO_NAME)
 
 
 def send_telemetry(action, frame=None, status="ok"):
@@ -35,8 +45,8 @@ def send_telemetry(action, frame=None, status="ok"):
         "frame_count": len(store.list_frames(order_by='position ASC, id ASC')) if hasattr(store, 'list_frames') else 0,
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 store.init_db()
 
@@ -8,16 +8,23 @@ import time
 import random
 import threading
 import json
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "mascot_jump_game"
 UNOQ_DEMO_NAME = "mascot-jump-game"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
     client_id=RELAY_CLIENT_ID,
@@ -182,8 +189,8 @@ def send_telemetry():
         "speed": float(game.speed),
         "status": "ok",
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 def get_led_state():
@@ -5,31 +5,63 @@
 from arduino.app_utils import *
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.object_detection import ObjectDetection
-from PIL import Image
-import io
 import base64
 import time
 import json
-import requests
 import shlex
 import traceback
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import DIGEST_FIELDS, instrument, start_digest
+from iotc_inference import BusyError, InferenceExecutor, charge, queue_ms
+from iotc_detection_cache import DetectionCache, to_confidence
+from iotc_fetch import FETCH_FIELDS, fetch_image, timing_fields
+from iotc_decode import decode_image, model_input_size
+from iotc_spans import SPAN_FIELDS, Spans, record, span_summary
+from iotc_result_image import ResultEncoder
+from iotc_upload import upload_endpoint
+from iotc_startup import STARTUP_FIELDS, Startup
+from iotc_batch import BATCH_FIELDS, BATCH_SUMMARY_FIELDS, BatchRunner, batch_fields
+from iotc_tiling import TILE_FIELDS, TiledDetector, tile_fields, wants_tiling
+from iotc_detections import parse_results
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "object_detection"
 UNOQ_DEMO_NAME = "object-detection"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+# Warm-up and relay connect run in the background; see iotc_startup
+STARTUP = Startup()
 DEFAULT_CONFIDENCE = 0.5
 CURRENT_CONFIDENCE = DEFAULT_CONFIDENCE
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh)
+TELEMETRY = load_encoder(
+    Path(__file__).with_name("iotc_config.json"),
+    defaults={"has_objects": "false", "detections_json": "[]"},
+    optional=DIGEST_FIELDS + FETCH_FIELDS + BATCH_FIELDS + BATCH_SUMMARY_FIELDS + SPAN_FIELDS + STARTUP_FIELDS + TILE_FIELDS,
+)
+
 object_detection = ObjectDetection()
+INPUT_SIZE = model_input_size(object_detection)
+STARTUP.warm_up(lambda image: object_detection.detect(image), INPUT_SIZE)
+INFERENCE = InferenceExecutor()
+DETECTIONS = DetectionCache()
+TILER = TiledDetector(object_detection.detect, INPUT_SIZE)
+RESULTS = ResultEncoder()
 
 
 def on_relay_command(command_name, parameters):
     global CURRENT_CONFIDENCE
     param_type = type(parameters).__name__
-    print(f"IOTCONNECT command: {command_name} ({param_type}) {repr(parameters)}")
+    shown = repr(parameters)
+    if len(shown) > 200:
+        # detect-objects-batch carries base64 images; do not dump them into the log
+        shown = f"{shown[:200]}... ({len(shown)} chars)"
+    print(f"IOTCONNECT command: {command_name} ({param_type}) {shown}")
     if command_name == "set-confidence":
         try:
             if isinstance(parameters, dict):
@@ -40,6 +72,30 @@ def on_relay_command(command_name, parameters):
             print(f"IOTCONNECT confidence set to {CURRENT_CONFIDENCE}")
         except Exception as e:
             print(f"IOTCONNECT confidence update failed: {e}")
+    elif command_name == "set-result-format":
+        try:
+            settings = RESULTS.update_from_command(parameters)
+            print(f"IOTCONNECT result format set to {settings.as_dict()}")
+        except Exception as e:
+            print(f"IOTCONNECT result format update failed: {e}")
+    elif command_name == "detect-objects-batch":
+        try:
+            payload = parameters if parameters is not None else {}
+            if isinstance(payload, str):
+                raw = payload.strip()
+                if raw.startswith("{") and raw.endswith("}"):
+                    payload = json.loads(raw)
+                else:
+                    # "url1 url2 ... [confidence]"
+                    tokens = shlex.split(raw)
+                    payload = {"image_urls": [t for t in tokens if "://" in t]}
+                    rest = [t for t in tokens if "://" not in t]
+                    if rest:
+                        payload["confidence"] = float(rest[0])
+            batch_id = BATCH.start("iotc", payload)
+            print(f"IOTCONNECT detect-objects-batch started: {batch_id}")
+        except Exception as e:
+            print(f"IOTCONNECT detect-objects-batch failed: {e}")
     elif command_name == "detect-objects":
         try:
             payload = parameters if parameters is not None else {}
@@ -74,14 +130,14 @@ relay = IoTConnectRelayClient(
     client_id=RELAY_CLIENT_ID,
     command_callback=on_relay_command
 )
-relay.start()
+STARTUP.start_relay(relay)
+start_digest(relay, UNOQ_DEMO_NAME)
 
 
-def send_telemetry(payload):
+def send_telemetry(payload, key="telemetry"):
     payload.setdefault("UnoQdemo", UNOQ_DEMO_NAME)
-    print("IOTCONNECT send:", payload)
-    ok = relay.send_telemetry(payload)
-    print("IOTCONNECT send result:", ok)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok, key=key)
     return ok
 
 
@@ -94,181 +150,194 @@ def parse_data(data):
     return data if isinstance(data, dict) else {}
 
 
-def normalize_results(results):
-    detections = []
-    if results is None:
-        return detections
-
-    if isinstance(results, dict) and isinstance(results.get('detection'), list):
-        results_list = results.get('detection')
-    elif isinstance(results, list):
-        results_list = results
-    else:
-        results_list = []
-
-    for r in results_list:
-        if not isinstance(r, dict):
-            continue
-        conf = r.get('confidence', r.get('score', r.get('prob', r.get('p'))))
-        bbox = r.get('bbox')
-        bbox_xyxy = r.get('bounding_box_xyxy')
-        det = {}
-        if conf is not None:
-            det['confidence'] = float(conf)
-        if isinstance(bbox_xyxy, (list, tuple)) and len(bbox_xyxy) >= 4:
-            x1, y1, x2, y2 = bbox_xyxy[0], bbox_xyxy[1], bbox_xyxy[2], bbox_xyxy[3]
-            det['x'] = x1
-            det['y'] = y1
-            det['w'] = max(0.0, x2 - x1)
-            det['h'] = max(0.0, y2 - y1)
-        elif isinstance(bbox, (list, tuple)) and len(bbox) >= 4:
-            det['x'], det['y'], det['w'], det['h'] = bbox[0], bbox[1], bbox[2], bbox[3]
-        else:
-            for k in ('x', 'y', 'w', 'h'):
-                if k in r:
-                    det[k] = r.get(k)
-        if 'class_name' in r:
-            det['class_name'] = r.get('class_name')
-        detections.append(det)
-    return detections
-
-
-def on_detect_objects(client_id, data):
+def run_detect_objects(client_id, data):
     try:
+        # Requests that arrive during startup wait for the warm-up instead of racing it
+        STARTUP.wait()
         parsed = parse_data(data)
         image_data = parsed.get('image')
         image_url = parsed.get('image_url')
-        confidence = parsed.get('confidence', CURRENT_CONFIDENCE)
-        if not image_data and not image_url:
+        image_bytes = parsed.get('image_bytes')    # from the binary upload endpoint
+        confidence = to_confidence(parsed.get('confidence'), CURRENT_CONFIDENCE)
+        if not image_data and not image_url and image_bytes is None:
             ui.send_message('detection_error', {'error': 'No image data'})
             send_telemetry({
                 "status": "error",
-                "detection_count": 0,
-                "processing_time_ms": 0,
-                "has_objects": "false",
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                "max_confidence": 0.0,
-                "avg_confidence": 0.0,
-                "detections_json": "[]",
+                "confidence": confidence,
                 "input_type": "none",
             })
             return
 
+        spans = Spans()
         input_type = "upload"
-        if image_url and not image_data:
+        fetch_timings = {}
+        if image_url and not image_data and image_bytes is None:
             input_type = "url"
             try:
-                resp = requests.get(image_url, timeout=10)
-                resp.raise_for_status()
-                image_bytes = resp.content
+                with spans.span("fetch_ms"):
+                    fetched = fetch_image(image_url)
+                image_bytes = fetched.content
+                fetch_timings = timing_fields(fetched)
             except Exception as e:
                 ui.send_message('detection_error', {'error': f'Failed to fetch image_url: {e}'})
                 send_telemetry({
                     "status": "error",
-                    "detection_count": 0,
-                    "processing_time_ms": 0,
-                    "has_objects": "false",
-                    "confidence": float(confidence) if confidence is not None else 0.0,
-                    "max_confidence": 0.0,
-                    "avg_confidence": 0.0,
-                    "detections_json": "[]",
+                    "confidence": confidence,
                     "input_type": input_type,
+                    **batch_fields(parsed),
                 })
                 return
-        else:
-            image_bytes = base64.b64decode(image_data)
+        elif image_bytes is None:
+            with spans.span("decode_ms"):
+                image_bytes = base64.b64decode(image_data)
 
-        pil_image = Image.open(io.BytesIO(image_bytes))
+        # Decoded at roughly the model input size (full size when tiling);
+        # decoded.to_original() maps boxes back
+        tiled, tile_compare = wants_tiling(parsed)
+        with spans.span("decode_ms"):
+            decoded = decode_image(image_bytes, None if tiled else INPUT_SIZE, reserve=charge)
+        pil_image = decoded.image
 
         start_time = time.time() * 1000
-        results = object_detection.detect(pil_image, confidence=confidence)
-        print("RAW RESULTS:", results)
+        tile_info = {}
+
+        def detect_tiled(threshold):
+            tiled_results, info = TILER.detect(pil_image, confidence=threshold)
+            tile_info.update(info)
+            return tiled_results
+
+        with spans.span("infer_ms"):
+            if tile_compare:
+                results, tile_info = TILER.compare(pil_image, confidence=confidence)
+                cache_hit = False
+            elif tiled:
+                results, cache_hit = DETECTIONS.detect(DETECTIONS.key(image_bytes, "tiled"), confidence, detect_tiled)
+            else:
+                results, cache_hit = DETECTIONS.detect(
+                    DETECTIONS.key(image_bytes, INPUT_SIZE),
+                    confidence,
+                    lambda threshold: object_detection.detect(pil_image, confidence=threshold),
+                )
+        IOTC_LOG.debug("RAW RESULTS: %s", results)
         diff = time.time() * 1000 - start_time
 
         if results is None:
             ui.send_message('detection_error', {'error': 'No results returned'})
             send_telemetry({
                 "status": "error",
-                "detection_count": 0,
-                "processing_time_ms": int(diff),
-                "has_objects": "false",
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                "max_confidence": 0.0,
-                "avg_confidence": 0.0,
-                "detections_json": "[]",
+                "processing_time_ms": diff,
+                "confidence": confidence,
                 "input_type": input_type,
             })
             return
 
-        img_with_boxes = object_detection.draw_bounding_boxes(pil_image, results)
-
-        if img_with_boxes is not None:
-            img_buffer = io.BytesIO()
-            img_with_boxes.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            b64_result = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
-        else:
-            # If drawing fails, send back the original image
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            b64_result = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
-
-        detections = normalize_results(results)
-        confs = [d.get("confidence") for d in detections if isinstance(d.get("confidence"), (int, float))]
-        max_conf = max(confs) if confs else 0.0
-        avg_conf = (sum(confs) / len(confs)) if confs else 0.0
-
-        # build top-4 discrete fields for dashboards
-        top = sorted(detections, key=lambda d: d.get("confidence", 0), reverse=True)[:4]
-        slots = {}
-        for i in range(4):
-            if i < len(top):
-                slots[f"class_name_{i+1}"] = top[i].get("class_name", "")
-                slots[f"confidence_{i+1}"] = float(top[i].get("confidence", 0))
-            else:
-                slots[f"class_name_{i+1}"] = ""
-                slots[f"confidence_{i+1}"] = 0.0
+        dets = parse_results(decoded.to_original(results))
+        detections = dets.items
+        settings = RESULTS.settings_for(parsed)
+        img_with_boxes = None
+        if not settings.boxes_only:
+            with spans.span("draw_ms"):
+                img_with_boxes = object_detection.draw_bounding_boxes(pil_image, results)
+            if img_with_boxes is None:
+                # If drawing fails, send back the original image
+                img_with_boxes = pil_image
+        encoded = RESULTS.encode(img_with_boxes, settings, detections, decoded.original_size)
+        spans.add("encode_ms", encoded.encode_ms)
 
         response = {
             'success': True,
-            'result_image': b64_result,
+            **encoded.message,
             'detection_count': len(detections),
+            'classes': dets.per_class(),
             'processing_time': f"{diff:.2f} ms"
         }
-        ui.send_message('detection_result', response)
+        with spans.span("send_ms"):
+            ui.send_message('detection_result', response)
 
+        relay_start = time.perf_counter()
         send_telemetry({
             "status": "ok",
-            "detection_count": len(detections),
-            "processing_time_ms": int(diff),
-            "has_objects": "true" if (detections and len(detections) > 0) else "false",
-            "confidence": float(confidence) if confidence is not None else 0.0,
-            "max_confidence": float(max_conf),
-            "avg_confidence": float(avg_conf),
-            "detections_json": json.dumps(detections),
+            "queue_ms": queue_ms(),
+            "queue_depth": INFERENCE.depth(),
+            "cache_hit": cache_hit,
+            **fetch_timings,
+            **spans.fields(),
+            **tile_fields(tile_info),
+            "result_bytes": encoded.result_bytes,
+            **dets.stats(),
+            "processing_time_ms": diff,
+            "has_objects": bool(detections),
+            "confidence": confidence,
+            "detections_json": detections,
             "input_type": input_type,
-            **slots,
+            **batch_fields(parsed),
+            # top-4 discrete fields for dashboards
+            **dets.slots(),
         })
+        record(spans, relay_ms=(time.perf_counter() - relay_start) * 1000.0)
+        return response
 
+    except BusyError as e:
+        reject_busy(e, parse_data(data))
+        raise    # so the upload endpoint answers 503, not 422
     except Exception as e:
         print(f"on_detect_objects error: {e}")
         print(traceback.format_exc())
         ui.send_message('detection_error', {'error': str(e)})
         send_telemetry({
             "status": "error",
-            "detection_count": 0,
-            "processing_time_ms": 0,
-            "has_objects": "false",
-            "confidence": float(CURRENT_CONFIDENCE),
-            "max_confidence": 0.0,
-            "avg_confidence": 0.0,
-            "detections_json": "[]",
+            "confidence": CURRENT_CONFIDENCE,
             "input_type": "error",
         })
 
 
+def reject_busy(e, parsed):
+    print(f"on_detect_objects rejected: {e}")
+    ui.send_message('detection_error', {'error': 'busy', 'reason': e.reason, 'queue_depth': e.queue_depth})
+    send_telemetry({
+        "status": "busy",
+        "confidence": parsed.get('confidence', CURRENT_CONFIDENCE),
+        "input_type": "url" if parsed.get('image_url') and not parsed.get('image') else "upload",
+        "queue_depth": e.queue_depth,
+    })
+
+
+def on_detect_objects(client_id, data):
+    # Runs on the WebUI / relay thread: admit or reject, never block.
+    parsed = parse_data(data)
+    try:
+        INFERENCE.submit(run_detect_objects, client_id, parsed, cost_bytes=len(parsed.get('image') or ''))
+    except BusyError as e:
+        reject_busy(e, parsed)
+
+
+def send_batch_summary(summary):
+    ui.send_message('batch_result', summary)
+    send_telemetry({"status": "batch", **summary}, key="batch")
+
+
+def on_detect_objects_batch(client_id, data):
+    try:
+        batch_id = BATCH.start(client_id, parse_data(data))
+        ui.send_message('batch_started', {'batch_id': batch_id})
+    except ValueError as e:
+        ui.send_message('detection_error', {'error': str(e)})
+
+
+BATCH = BatchRunner(INFERENCE, run_detect_objects, send_batch_summary)
+
+
+def send_startup():
+    send_telemetry({"status": "startup", **STARTUP.fields()}, key="startup")
+
+
+STARTUP.start(send_startup)
+
 ui = WebUI()
+instrument(ui)
 ui.on_message('detect_objects', on_detect_objects)
+ui.on_message('detect_objects_batch', on_detect_objects_batch)
+ui.expose_api('POST', '/detect_objects', upload_endpoint(INFERENCE, run_detect_objects, reject_busy))
+ui.expose_api('GET', '/spans', span_summary)
 
 App.run()
@@ -5,20 +5,29 @@
 from arduino.app_utils import App
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.video_objectdetection import VideoObjectDetection
-from datetime import datetime, UTC
 import time
 import json
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import instrument
+from iotc_ui_stream import UIStream
+from iotc_detections import from_scores
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "object_hunting"
 UNOQ_DEMO_NAME = "object-hunting"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 CURRENT_CONFIDENCE = 0.5
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
     client_id=RELAY_CLIENT_ID,
@@ -54,58 +63,37 @@ def on_relay_command(command_name, parameters):
 relay.command_callback = on_relay_command
 
 ui = WebUI()
+instrument(ui)
+# One coalesced, rate-capped UI message set per frame; see iotc_ui_stream
+STREAM = UIStream(ui)
+ui.on_connect(STREAM.on_connect)
 detection_stream = VideoObjectDetection(confidence=CURRENT_CONFIDENCE)
 
 ui.on_message("override_th", lambda sid, threshold: detection_stream.override_threshold(threshold))
 
 
-def build_slots(detections):
-    top = sorted(detections, key=lambda d: d.get("confidence", 0), reverse=True)[:4]
-    slots = {}
-    for i in range(4):
-        if i < len(top):
-            slots[f"class_name_{i+1}"] = top[i].get("class_name", "")
-            slots[f"confidence_{i+1}"] = float(top[i].get("confidence", 0))
-        else:
-            slots[f"class_name_{i+1}"] = ""
-            slots[f"confidence_{i+1}"] = 0.0
-    return slots
-
-
 def send_telemetry(detections):
     global IOTC_LAST_SEND
     now = time.time()
     if now - IOTC_LAST_SEND < IOTC_INTERVAL_SEC:
         return
     IOTC_LAST_SEND = now
-    confs = [d.get("confidence") for d in detections if isinstance(d.get("confidence"), (int, float))]
-    max_conf = max(confs) if confs else 0.0
-    avg_conf = (sum(confs) / len(confs)) if confs else 0.0
     payload = {
         "UnoQdemo": UNOQ_DEMO_NAME,
         "interval_sec": int(IOTC_INTERVAL_SEC),
-        "detection_count": len(detections),
-        "max_confidence": float(max_conf),
-        "avg_confidence": float(avg_conf),
-        "detections_json": json.dumps(detections),
+        **detections.stats(),
+        "detections_json": json.dumps(detections.items),
         "status": "ok",
     }
-    payload.update(build_slots(detections))
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    payload.update(detections.slots())
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 def send_detections_to_ui(detections: dict):
-    det_list = []
-    for key, value in detections.items():
-        entry = {
-            "content": key,
-            "timestamp": datetime.now(UTC).isoformat()
-        }
-        ui.send_message("detection", message=entry)
-        det_list.append({"class_name": key, "confidence": float(value.get("confidence", 0))})
-
-    send_telemetry(det_list)
+    dets = from_scores(detections)
+    STREAM.publish(dets)
+    send_telemetry(dets)
 
 
 detection_stream.on_detect_all(send_detections_to_ui)
@@ -7,17 +7,25 @@ from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.motion_detection import MotionDetection
 import pandas as pd
 from collections import deque
+from pathlib import Path
 import time
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "real_time_accel"
 UNOQ_DEMO_NAME = "real-time-accelerometer"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 2
 IOTC_LAST_SEND = 0.0
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+# fill_defaults=False so frames without a sample do not report x/y/z as 0.
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 # Instantiate the MotionDetection brick with a confidence threshold
 CONFIDENCE = 0.4
 motion_detection = MotionDetection(confidence=CONFIDENCE)
@@ -68,19 +76,19 @@ def send_telemetry(classification, sample=None):
     IOTC_LAST_SEND = now
     payload = {
         "UnoQdemo": UNOQ_DEMO_NAME,
-        "interval_sec": int(IOTC_INTERVAL_SEC),
-        "idle": float(classification.get('idle', 0.0)),
-        "snake": float(classification.get('snake', 0.0)),
-        "updown": float(classification.get('updown', 0.0)),
-        "wave": float(classification.get('wave', 0.0)),
+        "interval_sec": IOTC_INTERVAL_SEC,
+        "idle": classification.get('idle', 0.0),
+        "snake": classification.get('snake', 0.0),
+        "updown": classification.get('updown', 0.0),
+        "wave": classification.get('wave', 0.0),
         "status": "ok",
     }
     if sample:
-        payload["x"] = float(sample.get("x", 0))
-        payload["y"] = float(sample.get("y", 0))
-        payload["z"] = float(sample.get("z", 0))
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+        payload["x"] = sample.get("x", 0)
+        payload["y"] = sample.get("y", 0)
+        payload["z"] = sample.get("z", 0)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 # Expose a simple HTTP API to fetch the latest detection
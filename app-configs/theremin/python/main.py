@@ -5,13 +5,22 @@
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.wave_generator import WaveGenerator
 from arduino.app_utils import App, Logger
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import configure, get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "theremin"
 UNOQ_DEMO_NAME = "theremin"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+# "move" frames are sent for every pointer event; log 1 in 20 of them
+configure(sample={"move": 20})
+
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
 
 logger = Logger("theremin")
 
@@ -50,8 +59,8 @@ def send_telemetry(freq, amp, volume, status="ok"):
         "volume": int(volume),
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok, key=status)
 
 
 def on_connect(sid, data=None):
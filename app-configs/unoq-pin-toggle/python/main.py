@@ -6,13 +6,17 @@ import json, ast
 from datetime import datetime, UTC
 from arduino.app_utils import *
 from arduino.app_bricks.web_ui import WebUI
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "unoq_pin_toggle"
 UNOQ_DEMO_NAME = "unoq-pin-toggle"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 
 relay = IoTConnectRelayClient(
     RELAY_ENDPOINT,
@@ -20,6 +24,9 @@ relay = IoTConnectRelayClient(
 )
 relay.start()
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
 # ---------- Pin config: add pins here ----------
 PIN_CONFIG = {
     # JDIGITAL
@@ -108,8 +115,8 @@ def send_telemetry(name, logical_state, status="ok"):
         "pin_state": "on" if logical_state else "off",
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
 def on_relay_command(command_name, parameters):
@@ -7,13 +7,22 @@ from datetime import datetime
 from arduino.app_utils import *
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.vibration_anomaly_detection import VibrationAnomalyDetection
+from pathlib import Path
 
 # ---- IOTCONNECT Relay ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import configure, get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "vibration_anomaly"
 UNOQ_DEMO_NAME = "vibration-anomaly-detection"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+# "sample" frames are sent for every accelerometer reading; log 1 in 50 of them
+configure(sample={"sample": 50})
+
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
 
 logger = Logger("vibration-detector")
 
@@ -33,8 +42,8 @@ def send_telemetry(score, detected, x, y, z, status="ok"):
         "z": float(z),
         "status": status,
     }
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok, key=status)
 
 
 relay = IoTConnectRelayClient(
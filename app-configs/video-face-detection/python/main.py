@@ -5,26 +5,40 @@
 from arduino.app_utils import App
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.video_objectdetection import VideoObjectDetection
-from datetime import datetime, UTC
 import time
 import json
 import threading
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import instrument
+from iotc_ui_stream import UIStream
+from iotc_tracker import Tracker
+from iotc_windows import RollingWindows
+from iotc_governor import RateGovernor
+from iotc_detections import from_scores
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "video_face_detection"
 UNOQ_DEMO_NAME = "video-face-detection"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
 
 
 AUTO_MODE = True
 MANUAL_TRIGGER = False
 IOTC_INTERVAL_SEC = 5
+# With no track events, auto mode only sends this often
+IOTC_HEARTBEAT_SEC = 60
 IOTC_LAST_SEND = 0.0
 CURRENT_CONFIDENCE = 0.5
 LAST_DETECTION_TS = 0.0
-LAST_STATE = "none"
+LAST_DETS = from_scores({})
 
 
 def set_auto(val):
@@ -38,6 +52,8 @@ def should_send():
         now = time.time()
         if now - IOTC_LAST_SEND < IOTC_INTERVAL_SEC:
             return False
+        if now - IOTC_LAST_SEND < IOTC_HEARTBEAT_SEC and not TRACKER.changed():
+            return False
         IOTC_LAST_SEND = now
         return True
     if MANUAL_TRIGGER:
@@ -46,36 +62,32 @@ def should_send():
     return False
 
 
-def build_slots(detections):
-    top = sorted(detections, key=lambda d: d.get("confidence", 0), reverse=True)[:4]
-    slots = {}
-    for i in range(4):
-        if i < len(top):
-            slots[f"class_name_{i+1}"] = top[i].get("class_name", "")
-            slots[f"confidence_{i+1}"] = float(top[i].get("confidence", 0))
-        else:
-            slots[f"class_name_{i+1}"] = ""
-            slots[f"confidence_{i+1}"] = 0.0
-    return slots
-
-
-def send_no_detection_telemetry():
+def send_interval_telemetry(dets):
+    # dets is the latest frame; the window fields cover everything since
     payload = {
         "UnoQdemo": UNOQ_DEMO_NAME,
         "auto_mode": "auto" if AUTO_MODE else "manual",
         "interval_sec": int(IOTC_INTERVAL_SEC),
-        "detection_count": 0,
-        "max_confidence": 0.0,
-        "avg_confidence": 0.0,
-        "detections_json": "[]",
+        **dets.stats(),
+        "detections_json": json.dumps(dets.items),
         "status": "ok",
     }
-    payload.update(build_slots([]))
-    print("IOTCONNECT send:", payload)
-    relay.send_telemetry(payload)
+    payload.update(dets.slots())
+    payload.update(TRACKER.fields())
+    payload.update(WINDOWS.fields())
+    payload.update(GOVERNOR.fields())
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
 
 
+TRACKER = Tracker()
+WINDOWS = RollingWindows()
+GOVERNOR = RateGovernor()
 ui = WebUI()
+instrument(ui)
+# One UI message set per admitted frame, sent inline: GOVERNOR is the only rate limit
+STREAM = UIStream(ui, fps=0)
+ui.on_connect(STREAM.on_connect)
 detection_stream = VideoObjectDetection(confidence=CURRENT_CONFIDENCE, debounce_sec=0.0)
 
 
@@ -128,57 +140,35 @@ ui.on_message("override_th", lambda sid, threshold: detection_stream.override_th
 
 # Register a callback for when all objects are detected
 def send_detections_to_ui(detections: dict):
-    global LAST_DETECTION_TS, LAST_STATE
+    global LAST_DETECTION_TS, LAST_DETS
+    dets = from_scores(detections)
     LAST_DETECTION_TS = time.time()
-    LAST_STATE = "detections"
-    for key, value in detections.items():
-        entry = {
-            "content": key,
-            "confidence": value.get("confidence"),
-            "timestamp": datetime.now(UTC).isoformat()
-        }
-        ui.send_message("detection", message=entry)
-
-    # IOTCONNECT telemetry
-    if should_send():
-        det_list = []
-        for key, value in detections.items():
-            det_list.append({"class_name": key, "confidence": float(value.get("confidence", 0))})
-        confs = [d.get("confidence") for d in det_list]
-        max_conf = max(confs) if confs else 0.0
-        avg_conf = (sum(confs) / len(confs)) if confs else 0.0
-        payload = {
-            "UnoQdemo": UNOQ_DEMO_NAME,
-            "auto_mode": "auto" if AUTO_MODE else "manual",
-            "interval_sec": int(IOTC_INTERVAL_SEC),
-            "detection_count": len(det_list),
-            "max_confidence": float(max_conf),
-            "avg_confidence": float(avg_conf),
-            "detections_json": json.dumps(det_list),
-            "status": "ok",
-        }
-        payload.update(build_slots(det_list))
-        print("IOTCONNECT send:", payload)
-        relay.send_telemetry(payload)
-
-
-def no_detection_watchdog():
-    global LAST_STATE
+    LAST_DETS = dets
+    # Tracks and windows see every frame; the governor only limits UI and telemetry work
+    TRACKER.update(detections)
+    WINDOWS.update(dets)
+    if not GOVERNOR.admit():
+        return
+    STREAM.publish(dets)
+
+    # IOTCONNECT telemetry: a manual run-detect goes out with the next frame,
+    # auto mode is sent by interval_telemetry_loop
+    if not AUTO_MODE and should_send():
+        send_interval_telemetry(dets)
+
+
+def interval_telemetry_loop():
+    # The brick stops calling back when nothing is detected, so auto mode runs
+    # on its own clock; an empty scene is reported with the windows at zero.
     while True:
-        time.sleep(0.5)
-        if not AUTO_MODE:
-            continue
-        if LAST_STATE != "detections":
-            continue
-        if (time.time() - LAST_DETECTION_TS) < IOTC_INTERVAL_SEC:
-            continue
-        if not should_send():
+        time.sleep(IOTC_INTERVAL_SEC)
+        if not AUTO_MODE or not should_send():
             continue
-        LAST_STATE = "none"
-        send_no_detection_telemetry()
+        recent = time.time() - LAST_DETECTION_TS < IOTC_INTERVAL_SEC
+        send_interval_telemetry(LAST_DETS if recent else from_scores({}))
 
 
 detection_stream.on_detect_all(send_detections_to_ui)
-threading.Thread(target=no_detection_watchdog, daemon=True).start()
+threading.Thread(target=interval_telemetry_loop, name="iotc-interval", daemon=True).start()
 
 App.run()
@@ -5,16 +5,28 @@
 from arduino.app_utils import App
 from arduino.app_bricks.web_ui import WebUI
 from arduino.app_bricks.video_imageclassification import VideoImageClassification
-from datetime import datetime, UTC
 import json
 import time
+import threading
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
+from iotc_profiling import instrument
+from iotc_ui_stream import UIStream
+from iotc_windows import RollingWindows
+from iotc_governor import RateGovernor
+from iotc_detections import from_scores
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "video_person_classification"
 UNOQ_DEMO_NAME = "video-person-classification"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
+
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
 
 
 AUTO_MODE = True
@@ -22,6 +34,8 @@ MANUAL_TRIGGER = False
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 CURRENT_CONFIDENCE = 0.5
+LAST_DETECTION_TS = 0.0
+LAST_DETS = from_scores({})
 
 
 def set_auto(val):
@@ -43,20 +57,30 @@ def should_send():
     return False
 
 
-def build_slots(detections):
-    top = sorted(detections, key=lambda d: d.get("confidence", 0), reverse=True)[:4]
-    slots = {}
-    for i in range(4):
-        if i < len(top):
-            slots[f"class_name_{i+1}"] = top[i].get("class_name", "")
-            slots[f"confidence_{i+1}"] = float(top[i].get("confidence", 0))
-        else:
-            slots[f"class_name_{i+1}"] = ""
-            slots[f"confidence_{i+1}"] = 0.0
-    return slots
-
-
+def send_interval_telemetry(dets):
+    # dets is the latest frame; the window fields cover everything since
+    payload = {
+        "UnoQdemo": UNOQ_DEMO_NAME,
+        "auto_mode": "auto" if AUTO_MODE else "manual",
+        "interval_sec": int(IOTC_INTERVAL_SEC),
+        **dets.stats(),
+        "detections_json": json.dumps(dets.items),
+        "status": "ok",
+    }
+    payload.update(dets.slots())
+    payload.update(WINDOWS.fields())
+    payload.update(GOVERNOR.fields())
+    ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+    log_telemetry(IOTC_LOG, payload, ok)
+
+
+WINDOWS = RollingWindows()
+GOVERNOR = RateGovernor()
 ui = WebUI()
+instrument(ui)
+# One UI message set per admitted frame, sent inline: GOVERNOR is the only rate limit
+STREAM = UIStream(ui, fps=0, legacy="classifications")
+ui.on_connect(STREAM.on_connect)
 detection_stream = VideoImageClassification(confidence=CURRENT_CONFIDENCE, debounce_sec=0.0)
 
 
@@ -109,45 +133,38 @@ ui.on_message("override_th", lambda sid, threshold: detection_stream.override_th
 
 # Register a callback for when all objects are detected
 def send_detections_to_ui(classifications: dict):
+    global LAST_DETECTION_TS, LAST_DETS
+    dets = from_scores(classifications)
+    # Empty frames still count towards the windows' active ratio, and the
+    # windows see every frame; the governor only limits UI and telemetry work
+    WINDOWS.update(dets)
     if len(classifications) == 0:
         return
+    LAST_DETECTION_TS = time.time()
+    LAST_DETS = dets
+    if not GOVERNOR.admit():
+        return
+
+    STREAM.publish(dets)
+
+    # IOTCONNECT telemetry: a manual run-detect goes out with the next frame,
+    # auto mode is sent by interval_telemetry_loop
+    if not AUTO_MODE and should_send():
+        send_interval_telemetry(dets)
+
 
-    entries = []
-    for key, value in classifications.items():
-        entry = {
-            "content": key,
-            "confidence": value,
-            "timestamp": datetime.now(UTC).isoformat()
-        }
-        entries.append(entry)
-
-    if len(entries) > 0:
-        msg = json.dumps(entries)
-        ui.send_message("classifications", message=msg)
-
-    # IOTCONNECT telemetry
-    if should_send():
-        det_list = []
-        for key, value in classifications.items():
-            det_list.append({"class_name": key, "confidence": float(value)})
-        confs = [d.get("confidence") for d in det_list]
-        max_conf = max(confs) if confs else 0.0
-        avg_conf = (sum(confs) / len(confs)) if confs else 0.0
-        payload = {
-            "UnoQdemo": UNOQ_DEMO_NAME,
-            "auto_mode": "auto" if AUTO_MODE else "manual",
-            "interval_sec": int(IOTC_INTERVAL_SEC),
-            "detection_count": len(det_list),
-            "max_confidence": float(max_conf),
-            "avg_confidence": float(avg_conf),
-            "detections_json": json.dumps(det_list),
-            "status": "ok",
-        }
-        payload.update(build_slots(det_list))
-        print("IOTCONNECT send:", payload)
-        relay.send_telemetry(payload)
+def interval_telemetry_loop():
+    # The brick stops calling back when nothing is detected, so auto mode runs
+    # on its own clock; a quiet scene is reported with the windows at zero.
+    while True:
+        time.sleep(IOTC_INTERVAL_SEC)
+        if not AUTO_MODE or not should_send():
+            continue
+        recent = time.time() - LAST_DETECTION_TS < IOTC_INTERVAL_SEC
+        send_interval_telemetry(LAST_DETS if recent else from_scores({}))
 
 
 detection_stream.on_detect_all(send_detections_to_ui)
+threading.Thread(target=interval_telemetry_loop, name="iotc-interval", daemon=True).start()
 
 App.run()
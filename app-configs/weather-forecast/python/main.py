@@ -5,17 +5,25 @@
 from arduino.app_bricks.weather_forecast import WeatherForecast
 from arduino.app_utils import *
 import time
+from pathlib import Path
 
 # ---- IOTCONNECT Relay (App Lab TCP bridge) ----
 from iotc_relay_client import IoTConnectRelayClient
+from iotc_log import get_logger, log_telemetry
+from iotc_telemetry_schema import load_encoder
 
 RELAY_ENDPOINT = "tcp://172.17.0.1:8899"
 RELAY_CLIENT_ID = "weather_forecast"
 UNOQ_DEMO_NAME = "weather-forecast"
+IOTC_LOG = get_logger(UNOQ_DEMO_NAME)
 IOTC_INTERVAL_SEC = 5
 IOTC_LAST_SEND = 0.0
 CITY_OVERRIDE = None
 
+# Compiled from config.json (copied in as iotc_config.json by unoq_patch_app.sh).
+TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"), fill_defaults=False)
+
+
 def on_relay_command(command_name, parameters):
     global IOTC_INTERVAL_SEC, CITY_OVERRIDE
     print(f"IOTCONNECT command: {command_name} {parameters}")
@@ -63,9 +71,8 @@ def get_weather_forecast(city: str) -> str:
     }
     now = time.time()
     if now - IOTC_LAST_SEND >= IOTC_INTERVAL_SEC:
-        print("IOTCONNECT send:", payload)
-        ok = relay.send_telemetry(payload)
-        print("IOTCONNECT send result:", ok)
+        ok = relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+        log_telemetry(IOTC_LOG, payload, ok)
         globals()["IOTC_LAST_SEND"] = now
 
     return forecast.category
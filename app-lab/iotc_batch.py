@@ -0,0 +1,223 @@
+"""Batch detection: many images or URLs per request, run as a pipeline.
+
+A batch is a list of items, each an image_url or a base64 image. BatchRunner
+runs one batch at a time on its own thread:
+
+1. fetch: URLs are downloaded by IOTC_BATCH_FETCHERS threads (default 4),
+   base64 items are decoded, concurrently with step 2 and at most
+   2 x fetchers images ahead of it,
+2. detect: each item is submitted to the app's InferenceExecutor as soon as
+   its bytes are ready (blocking submit, so the batch waits for room instead
+   of being rejected). At most queue size - 1 items of a batch are queued or
+   running at once, so a single request always finds a free queue slot
+   instead of a BusyError.
+
+Each item goes through the app's normal run function, so it produces its usual
+UI message and telemetry frame, tagged with batch_id / batch_index. When all
+items are done the summary goes to on_summary(): counts, wall time, images per
+second and mean per-stage times (fetch_ms, detect_ms = queue + decode +
+inference + encode).
+
+A URL that fails to download is handed to the run function without bytes,
+which retries it once and reports the error as it does for single requests.
+An image that is not valid base64 is handed over without bytes too, so it
+counts as an error instead of aborting the batch. If a batch aborts anyway,
+its pending downloads are cancelled so the next batch still runs.
+
+Batches are capped at IOTC_BATCH_MAX_ITEMS (default 50).
+
+Usage in an app:
+    from iotc_batch import BATCH_FIELDS, BATCH_SUMMARY_FIELDS, BatchRunner, batch_fields
+    BATCH = BatchRunner(INFERENCE, run_detect_objects, send_batch_summary)
+    BATCH.start("iotc", {"image_urls": [...], "confidence": 0.4})
+    # in run_detect_objects' telemetry: **batch_fields(parsed)
+    # load_encoder(..., optional=BATCH_FIELDS + BATCH_SUMMARY_FIELDS)
+"""
+
+import base64
+import binascii
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from iotc_fetch import fetch_image
+from iotc_profiling import register_source
+
+# Per-item tags; pass as load_encoder(optional=...) so single requests do not carry them
+BATCH_FIELDS = ("batch_id", "batch_index")
+# Only in the summary frame; also optional, so item frames are not padded with zeros
+BATCH_SUMMARY_FIELDS = ("batch_items", "batch_ok", "batch_errors", "batch_elapsed_ms",
+                        "batch_images_per_sec", "batch_fetch_ms", "batch_detect_ms")
+
+
+def batch_fields(parsed):
+    """batch_id / batch_index telemetry for an item of a batch ({} otherwise)."""
+    return {k: parsed[k] for k in BATCH_FIELDS if k in parsed}
+
+
+def batch_items(request):
+    """Items from {"image_urls": [...]} and/or {"images": [...]}; entries may also be item dicts."""
+    items = []
+    for url in request.get("image_urls") or []:
+        items.append(url if isinstance(url, dict) else {"image_url": url})
+    for image in request.get("images") or []:
+        items.append(image if isinstance(image, dict) else {"image": image})
+    return items
+
+
+class BatchRunner:
+    def __init__(self, executor, run, on_summary, fetchers=None, max_items=None, name="batch"):
+        if fetchers is None:
+            fetchers = int(os.environ.get("IOTC_BATCH_FETCHERS", "4"))
+        if max_items is None:
+            max_items = int(os.environ.get("IOTC_BATCH_MAX_ITEMS", "50"))
+        self.executor = executor
+        self.run = run
+        self.on_summary = on_summary
+        self.fetchers = max(1, fetchers)
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.active = None
+        # One batch at a time; a second one waits for the first
+        self.coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-run")
+        self.fetch_pool = ThreadPoolExecutor(max_workers=self.fetchers, thread_name_prefix=f"{name}-fetch")
+        self.counters = {"batches": 0, "items": 0, "ok": 0, "errors": 0, "rejected": 0}
+        register_source(name, self.stats)
+
+    def start(self, client_id, request):
+        """Queue a batch; returns its batch_id. Raises ValueError for an empty or oversized batch."""
+        items = batch_items(request)
+        if not items:
+            raise ValueError("batch has no image_urls or images")
+        if len(items) > self.max_items:
+            with self.lock:
+                self.counters["rejected"] += 1
+            raise ValueError(f"batch has {len(items)} items, limit is {self.max_items}")
+        common = {k: v for k, v in request.items() if k not in ("image_urls", "images")}
+        batch_id = request.get("batch_id") or uuid.uuid4().hex[:8]
+        self.coordinator.submit(self._run_safely, batch_id, client_id, items, common)
+        return batch_id
+
+    def _load(self, item, ahead, aborted):
+        # Runs on a fetch thread: returns (bytes or None, fetch_ms). ahead bounds how
+        # many downloaded images may wait for the executor.
+        ahead.acquire()
+        start = time.perf_counter()
+        if aborted.is_set():
+            content = None
+        elif item.get("image"):
+            try:
+                content = base64.b64decode(item["image"])
+            except (binascii.Error, ValueError) as e:
+                print(f"batch image is not valid base64: {e}")
+                content = None
+        else:
+            try:
+                content = fetch_image(item["image_url"]).content
+            except Exception as e:
+                print(f"batch fetch failed for {item.get('image_url')}: {e}")
+                content = None
+        return content, (time.perf_counter() - start) * 1000.0
+
+    def _detect(self, client_id, parsed, submitted, detect_ms):
+        # Runs on an inference worker
+        try:
+            return self.run(client_id, parsed)
+        finally:
+            detect_ms.append((time.perf_counter() - submitted) * 1000.0)
+
+    def _run_safely(self, batch_id, client_id, items, common):
+        try:
+            self._run(batch_id, client_id, items, common)
+        except Exception as e:
+            print(f"batch {batch_id} failed: {e}")
+            print(traceback.format_exc())
+
+    def _run(self, batch_id, client_id, items, common):
+        with self.lock:
+            self.active = batch_id
+        ahead = threading.Semaphore(self.fetchers * 2)
+        aborted = threading.Event()
+        loads = {}
+        try:
+            for index, item in enumerate(items):
+                loads[self.fetch_pool.submit(self._load, item, ahead, aborted)] = index
+            summary = self._pipeline(batch_id, client_id, items, common, loads, ahead)
+        except BaseException:
+            # Do not leave downloads queued or blocked on ahead, holding the fetch threads
+            aborted.set()
+            for future in loads:
+                future.cancel()
+            ahead.release(len(items))
+            raise
+        finally:
+            with self.lock:
+                self.active = None
+        with self.lock:
+            self.counters["batches"] += 1
+            self.counters["items"] += summary["batch_items"]
+            self.counters["ok"] += summary["batch_ok"]
+            self.counters["errors"] += summary["batch_errors"]
+        self.on_summary(summary)
+
+    def _pipeline(self, batch_id, client_id, items, common, loads, ahead):
+        started = time.perf_counter()
+        # Leave one executor queue slot for interactive requests
+        in_flight = threading.Semaphore(max(1, self.executor.queue.maxsize - 1))
+        detects = {}
+        fetch_ms = []
+        detect_ms = []
+        for done in as_completed(loads):
+            index = loads[done]
+            content, elapsed = done.result()
+            fetch_ms.append(elapsed)
+            parsed = dict(common)
+            parsed.update({k: v for k, v in items[index].items() if k != "image"})
+            parsed["batch_id"] = batch_id
+            parsed["batch_index"] = index
+            if content is not None:
+                parsed["image_bytes"] = content
+            in_flight.acquire()
+            try:
+                future = self.executor.submit(
+                    self._detect, client_id, parsed, time.perf_counter(), detect_ms,
+                    cost_bytes=len(content or b""), block=True)
+            except BaseException:
+                in_flight.release()
+                raise
+            future.add_done_callback(lambda _: in_flight.release())
+            ahead.release()
+            detects[future] = index
+
+        ok = 0
+        for future in as_completed(detects):
+            try:
+                if future.result() is not None:
+                    ok += 1
+            except Exception:
+                pass
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        count = len(items)
+        summary = {
+            "batch_id": batch_id,
+            "batch_items": count,
+            "batch_ok": ok,
+            "batch_errors": count - ok,
+            "batch_elapsed_ms": round(elapsed_ms, 3),
+            "batch_images_per_sec": round(count / (elapsed_ms / 1000.0), 3) if elapsed_ms else 0.0,
+            "batch_fetch_ms": round(sum(fetch_ms) / len(fetch_ms), 3) if fetch_ms else 0.0,
+            "batch_detect_ms": round(sum(detect_ms) / len(detect_ms), 3) if detect_ms else 0.0,
+        }
+        return summary
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c["active"] = self.active
+        c["fetchers"] = self.fetchers
+        c["max_items"] = self.max_items
+        return c
@@ -0,0 +1,332 @@
+"""Pre/post-roll event clips from a fixed-size ring of JPEG frames.
+
+A detection used to keep one frame at most (the annotated JPEG in scan_log),
+so what led up to it and what happened next was lost. ClipRecorder keeps the
+last few seconds of camera frames instead, JPEG-compressed, in one buffer
+allocated up front:
+
+- the ring has room for (IOTC_CLIP_PRE_SEC + IOTC_CLIP_POST_SEC) x
+  IOTC_CLIP_FPS frames plus half again for extensions and slack (defaults
+  5 s, 5 s, 5 fps),
+  each in a fixed slot of IOTC_CLIP_SLOT_KB (default 128); a frame that does
+  not fit its slot is dropped and counted, never grown into,
+- the buffer is a bytearray, or an mmap of the file IOTC_CLIP_MMAP when it is
+  set (page cache instead of heap; the file is truncated to the ring size),
+- add_frame() encodes at most IOTC_CLIP_FPS frames a second at
+  IOTC_CLIP_QUALITY (default 70), scaled down to IOTC_CLIP_MAX_WIDTH
+  (default 640) when wider, into the next slot. Given the app's shared-memory
+  iotc_frame_ring.FrameRing, the encoding happens in its "jpeg" consumer
+  process and add_frame() only copies the frame into the ring; without one
+  (or when the consumer cannot start) it encodes inline,
+- trigger() marks an event; once a frame newer than event + post-roll has
+  arrived (plus two clip frames of grace for the consumer), the clip's time
+  range goes to a writer thread, which copies the frames from event -
+  pre-roll on out of the ring one at a time and saves them as one .mjpeg
+  file (concatenated JPEGs, which ffmpeg and VLC play) under IOTC_CLIP_DIR
+  (default /tmp/iotc-clips). The camera thread never copies a clip,
+- when no frame has been offered for IOTC_CLIP_IDLE_SEC (default 2) the
+  writer thread closes the running clip itself with the frames the ring has,
+  so a camera that stops mid post-roll still leaves its clip on disk,
+- a trigger during another clip's post-roll extends that clip instead of
+  starting a second one, up to what the ring holds,
+- only the newest IOTC_CLIP_KEEP clips (default 20) are kept on disk.
+
+Memory use is the ring size whatever the uptime; counters are under "clips"
+in /metrics.
+
+Check the clip timing (synthetic frames, writes to a temporary directory):
+    python3 app-lab/iotc_clip.py
+
+Usage in an app:
+    from iotc_clip import ClipRecorder
+    CLIPS = ClipRecorder(RING)            # RING: iotc_frame_ring.FrameRing, or None
+    CLIPS.add_frame(frame)                # every camera frame
+    clip_file = CLIPS.trigger("QRCODE")   # on a detection
+"""
+
+import io
+import math
+import mmap
+import os
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from iotc_profiling import register_source
+
+
+class FrameRing:
+    """Fixed number of fixed-size JPEG slots in one preallocated buffer."""
+
+    def __init__(self, slots, slot_bytes, path=None):
+        self.slots = max(1, int(slots))
+        self.slot_bytes = max(1024, int(slot_bytes))
+        size = self.slots * self.slot_bytes
+        self.file = None
+        if path:
+            self.file = open(path, "w+b")
+            self.file.truncate(size)
+            self.buffer = mmap.mmap(self.file.fileno(), size)
+        else:
+            self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.stamps = np.zeros(self.slots, dtype=np.float64)
+        self.lengths = np.zeros(self.slots, dtype=np.int64)
+        self.seqs = np.full(self.slots, -1, dtype=np.int64)
+        self.next_seq = 0
+
+    def put(self, data, stamp):
+        """Store one JPEG; False when it is larger than a slot."""
+        if len(data) > self.slot_bytes:
+            return False
+        slot = self.next_seq % self.slots
+        offset = slot * self.slot_bytes
+        self.view[offset:offset + len(data)] = data
+        self.stamps[slot] = stamp
+        self.lengths[slot] = len(data)
+        self.seqs[slot] = self.next_seq
+        self.next_seq += 1
+        return True
+
+    def held(self, start, end):
+        """[(slot, seq)] for frames stamped in [start, end], oldest first."""
+        held = np.flatnonzero((self.seqs >= 0) & (self.stamps >= start) & (self.stamps <= end))
+        return [(int(slot), int(self.seqs[slot])) for slot in held[np.argsort(self.seqs[held])]]
+
+    def read(self, slot, seq):
+        """One frame's bytes, or None when the slot has been reused since held()."""
+        if self.seqs[slot] != seq:
+            return None
+        offset = slot * self.slot_bytes
+        return bytes(self.view[offset:offset + int(self.lengths[slot])])
+
+    @property
+    def nbytes(self):
+        return self.slots * self.slot_bytes
+
+
+class ClipRecorder:
+    def __init__(self, frame_ring=None, pre_sec=None, post_sec=None, fps=None, quality=None, slot_kb=None,
+                 max_width=None, clip_dir=None, keep=None, mmap_path=None, idle_sec=None, name="clips"):
+        if pre_sec is None:
+            pre_sec = float(os.environ.get("IOTC_CLIP_PRE_SEC", "5"))
+        if post_sec is None:
+            post_sec = float(os.environ.get("IOTC_CLIP_POST_SEC", "5"))
+        if fps is None:
+            fps = float(os.environ.get("IOTC_CLIP_FPS", "5"))
+        if quality is None:
+            quality = int(os.environ.get("IOTC_CLIP_QUALITY", "70"))
+        if slot_kb is None:
+            slot_kb = int(os.environ.get("IOTC_CLIP_SLOT_KB", "128"))
+        if max_width is None:
+            max_width = int(os.environ.get("IOTC_CLIP_MAX_WIDTH", "640"))
+        if clip_dir is None:
+            clip_dir = os.environ.get("IOTC_CLIP_DIR", "/tmp/iotc-clips")
+        if keep is None:
+            keep = int(os.environ.get("IOTC_CLIP_KEEP", "20"))
+        if mmap_path is None:
+            mmap_path = os.environ.get("IOTC_CLIP_MMAP") or None
+        if idle_sec is None:
+            idle_sec = float(os.environ.get("IOTC_CLIP_IDLE_SEC", "2"))
+        self.pre_sec = max(0.0, pre_sec)
+        self.post_sec = max(0.0, post_sec)
+        self.fps = max(0.1, fps)
+        self.quality = quality
+        self.max_width = max(16, max_width)
+        self.clip_dir = clip_dir
+        self.keep = max(1, keep)
+        self.idle_sec = max(0.1, idle_sec)
+        self.span_sec = (self.pre_sec + self.post_sec) * 1.5
+        self.ring = FrameRing(math.ceil(self.span_sec * self.fps) + 1, slot_kb * 1024, mmap_path)
+        self.lock = threading.Lock()
+        self.last_added = None
+        self.last_offered = None    # time.monotonic() of the latest add_frame()
+        self.clip = None    # {"path", "start", "end"} while a post-roll is running
+        self.jobs = queue.Queue()
+        self.writer = None
+        self.counters = {"frames": 0, "encoded": 0, "oversize": 0, "triggers": 0, "extended": 0,
+                         "clips": 0, "idle_closes": 0, "overwritten": 0, "write_errors": 0, "encode_ms": 0.0,
+                         "bytes_written": 0}
+        self.frame_ring = frame_ring
+        self.consumer = None
+        if frame_ring is not None:
+            self.consumer = frame_ring.start_consumer("jpeg", self._from_ring, quality=quality,
+                                                      width=self.max_width)
+        # Frames encoded in the consumer land a little after they were taken
+        self.grace_sec = 2.0 / self.fps if self.consumer is not None else 0.0
+        register_source(name, self.stats)
+
+    def add_frame(self, frame, now=None):
+        """Offer one camera frame (PIL image); encoded when the clip rate allows."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.counters["frames"] += 1
+            self.last_offered = time.monotonic()
+            # A little slack so camera jitter does not skip every other frame
+            due = self.last_added is None or now - self.last_added >= 0.9 / self.fps
+            if due:
+                self.last_added = now
+        if due and self.consumer is not None and self.frame_ring.write(frame, now, consumers=[self.consumer]):
+            due = False    # encoded in the consumer process, stored by _from_ring()
+        if due:
+            start = time.perf_counter()
+            image = frame.convert("RGB")
+            if image.width > self.max_width:
+                image = image.resize((self.max_width, max(1, round(image.height * self.max_width / image.width))))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality)
+            data = buffer.getbuffer()
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with self.lock:
+                self.counters["encoded"] += 1
+                self.counters["encode_ms"] += elapsed
+                if not self.ring.put(data, now):
+                    self.counters["oversize"] += 1
+        self._close_if_done(now)
+
+    def _from_ring(self, seq, stamp, data):
+        with self.lock:
+            self.counters["encoded"] += 1
+            if not self.ring.put(data, stamp):
+                self.counters["oversize"] += 1
+
+    def trigger(self, label="event", now=None):
+        """Start (or extend) a clip around now; returns the clip file's path."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.counters["triggers"] += 1
+            if self.clip is not None:
+                # Extend the running clip, but not past what the ring still holds when it
+                # closes: add_frame() admits up to fps / 0.9, plus the grace and one frame of margin
+                limit = self.clip["start"] + self.span_sec * 0.9 - 1.0 / self.fps - self.grace_sec
+                self.clip["end"] = max(self.clip["end"], min(now + self.post_sec, limit))
+                self.counters["extended"] += 1
+                return self.clip["path"]
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now))
+            label = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(label))[:32] or "event"
+            path = os.path.join(self.clip_dir, f"{stamp}-{int(now * 1000) % 1000:03d}-{label}.mjpeg")
+            self.clip = {"path": path, "start": now - self.pre_sec, "end": now + self.post_sec}
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_loop, name="iotc-clip-writer", daemon=True)
+                self.writer.start()
+            return path
+
+    def _close_if_done(self, now):
+        with self.lock:
+            if self.clip is None or now < self.clip["end"] + self.grace_sec:
+                return
+            clip, self.clip = self.clip, None
+        self.jobs.put(clip)
+
+    def _close_if_idle(self):
+        """The running clip when no frame has been offered for idle_sec, else None."""
+        with self.lock:
+            if self.clip is None:
+                return None
+            if self.last_offered is not None and time.monotonic() - self.last_offered < self.idle_sec:
+                return None
+            clip, self.clip = self.clip, None
+            self.counters["idle_closes"] += 1
+        return clip
+
+    def _write_loop(self):
+        while True:
+            try:
+                clip = self.jobs.get(timeout=self.idle_sec / 2)
+            except queue.Empty:
+                clip = self._close_if_idle()
+                if clip is None:
+                    continue
+            try:
+                self._write(clip)
+                self._prune()
+            except Exception as e:
+                with self.lock:
+                    self.counters["write_errors"] += 1
+                print(f"clip write failed: {e}")
+                print(traceback.format_exc())
+
+    def _write(self, clip):
+        path = clip["path"]
+        with self.lock:
+            held = self.ring.held(clip["start"], clip["end"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        with open(path + ".part", "wb") as f:
+            for slot, seq in held:
+                # One slot at a time, so add_frame() never waits on a whole clip
+                with self.lock:
+                    data = self.ring.read(slot, seq)
+                    if data is None:
+                        self.counters["overwritten"] += 1
+                if data is not None:
+                    f.write(data)
+                    written += len(data)
+        os.replace(path + ".part", path)
+        with self.lock:
+            self.counters["clips"] += 1
+            self.counters["bytes_written"] += written
+
+    def _prune(self):
+        clips = sorted(n for n in os.listdir(self.clip_dir) if n.endswith(".mjpeg"))
+        for name in clips[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.clip_dir, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c["recording"] = self.clip is not None
+            c["ring_slots"] = self.ring.slots
+            c["ring_bytes"] = self.ring.nbytes
+            c["backing"] = "mmap" if self.ring.file is not None else "memory"
+        if self.consumer is not None:
+            # Encoded in the frame ring's consumer process
+            c["encode_ms"] = self.frame_ring.stats()["consumers"].get("jpeg", {}).get("work_ms", 0.0)
+        c["encode_ms"] = round(c["encode_ms"], 3)
+        c["encoder"] = "process" if self.consumer is not None else "inline"
+        return c
+
+
+def main():
+    import tempfile
+
+    from PIL import Image
+
+    frame = Image.new("RGB", (320, 240), (40, 90, 160))
+    with tempfile.TemporaryDirectory() as clip_dir:
+        clips = ClipRecorder(pre_sec=5, post_sec=5, fps=5, clip_dir=clip_dir, mmap_path="")
+        t = 90.0
+        path = stalled = None
+        while t < 120.0:
+            clips.add_frame(frame, now=t)
+            if abs(t - 100.0) < 1e-6:
+                path = clips.trigger("first", now=t)
+                print(f"trigger at 100.0: end {clips.clip['end']:.1f}")
+            if abs(t - 103.0) < 1e-6:
+                assert clips.trigger("second", now=t) == path
+                print(f"trigger at 103.0: end {clips.clip['end']:.1f}")
+                assert clips.clip["end"] > 105.0, "a second trigger must extend the clip"
+            if abs(t - 115.0) < 1e-6:
+                # The frames stop before this clip's post-roll is over
+                stalled = clips.trigger("stalled", now=t)
+            t = round(t + 0.2, 6)
+        deadline = time.monotonic() + 5 + clips.idle_sec
+        while clips.stats()["clips"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with open(path, "rb") as f:
+            count = f.read().count(b"\xff\xd8\xff")
+        print(f"{os.path.basename(path)}: {count} frames, {clips.stats()}")
+        # 95.0 to 108.0 at 5 fps
+        assert count >= 5 * (5 + 8), "clip is missing frames from the pre-roll or the extension"
+        assert os.path.exists(stalled), "a clip whose frames stopped must still be written"
+        assert clips.stats()["idle_closes"] == 1
+
+
+if __name__ == "__main__":
+    main()
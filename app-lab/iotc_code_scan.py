@@ -0,0 +1,177 @@
+"""Continuous code scanning: each code once per sighting, off the camera thread.
+
+code-detector latched after the first code and ignored everything until a
+manual reset, which suits a person holding up one code but not a conveyor or
+a gate. With IOTC_SCAN_MODE=continuous the app keeps scanning and feeds
+every code the brick reports to ContinuousScanner:
+
+- CooldownCache remembers codes by (type, content) in an LRU of up to
+  IOTC_SCAN_CACHE entries (default 256); a code counts as new when it has
+  not been seen for IOTC_SCAN_COOLDOWN_SEC (default 5). Every sighting
+  refreshes the entry, so a code that stays in view is reported once, and
+  again only after it has been gone for the cooldown,
+- a repeat sighting costs one dict lookup on the callback thread; new codes
+  are queued (up to IOTC_SCAN_QUEUE, default 64) to one emitter thread that
+  does the slow part (annotating, storing, UI, telemetry), so the callback
+  keeps up with the camera. A code that does not fit in the queue is
+  forgotten again, so its next sighting is reported,
+- fields() returns scans_per_sec (sightings over the last 10 s),
+  duplicates_suppressed (since the previous call) and scan_latency_ms (mean
+  time from sighting to emitted, since the previous call); totals are under
+  "code_scan" in /metrics.
+
+reset() forgets every code, so the next sighting of each is reported again.
+
+Usage in an app:
+    from iotc_code_scan import ContinuousScanner, continuous_mode
+    SCANNER = ContinuousScanner(emit_code) if continuous_mode() else None
+    SCANNER.submit(frame, detection)      # in on_detect
+"""
+
+import collections
+import os
+import queue
+import threading
+import time
+import traceback
+
+from iotc_profiling import register_source
+
+SCAN_FIELDS = ("scans_per_sec", "duplicates_suppressed", "scan_latency_ms")
+RATE_WINDOW_SEC = 10
+
+
+def continuous_mode():
+    return os.environ.get("IOTC_SCAN_MODE", "single").strip().lower() == "continuous"
+
+
+class CooldownCache:
+    """LRU of code keys with a sliding cooldown."""
+
+    def __init__(self, cooldown_sec=None, max_codes=None):
+        if cooldown_sec is None:
+            cooldown_sec = float(os.environ.get("IOTC_SCAN_COOLDOWN_SEC", "5"))
+        if max_codes is None:
+            max_codes = int(os.environ.get("IOTC_SCAN_CACHE", "256"))
+        self.cooldown_sec = cooldown_sec
+        self.max_codes = max(1, max_codes)
+        self.seen = collections.OrderedDict()    # key -> last sighting
+        self.evicted = 0
+
+    def check(self, key, now):
+        """Record a sighting; True when the key is new or was gone for the cooldown."""
+        last = self.seen.pop(key, None)
+        self.seen[key] = now
+        if len(self.seen) > self.max_codes:
+            self.seen.popitem(last=False)
+            self.evicted += 1
+        return last is None or now - last >= self.cooldown_sec
+
+    def forget(self, key):
+        self.seen.pop(key, None)
+
+    def clear(self):
+        self.seen.clear()
+
+    def __len__(self):
+        return len(self.seen)
+
+
+class ContinuousScanner:
+    def __init__(self, emit, cooldown_sec=None, max_codes=None, max_queue=None, name="code_scan"):
+        if max_queue is None:
+            max_queue = int(os.environ.get("IOTC_SCAN_QUEUE", "64"))
+        self.emit = emit
+        self.cache = CooldownCache(cooldown_sec, max_codes)
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue(maxsize=max(1, max_queue))
+        self.thread = None
+        self.rate = collections.deque()    # [second, sightings] for the last RATE_WINDOW_SEC
+        self.interval_dups = 0
+        self.interval_latency = [0.0, 0]    # ms sum, emitted
+        self.counters = {"sightings": 0, "new": 0, "duplicates": 0, "emitted": 0, "emit_errors": 0,
+                         "queue_full": 0, "latency_ms": 0.0, "max_latency_ms": 0.0}
+        register_source(name, self.stats)
+
+    def submit(self, frame, detection, now=None):
+        """One code the brick reported; queued for emit() when it is new. Returns whether it was."""
+        now = time.time() if now is None else now
+        key = (detection.type, detection.content)
+        with self.lock:
+            self.counters["sightings"] += 1
+            second = int(now)
+            if self.rate and self.rate[-1][0] == second:
+                self.rate[-1][1] += 1
+            else:
+                self.rate.append([second, 1])
+                while self.rate[0][0] <= second - RATE_WINDOW_SEC:
+                    self.rate.popleft()
+            if not self.cache.check(key, now):
+                self.counters["duplicates"] += 1
+                self.interval_dups += 1
+                return False
+            self.counters["new"] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._emit_loop, name="iotc-code-scan", daemon=True)
+                self.thread.start()
+        try:
+            self.jobs.put_nowait((frame, detection, time.perf_counter()))
+        except queue.Full:
+            with self.lock:
+                self.counters["queue_full"] += 1
+                self.cache.forget(key)
+            return False
+        return True
+
+    def reset(self):
+        with self.lock:
+            self.cache.clear()
+
+    def _emit_loop(self):
+        while True:
+            frame, detection, queued = self.jobs.get()
+            try:
+                self.emit(frame, detection)
+            except Exception as e:
+                with self.lock:
+                    self.counters["emit_errors"] += 1
+                print(f"code scan emit failed: {e}")
+                print(traceback.format_exc())
+                continue
+            elapsed = (time.perf_counter() - queued) * 1000.0
+            with self.lock:
+                self.counters["emitted"] += 1
+                self.counters["latency_ms"] += elapsed
+                self.counters["max_latency_ms"] = max(self.counters["max_latency_ms"], elapsed)
+                self.interval_latency[0] += elapsed
+                self.interval_latency[1] += 1
+
+    def _rate(self, now):
+        recent = sum(count for second, count in self.rate if second > int(now) - RATE_WINDOW_SEC)
+        return recent / RATE_WINDOW_SEC
+
+    def fields(self, now=None):
+        """SCAN_FIELDS telemetry; duplicates and latency cover the time since the previous call."""
+        now = time.time() if now is None else now
+        with self.lock:
+            dups, self.interval_dups = self.interval_dups, 0
+            total, count = self.interval_latency
+            self.interval_latency = [0.0, 0]
+            return {
+                "scans_per_sec": round(self._rate(now), 2),
+                "duplicates_suppressed": dups,
+                "scan_latency_ms": round(total / count, 3) if count else 0.0,
+            }
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c["latency_ms"] = round(c["latency_ms"], 3)
+            c["max_latency_ms"] = round(c["max_latency_ms"], 3)
+            c["mean_latency_ms"] = round(self.counters["latency_ms"] / c["emitted"], 3) if c["emitted"] else 0.0
+            c["scans_per_sec"] = round(self._rate(time.time()), 2)
+            c["cached_codes"] = len(self.cache)
+            c["evicted"] = self.cache.evicted
+            c["queued"] = self.jobs.qsize()
+            c["cooldown_sec"] = self.cache.cooldown_sec
+        return c
@@ -0,0 +1,247 @@
+"""Decode uploads at roughly the model input size instead of full resolution.
+
+A 12 MP phone photo is ~36 MB once decoded, and the brick immediately resizes
+it to a few hundred pixels. decode_image() reads the header, works out the
+smallest size that still covers the model input (both sides >= the input
+side, aspect ratio kept), and lets PIL get there cheaply:
+
+- JPEG: draft() makes libjpeg decode at 1/2, 1/4 or 1/8 scale directly,
+- everything else: a full decode followed by reduce(),
+- then a thumbnail() step down to the cover size.
+
+The returned DecodedImage keeps the scale factors, so box coordinates from the
+brick can be mapped back to the original image with to_original().
+
+The target size is learned from the brick (input_size / model_input_size /
+input_shape attributes when it has them) and otherwise taken from
+INPUT_SIZES, which are upper bounds for the App Lab models. IOTC_DECODE_SIZE
+overrides both ("640" or "640x480"; "0" decodes at full resolution).
+
+Usage in an app:
+    from iotc_decode import decode_image, model_input_size
+    INPUT_SIZE = model_input_size(object_detection)
+    decoded = decode_image(image_bytes, INPUT_SIZE, reserve=charge)
+    results = object_detection.detect(decoded.image)
+    detections = normalize_results(decoded.to_original(results))
+"""
+
+import copy
+import io
+import math
+import os
+import threading
+import time
+
+from PIL import Image
+
+from iotc_detection_cache import RESULT_LISTS
+from iotc_profiling import register_source
+
+# Brick class name -> (width, height) the decoder aims to cover
+INPUT_SIZES = {
+    "ObjectDetection": (640, 640),
+    "ImageClassification": (320, 320),
+    "VisualAnomalyDetection": (640, 640),
+}
+DEFAULT_INPUT_SIZE = (640, 640)
+
+_SIZE_ATTRS = ("input_size", "model_input_size", "input_shape", "imgsz")
+
+_lock = threading.Lock()
+_counters = {
+    "decodes": 0,
+    "reduced": 0,
+    "jpeg_draft": 0,
+    "decode_ms_total": 0.0,
+    "decode_ms_max": 0.0,
+    "original_pixels": 0,
+    "decoded_pixels": 0,
+}
+
+
+def _parse_size(value):
+    """(w, h) from 640, "640", "640x480", (640, 480) or an NHWC/NCHW shape; None if unusable."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        parts = value.lower().replace(",", "x").split("x")
+        try:
+            nums = [int(p) for p in parts if p.strip()]
+        except ValueError:
+            return None
+    elif isinstance(value, (int, float)):
+        nums = [int(value)]
+    else:
+        try:
+            nums = [int(v) for v in value if v is not None]
+        except (TypeError, ValueError):
+            return None
+    if len(nums) == 1:
+        return (nums[0], nums[0])
+    if len(nums) == 2:
+        return (nums[0], nums[1])
+    if len(nums) == 4:
+        # (n, h, w, c) or (n, c, h, w)
+        _, a, b, c = nums
+        return (b, a) if c in (1, 3) else (c, b)
+    if len(nums) == 3:
+        # (h, w, c) or (c, h, w)
+        a, b, c = nums
+        return (b, a) if c in (1, 3) else (c, b)
+    return None
+
+
+def model_input_size(brick=None):
+    """Size decode_image() should cover for brick; None means decode at full resolution."""
+    override = os.environ.get("IOTC_DECODE_SIZE")
+    if override is not None:
+        size = _parse_size(override)
+        return size if size and size[0] > 0 and size[1] > 0 else None
+    if brick is not None:
+        for attr in _SIZE_ATTRS:
+            size = _parse_size(getattr(brick, attr, None))
+            if size and size[0] > 0 and size[1] > 0:
+                return size
+        return INPUT_SIZES.get(type(brick).__name__, DEFAULT_INPUT_SIZE)
+    return DEFAULT_INPUT_SIZE
+
+
+def cover_size(original, target):
+    """Smallest size with original's aspect ratio whose sides are both >= target's."""
+    w, h = original
+    tw, th = target
+    scale = max(tw / w, th / h)
+    if scale >= 1.0:
+        return original
+    return (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale)))
+
+
+class DecodedImage:
+    __slots__ = ("image", "original_size", "scale_x", "scale_y")
+
+    def __init__(self, image, original_size):
+        self.image = image
+        self.original_size = original_size
+        self.scale_x = original_size[0] / image.width
+        self.scale_y = original_size[1] / image.height
+
+    @property
+    def reduced(self):
+        return self.scale_x != 1.0 or self.scale_y != 1.0
+
+    def _scale_item(self, item):
+        sx, sy = self.scale_x, self.scale_y
+        xyxy = item.get("bounding_box_xyxy")
+        bbox = item.get("bbox")
+        coords = xyxy if isinstance(xyxy, (list, tuple)) else bbox if isinstance(bbox, (list, tuple)) else None
+        if coords is not None and len(coords) >= 4:
+            # Normalized (0..1) boxes do not depend on the decode size
+            if all(isinstance(v, (int, float)) and 0.0 <= v <= 1.0 for v in coords[:4]):
+                return
+            scaled = [coords[0] * sx, coords[1] * sy, coords[2] * sx, coords[3] * sy] + list(coords[4:])
+            item["bounding_box_xyxy" if coords is xyxy else "bbox"] = scaled
+            return
+        values = [item.get(k) for k in ("x", "y", "w", "h") if isinstance(item.get(k), (int, float))]
+        if values and all(0.0 <= v <= 1.0 for v in values):
+            return
+        for key, factor in (("x", sx), ("y", sy), ("w", sx), ("h", sy)):
+            if isinstance(item.get(key), (int, float)):
+                item[key] = item[key] * factor
+
+    def to_original(self, results):
+        """Copy of brick results with pixel boxes in original image coordinates."""
+        if results is None or not self.reduced:
+            return results
+        results = copy.deepcopy(results)
+        if isinstance(results, dict):
+            lists = [results[k] for k in RESULT_LISTS if isinstance(results.get(k), list)]
+        elif isinstance(results, list):
+            lists = [results]
+        else:
+            lists = []
+        for items in lists:
+            for item in items:
+                if isinstance(item, dict):
+                    self._scale_item(item)
+        return results
+
+
+def decode_image(image_bytes, target=None, reserve=None):
+    """Decode image_bytes to at least target (w, h), or fully when target is None.
+
+    reserve(nbytes), if given, is called with the decoded size before any
+    pixels are decoded (e.g. iotc_inference.charge).
+    """
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    original = image.size
+    size = cover_size(original, target) if target else original
+    drafted = False
+    if size != original and image.format == "JPEG":
+        mode = image.mode if image.mode in ("L", "RGB") else None
+        drafted = image.draft(mode, size) is not None
+    if reserve is not None:
+        reserve(image.width * image.height * len(image.getbands()))
+    if size != original:
+        # reducing_gap lets PIL reduce() by an integer factor before the final resample
+        image.thumbnail(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    else:
+        image.load()
+    decoded = DecodedImage(image, original)
+
+    elapsed = (time.perf_counter() - start) * 1000.0
+    with _lock:
+        _counters["decodes"] += 1
+        _counters["reduced"] += 1 if decoded.reduced else 0
+        _counters["jpeg_draft"] += 1 if drafted else 0
+        _counters["decode_ms_total"] += elapsed
+        _counters["decode_ms_max"] = max(_counters["decode_ms_max"], elapsed)
+        _counters["original_pixels"] += original[0] * original[1]
+        _counters["decoded_pixels"] += image.width * image.height
+    return decoded
+
+
+def stats():
+    with _lock:
+        c = dict(_counters)
+    n = c.pop("decodes")
+    total = c.pop("decode_ms_total")
+    original = c.pop("original_pixels")
+    decoded = c.pop("decoded_pixels")
+    c.update({
+        "decodes": n,
+        "decode_ms_mean": round(total / n, 3) if n else 0.0,
+        "decode_ms_max": round(c["decode_ms_max"], 3),
+        "pixel_ratio": round(decoded / original, 4) if original else 1.0,
+    })
+    return c
+
+
+register_source("decode", stats)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare full and reduced decode of an image.")
+    parser.add_argument("image")
+    parser.add_argument("--size", default="640", help="Target size, e.g. 640 or 640x480")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        data = f.read()
+    target = _parse_size(args.size)
+    for label, t in (("full", None), (f"reduced {target[0]}x{target[1]}", target)):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            decoded = decode_image(data, t)
+            best = min(best or 1e9, (time.perf_counter() - start) * 1000.0)
+        image = decoded.image
+        mb = image.width * image.height * len(image.getbands()) / 1e6
+        print(f"{label:20s} {image.width}x{image.height}  {best:8.2f} ms  {mb:6.1f} MB decoded")
+
+
+if __name__ == "__main__":
+    main()
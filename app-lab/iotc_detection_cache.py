@@ -0,0 +1,178 @@
+"""Content-addressed cache for model results, independent of the confidence slider.
+
+Entries are keyed by a hash of the image bytes. On a miss the model runs once
+at a low floor threshold (IOTC_CACHE_FLOOR, default 0.1) and the raw results
+are stored. Any later request for the same bytes with a confidence at or above
+the stored threshold is answered by filtering the cached list, so moving the
+slider or repeating a detect-objects command does not re-run inference. A
+request below the stored threshold recomputes at that lower threshold and
+replaces the entry.
+
+A confidence of None means results that do not depend on a threshold (anomaly
+scores); such entries only answer None requests, and a numeric request never
+matches them (nor the reverse). Apps turn whatever a command or the UI sent
+into a number first with to_confidence(value, default).
+
+Filtering after the fact can differ slightly from running the model at the
+higher threshold when the model applies its threshold before NMS; for the
+demo models the difference is only in which overlapping low-score boxes
+survive.
+
+- LRU eviction within a byte budget (IOTC_CACHE_MB, default 8; 0 disables).
+- hits / misses / evictions are reported under the cache name in /metrics.
+
+Usage in an app:
+    from iotc_detection_cache import DetectionCache, to_confidence
+    DETECTIONS = DetectionCache()
+    confidence = to_confidence(parsed.get("confidence"), CURRENT_CONFIDENCE)
+    results, hit = DETECTIONS.detect(
+        DETECTIONS.key(image_bytes), confidence,
+        lambda threshold: object_detection.detect(pil_image, confidence=threshold),
+    )
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from iotc_detections import RESULT_LISTS, confidence_of
+from iotc_profiling import register_source
+
+_ENTRY_OVERHEAD = 200
+
+
+def filter_results(results, confidence):
+    """Copy of results keeping only items at or above confidence (None keeps everything)."""
+    if confidence is None or results is None:
+        return copy.deepcopy(results)
+
+    def keep(items):
+        kept = []
+        for item in items:
+            c = confidence_of(item)
+            if c is None or c >= confidence:
+                kept.append(copy.deepcopy(item))
+        return kept
+
+    if isinstance(results, list):
+        return keep(results)
+    if isinstance(results, dict):
+        filtered = {}
+        for k, v in results.items():
+            filtered[k] = keep(v) if k in RESULT_LISTS and isinstance(v, list) else copy.deepcopy(v)
+        return filtered
+    return copy.deepcopy(results)
+
+
+def to_confidence(value, default):
+    """value as a float in [0, 1], or default when it is missing or not a number."""
+    try:
+        return max(0.0, min(1.0, float(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_threshold(confidence):
+    if confidence is None:
+        return None
+    try:
+        return float(confidence)
+    except (TypeError, ValueError):
+        # None would mean "threshold-independent" and poison the entry for numeric requests
+        raise ValueError(f"confidence must be a number, got {confidence!r}") from None
+
+
+class DetectionCache:
+    def __init__(self, max_bytes=None, floor=None, name="detection_cache"):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("IOTC_CACHE_MB", "8")) * 1024 * 1024)
+        if floor is None:
+            floor = float(os.environ.get("IOTC_CACHE_FLOOR", "0.1"))
+        self.max_bytes = max_bytes
+        self.floor = floor
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> (threshold, results, size)
+        self.bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "recomputes_below_floor": 0}
+        register_source(name, self.stats)
+
+    @staticmethod
+    def key(image_bytes, *extra):
+        h = hashlib.blake2b(image_bytes, digest_size=16)
+        for part in extra:
+            h.update(b"\0" + str(part).encode("utf-8"))
+        return h.hexdigest()
+
+    def _get(self, key, threshold):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            stored_threshold = entry[0]
+            if (threshold is None) != (stored_threshold is None):
+                # Filtered vs threshold-independent results: neither can answer the other
+                self.counters["misses"] += 1
+                return None
+            if threshold is not None and threshold < stored_threshold:
+                self.counters["misses"] += 1
+                self.counters["recomputes_below_floor"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry
+
+    def _put(self, key, threshold, results):
+        try:
+            size = len(json.dumps(results, default=str)) + _ENTRY_OVERHEAD
+        except (TypeError, ValueError):
+            return
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.entries[key] = (threshold, results, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted[2]
+                self.counters["evictions"] += 1
+
+    def detect(self, key, confidence, compute):
+        """Return (results filtered to confidence, cache_hit).
+
+        compute(threshold) runs the model; it is called on a miss with
+        min(floor, confidence), or with None when confidence is None (results
+        that do not depend on a threshold).
+        """
+        threshold = _to_threshold(confidence)
+        if self.max_bytes <= 0:
+            return compute(confidence), False
+        entry = self._get(key, threshold)
+        if entry is not None:
+            return filter_results(entry[1], threshold), True
+        run_at = None if threshold is None else min(self.floor, threshold)
+        results = compute(run_at)
+        if results is not None:
+            self._put(key, run_at, copy.deepcopy(results))
+        return filter_results(results, threshold), False
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            entries = len(self.entries)
+            used = self.bytes
+        lookups = c["hits"] + c["misses"]
+        c.update({
+            "entries": entries,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "floor": self.floor,
+            "hit_ratio": round(c["hits"] / lookups, 3) if lookups else 0.0,
+        })
+        return c
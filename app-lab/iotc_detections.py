@@ -0,0 +1,214 @@
+"""Detection post-processing shared by the vision apps.
+
+Every app used to carry its own normalize_results / build_slots /
+pick_top_result: a per-detection walk over the brick's dicts with fallback key
+lookups, then a full sort to find the top 4 for the class_name_N /
+confidence_N telemetry slots. parse_results() walks the dicts once and keeps
+the values as NumPy columns; everything after that is vectorized:
+
+- filter(): confidence threshold and class allow-list as one boolean mask,
+- top(): the k best by confidence via argpartition (only the k are sorted),
+- stats() / per_class(): count, max and mean confidence, overall and per class,
+- slots(): the class_name_N / confidence_N fields, padded with "" / 0.0.
+
+Brick results may be {"detection": [...]}, {"classification": [...]},
+{"anomalies": [...]} or a bare list; confidences may be under confidence,
+score, prob or p; boxes under bounding_box_xyxy, bbox (x, y, w, h) or x/y/w/h.
+The video bricks report {class_name: {"confidence": c}} or {class_name: c},
+which from_scores() reads.
+
+Usage in an app:
+    from iotc_detections import build_slots, parse_results
+    dets = parse_results(decoded.to_original(results))
+    send_telemetry({..., **dets.stats(), "detections_json": dets.items, **dets.slots()})
+"""
+
+import numpy as np
+
+CONFIDENCE_KEYS = ("confidence", "score", "prob", "p")
+CLASS_KEYS = ("class_name", "label")
+# Where the per-item lists live in the brick results
+RESULT_LISTS = ("detection", "classification", "anomalies")
+SLOTS = 4
+
+
+def confidence_of(item):
+    """First of CONFIDENCE_KEYS present in item, as a float (None if missing or not numeric)."""
+    if not isinstance(item, dict):
+        return None
+    for key in CONFIDENCE_KEYS:
+        if key in item:
+            try:
+                return float(item[key])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _result_list(results):
+    if isinstance(results, list):
+        return results
+    if isinstance(results, dict):
+        for key in RESULT_LISTS:
+            if isinstance(results.get(key), list):
+                return results[key]
+        # A single classification: {"class_name": ..., "confidence": ...}
+        if any(k in results for k in CLASS_KEYS) and confidence_of(results) is not None:
+            return [results]
+    return []
+
+
+def _normalize(item):
+    det = {}
+    conf = confidence_of(item)
+    if conf is not None:
+        det["confidence"] = conf
+    xyxy = item.get("bounding_box_xyxy")
+    bbox = item.get("bbox")
+    if isinstance(xyxy, (list, tuple)) and len(xyxy) >= 4:
+        x1, y1, x2, y2 = xyxy[:4]
+        det["x"] = x1
+        det["y"] = y1
+        det["w"] = max(0.0, x2 - x1)
+        det["h"] = max(0.0, y2 - y1)
+    elif isinstance(bbox, (list, tuple)) and len(bbox) >= 4:
+        det["x"], det["y"], det["w"], det["h"] = bbox[:4]
+    else:
+        for k in ("x", "y", "w", "h"):
+            if k in item:
+                det[k] = item[k]
+    for key in CLASS_KEYS:
+        if key in item:
+            det["class_name"] = item[key]
+            break
+    return det
+
+
+class Detections:
+    """Normalized detection dicts plus aligned confidence / class columns."""
+
+    __slots__ = ("items", "confidence", "classes")
+
+    def __init__(self, items, confidence=None, classes=None):
+        self.items = items
+        if confidence is None:
+            confidence = np.array([d.get("confidence", np.nan) for d in items], dtype=np.float64)
+        if classes is None:
+            classes = np.array([str(d.get("class_name", "")) for d in items], dtype=object)
+        self.confidence = confidence
+        self.classes = classes
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _take(self, index):
+        return Detections([self.items[i] for i in index], self.confidence[index], self.classes[index])
+
+    def filter(self, threshold=None, classes=None):
+        """Detections at or above threshold (missing confidences pass) and in classes."""
+        mask = np.ones(len(self.items), dtype=bool)
+        if threshold is not None:
+            mask &= ~(self.confidence < float(threshold))
+        if classes is not None:
+            mask &= np.isin(self.classes, np.array([str(c) for c in classes], dtype=object))
+        if mask.all():
+            return self
+        return self._take(np.flatnonzero(mask))
+
+    def top(self, k=SLOTS):
+        """The k most confident detections, best first; missing confidences rank as 0."""
+        n = len(self.items)
+        if n == 0 or k <= 0:
+            return self._take(np.zeros(0, dtype=np.int64))
+        scores = np.nan_to_num(self.confidence, nan=0.0)
+        if n > k:
+            index = np.argpartition(-scores, k - 1)[:k]
+        else:
+            index = np.arange(n)
+        index = index[np.argsort(-scores[index], kind="stable")]
+        return self._take(index)
+
+    def stats(self):
+        """detection_count / max_confidence / avg_confidence telemetry fields."""
+        known = self.confidence[~np.isnan(self.confidence)]
+        return {
+            "detection_count": len(self.items),
+            "max_confidence": float(known.max()) if known.size else 0.0,
+            "avg_confidence": float(known.mean()) if known.size else 0.0,
+        }
+
+    def per_class(self):
+        """{class_name: {"count", "max_confidence", "avg_confidence"}}."""
+        if not self.items:
+            return {}
+        names, inverse = np.unique(self.classes.astype(str), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(names))
+        known = ~np.isnan(self.confidence)
+        scores = np.where(known, self.confidence, 0.0)
+        known_counts = np.bincount(inverse, weights=known, minlength=len(names))
+        sums = np.bincount(inverse, weights=scores, minlength=len(names))
+        maxes = np.zeros(len(names))
+        np.maximum.at(maxes, inverse, scores)
+        summary = {}
+        for i, name in enumerate(names):
+            summary[str(name)] = {
+                "count": int(counts[i]),
+                "max_confidence": round(float(maxes[i]), 4),
+                "avg_confidence": round(float(sums[i] / known_counts[i]), 4) if known_counts[i] else 0.0,
+            }
+        return summary
+
+    def slots(self, k=SLOTS):
+        """class_name_1..k / confidence_1..k for the top k, padded with "" / 0.0."""
+        top = self.top(k)
+        slots = {}
+        for i in range(k):
+            if i < len(top):
+                conf = top.confidence[i]
+                slots[f"class_name_{i+1}"] = top.items[i].get("class_name", "")
+                slots[f"confidence_{i+1}"] = 0.0 if np.isnan(conf) else float(conf)
+            else:
+                slots[f"class_name_{i+1}"] = ""
+                slots[f"confidence_{i+1}"] = 0.0
+        return slots
+
+    def best(self):
+        """(class_name, confidence) of the most confident detection, (None, None) when empty."""
+        if not self.items:
+            return None, None
+        top = self.top(1)
+        conf = top.confidence[0]
+        return top.items[0].get("class_name"), None if np.isnan(conf) else float(conf)
+
+
+def parse_results(results):
+    """Detections from any of the brick result shapes (non-dict items are skipped)."""
+    return Detections([_normalize(item) for item in _result_list(results) if isinstance(item, dict)])
+
+
+def from_scores(scores):
+    """Detections from the video bricks' {class_name: {"confidence": c}} or {class_name: c}."""
+    items = []
+    for name, value in (scores or {}).items():
+        conf = confidence_of(value) if isinstance(value, dict) else value
+        try:
+            conf = float(conf if conf is not None else 0.0)
+        except (TypeError, ValueError):
+            conf = 0.0
+        items.append({"class_name": name, "confidence": conf})
+    return Detections(items)
+
+
+def normalize_results(results):
+    """List of {confidence, x, y, w, h, class_name} dicts (the parse_results items)."""
+    return parse_results(results).items
+
+
+def build_slots(detections, k=SLOTS):
+    """class_name_N / confidence_N fields from a Detections or a list of detection dicts."""
+    if not isinstance(detections, Detections):
+        detections = Detections(list(detections))
+    return detections.slots(k)
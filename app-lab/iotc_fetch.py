@@ -0,0 +1,374 @@
+"""Pooled, streaming image fetcher for the image_url paths.
+
+Replaces requests.get(image_url, timeout=10) in the apps:
+
+- One keep-alive requests.Session per process, so repeated fetches from the
+  same host skip DNS, TCP and TLS setup.
+- The body is streamed into a buffer preallocated from Content-Length, with a
+  hard cap (IOTC_FETCH_MAX_MB, default 16). Larger bodies are refused before
+  or while downloading instead of being buffered whole.
+- Responses with an ETag or Last-Modified are kept in an on-disk cache
+  (IOTC_FETCH_CACHE_DIR, default /tmp/iotc-fetch-cache, limited to
+  IOTC_FETCH_CACHE_MB, default 64) and revalidated with If-None-Match /
+  If-Modified-Since; a 304 is served from disk. When the cached body is gone
+  by then (pruned by another fetch), the image is fetched again without
+  validators; a 304 to that request is an error. A cache that cannot be
+  written (e.g. a full disk) is counted under cache_write_errors and the
+  fetched image is returned anyway.
+- Per-fetch timings: dns_ms, connect_ms (TCP + TLS), ttfb_ms (request start to
+  response headers) and total_ms. A reused connection reports 0 for dns/connect.
+  Aggregates are under "fetch" in /metrics.
+
+Usage in an app:
+    from iotc_fetch import FETCH_FIELDS, fetch_image, timing_fields
+    fetched = fetch_image(image_url)        # raises FetchError
+    image_bytes = fetched.content
+    send_telemetry({..., **timing_fields(fetched)})
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from iotc_profiling import register_source
+
+CHUNK_SIZE = 64 * 1024
+TIMING_FIELDS = ("dns_ms", "connect_ms", "ttfb_ms", "total_ms")
+# Telemetry fields from timing_fields(); only url frames carry them, so pass as
+# load_encoder(optional=...) to keep upload frames from reporting zeros.
+FETCH_FIELDS = tuple("fetch_" + name for name in TIMING_FIELDS)
+
+_local = threading.local()
+
+
+class FetchError(Exception):
+    def __init__(self, message, reason="error", status=None):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+
+
+class FetchResult:
+    __slots__ = ("url", "content", "status", "from_cache", "timings", "etag", "last_modified")
+
+    def __init__(self, url, content, status, from_cache, timings, etag=None, last_modified=None):
+        self.url = url
+        self.content = content
+        self.status = status
+        self.from_cache = from_cache
+        self.timings = timings
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+def _timings():
+    return getattr(_local, "timings", None)
+
+
+class _TimedConnectionMixin:
+    """Records DNS and connect time of new connections into the current fetch's timings."""
+
+    def _new_conn(self):
+        timings = _timings()
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            infos = []
+        resolved = time.perf_counter()
+        if timings is not None:
+            timings["dns_ms"] = (resolved - start) * 1000.0
+        if not infos:
+            # Let urllib3 raise its usual NameResolutionError
+            return super()._new_conn()
+
+        last_error = None
+        try:
+            for info in infos:
+                self._dns_host = info[4][0]
+                try:
+                    return super()._new_conn()
+                except Exception as e:
+                    last_error = e
+            raise last_error
+        finally:
+            self._dns_host = host
+
+    def connect(self):
+        timings = _timings()
+        start = time.perf_counter()
+        super().connect()
+        if timings is not None:
+            timings["connect_ms"] = (time.perf_counter() - start) * 1000.0 - timings.get("dns_ms", 0.0)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+class DiskCache:
+    """url -> (body, etag, last_modified) files, pruned oldest-first to max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        if max_bytes > 0:
+            os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + ".body", base + ".json"
+
+    def validators(self, url):
+        if self.max_bytes <= 0:
+            return None
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(body_path):
+            return None
+        return meta
+
+    def read(self, url):
+        body_path, _ = self._paths(url)
+        with open(body_path, "rb") as f:
+            data = f.read()
+        os.utime(body_path)
+        return data
+
+    def write(self, url, content, etag, last_modified):
+        if self.max_bytes <= 0 or len(content) > self.max_bytes or not (etag or last_modified):
+            return
+        body_path, meta_path = self._paths(url)
+        with self.lock:
+            tmp = body_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, body_path)
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"url": url, "etag": etag, "last_modified": last_modified, "size": len(content)}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            self._prune()
+
+    def _prune(self):
+        bodies = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".body"):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                bodies.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        for _, size, path in sorted(bodies):
+            if total <= self.max_bytes:
+                break
+            for victim in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+
+
+class ImageFetcher:
+    def __init__(self, max_bytes=None, timeout=10, cache_dir=None, cache_bytes=None, pool_size=4):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("IOTC_FETCH_MAX_MB", "16")) * 1024 * 1024)
+        if cache_dir is None:
+            cache_dir = os.environ.get("IOTC_FETCH_CACHE_DIR", "/tmp/iotc-fetch-cache")
+        if cache_bytes is None:
+            cache_bytes = int(float(os.environ.get("IOTC_FETCH_CACHE_MB", "64")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.cache = DiskCache(cache_dir, cache_bytes)
+        self.session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.counters = {
+            "fetches": 0,
+            "errors": 0,
+            "too_large": 0,
+            "not_modified": 0,
+            "cache_lost": 0,
+            "cache_write_errors": 0,
+            "new_connections": 0,
+            "bytes": 0,
+        }
+        self.totals = {name: 0.0 for name in TIMING_FIELDS}
+        self.max_total_ms = 0.0
+
+    def _read_body(self, resp):
+        length = resp.headers.get("Content-Length")
+        expected = int(length) if length and length.isdigit() else None
+        if expected is not None and expected > self.max_bytes:
+            raise FetchError(f"image is {expected} bytes, limit is {self.max_bytes}", "too_large", resp.status_code)
+
+        buf = bytearray(expected if expected is not None else CHUNK_SIZE)
+        view = memoryview(buf)
+        size = 0
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            end = size + len(chunk)
+            if end > self.max_bytes:
+                raise FetchError(f"image exceeds {self.max_bytes} bytes", "too_large", resp.status_code)
+            if end > len(buf):
+                # Unknown or wrong Content-Length (e.g. compressed transfer): grow geometrically
+                view.release()
+                buf.extend(bytes(max(end - len(buf), len(buf))))
+                view = memoryview(buf)
+            view[size:end] = chunk
+            size = end
+        view.release()
+        if size != len(buf):
+            del buf[size:]
+        return bytes(buf)
+
+    def fetch(self, url):
+        timings = {name: 0.0 for name in TIMING_FIELDS}
+        _local.timings = timings
+        headers = {}
+        cached = self.cache.validators(url)
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        start = time.perf_counter()
+        try:
+            # Second attempt only when a 304 arrives for a body that is no longer on disk
+            for attempt in (headers, {}):
+                resp = self.session.get(url, headers=attempt, timeout=self.timeout, stream=True)
+                timings["ttfb_ms"] = (time.perf_counter() - start) * 1000.0
+                with resp:
+                    if resp.status_code == 304 and cached and attempt:
+                        try:
+                            content = self.cache.read(url)
+                        except OSError:
+                            with self.lock:
+                                self.counters["cache_lost"] += 1
+                            cached = None
+                            continue
+                        from_cache = True
+                    else:
+                        resp.raise_for_status()
+                        if resp.status_code == 304:
+                            # Not modified, but there is no cached copy this request relied on
+                            raise FetchError("304 Not Modified without a cached copy", "http", 304)
+                        content = self._read_body(resp)
+                        from_cache = False
+                        try:
+                            self.cache.write(url, content, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+                        except OSError as e:
+                            with self.lock:
+                                self.counters["cache_write_errors"] += 1
+                            print(f"fetch cache write failed: {e}")
+                    status = resp.status_code
+                    etag = resp.headers.get("ETag") or (cached or {}).get("etag")
+                    last_modified = resp.headers.get("Last-Modified") or (cached or {}).get("last_modified")
+                break
+        except FetchError as e:
+            self._count(error=True, too_large=e.reason == "too_large")
+            raise
+        except requests.RequestException as e:
+            self._count(error=True)
+            status = e.response.status_code if e.response is not None else None
+            raise FetchError(str(e), "http", status) from e
+        finally:
+            _local.timings = None
+            timings["total_ms"] = (time.perf_counter() - start) * 1000.0
+
+        self._count(timings=timings, size=len(content), not_modified=from_cache)
+        return FetchResult(url, content, status, from_cache, timings, etag, last_modified)
+
+    def _count(self, timings=None, size=0, error=False, too_large=False, not_modified=False):
+        with self.lock:
+            self.counters["fetches"] += 1
+            if error:
+                self.counters["errors"] += 1
+            if too_large:
+                self.counters["too_large"] += 1
+            if not_modified:
+                self.counters["not_modified"] += 1
+            if timings is not None:
+                if timings["connect_ms"] or timings["dns_ms"]:
+                    self.counters["new_connections"] += 1
+                for name in TIMING_FIELDS:
+                    self.totals[name] += timings[name]
+                self.max_total_ms = max(self.max_total_ms, timings["total_ms"])
+            self.counters["bytes"] += size
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            totals = dict(self.totals)
+            max_total = self.max_total_ms
+        ok = c["fetches"] - c["errors"]
+        for name in TIMING_FIELDS:
+            c[f"{name}_mean"] = round(totals[name] / ok, 3) if ok else 0.0
+        c["total_ms_max"] = round(max_total, 3)
+        c["max_bytes"] = self.max_bytes
+        return c
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = ImageFetcher()
+                register_source("fetch", _fetcher.stats)
+    return _fetcher
+
+
+def fetch_image(url):
+    """Fetch url with the shared fetcher; raises FetchError."""
+    return get_fetcher().fetch(url)
+
+
+def timing_fields(result):
+    """FETCH_FIELDS telemetry for a FetchResult."""
+    return {"fetch_" + name: round(result.timings[name], 3) for name in TIMING_FIELDS}
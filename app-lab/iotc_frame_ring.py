@@ -0,0 +1,356 @@
+"""Shared-memory camera frame ring with consumer processes.
+
+In code-detector the camera brick hands every frame to on_frame(), which
+JPEG-encoded and base64-encoded it on the callback thread, competing for the
+GIL with detection, the relay and the web UI. FrameRing moves that work into
+separate processes:
+
+- the app copies each raw RGB frame into a multiprocessing.shared_memory ring
+  of IOTC_FRAME_RING_SLOTS slots (default 4) and bumps a sequence number;
+  that copy is all the capture callback does. Writing the same frame object
+  again (for a second consumer) does not copy it twice,
+- each consumer is a process running this file; write() wakes the ones that
+  want the frame through their stdin, and a consumer reads the newest frame
+  straight from shared memory (frames it was woken for but did not reach are
+  counted as dropped) and writes its result back on stdout, where a reader
+  thread hands it to the app's callback,
+- a slot carries the sequence number of the frame in it, set after the copy;
+  a consumer rechecks it after reading and discards a frame that was
+  overwritten meanwhile ("torn"),
+- consumer kinds: "jpeg" (JPEG bytes) and "preview" (the same, base64),
+  with options quality= and width= to scale the frame down.
+
+Capture FPS, per-consumer lag (frames behind the newest one it was woken
+for), dropped / torn frames and time spent working are under "frame_ring"
+in /metrics, and fields() returns
+capture_fps / consumer_lag / dropped_frames for telemetry. When shared memory
+or the worker cannot be started, start_consumer() returns None and the app
+keeps doing the work inline.
+
+Usage in an app:
+    from iotc_frame_ring import FrameRing
+    RING = FrameRing((640, 480))
+    PREVIEW = RING.start_consumer("preview", on_preview, quality=100)
+    if PREVIEW is None or not RING.write(frame, consumers=[PREVIEW]):
+        ...                               # encode inline as before
+
+Consumer process (started by start_consumer):
+    python3 iotc_frame_ring.py <shm name> <consumer index> <kind> [key=value ...]
+"""
+
+import atexit
+import base64
+import io
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from iotc_profiling import register_source
+except ImportError:    # consumer processes only need the ring
+    register_source = None
+
+FRAME_RING_FIELDS = ("capture_fps", "consumer_lag", "dropped_frames")
+MAX_CONSUMERS = 4
+
+# Header: control words, then per-slot sequence / width / height / timestamp,
+# then per-consumer counters written by the consumer process.
+_CONTROL = 4    # slots, slot_bytes, next_seq, reserved
+_CONSUMER = 5   # last_seq, frames, dropped, torn, work_us
+_RESULT = struct.Struct("<qdI")    # seq, frame timestamp, payload length
+
+
+def _layout(slots):
+    ints = _CONTROL + slots * 3 + MAX_CONSUMERS * _CONSUMER
+    header = ints * 8 + slots * 8
+    return ints, header
+
+
+def _attach(name):
+    """Open an existing segment without letting this process's resource tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:    # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def _read_exact(stream, size):
+    """size bytes from a raw pipe, or b"" at end of stream."""
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            return b""
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class _Segment:
+    """NumPy views of a ring segment (both sides use this)."""
+
+    def __init__(self, shm, slots=None, slot_bytes=None):
+        self.shm = shm
+        if slots is None:
+            slots, slot_bytes = (int(v) for v in np.ndarray(2, dtype=np.int64, buffer=shm.buf))
+        ints, header = _layout(slots)
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        words = np.ndarray(ints, dtype=np.int64, buffer=shm.buf)
+        self.control = words[:_CONTROL]
+        self.seq = words[_CONTROL:_CONTROL + slots]
+        self.width = words[_CONTROL + slots:_CONTROL + 2 * slots]
+        self.height = words[_CONTROL + 2 * slots:_CONTROL + 3 * slots]
+        self.consumers = words[_CONTROL + 3 * slots:].reshape(MAX_CONSUMERS, _CONSUMER)
+        self.stamp = np.ndarray(slots, dtype=np.float64, buffer=shm.buf, offset=ints * 8)
+        self.data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=shm.buf, offset=header)
+
+    def frame(self, slot):
+        """Zero-copy (height, width, 3) view of a slot."""
+        w, h = int(self.width[slot]), int(self.height[slot])
+        return self.data[slot, :w * h * 3].reshape(h, w, 3)
+
+
+class FrameRing:
+    def __init__(self, size=(640, 480), slots=None, name="frame_ring"):
+        if slots is None:
+            slots = int(os.environ.get("IOTC_FRAME_RING_SLOTS", "4"))
+        slots = max(2, slots)
+        slot_bytes = size[0] * size[1] * 3
+        self.shm = None
+        self.segment = None
+        try:
+            self.shm = shared_memory.SharedMemory(create=True, size=_layout(slots)[1] + slots * slot_bytes)
+            self.segment = _Segment(self.shm, slots, slot_bytes)
+            self.segment.control[:] = (slots, slot_bytes, 0, 0)
+            self.segment.seq[:] = -1
+            self.segment.consumers[:] = 0
+            self.segment.consumers[:, 0] = -1
+            atexit.register(self.close)
+        except Exception as e:
+            print(f"frame ring unavailable: {e}")
+        self.lock = threading.Lock()
+        self.workers = []
+        self.last_write = None
+        self.last_frame = None    # (frame object, seq) of the latest write
+        self.interval = None    # smoothed seconds between frames
+        self.counters = {"written": 0, "oversize": 0, "results": 0, "worker_errors": 0}
+        if register_source is not None:
+            register_source(name, self.stats)
+
+    def start_consumer(self, kind, on_result, **options):
+        """Start a consumer process; on_result(seq, stamp, payload bytes) runs on a reader thread."""
+        if self.segment is None or len(self.workers) >= MAX_CONSUMERS:
+            return None
+        index = len(self.workers)
+        args = [sys.executable, os.path.abspath(__file__), self.shm.name, str(index), kind]
+        args += [f"{k}={v}" for k, v in options.items()]
+        try:
+            proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        except Exception as e:
+            print(f"frame ring consumer {kind} failed to start: {e}")
+            return None
+        os.set_blocking(proc.stdin.fileno(), False)
+        worker = {"kind": kind, "index": index, "proc": proc, "asked": -1, "lost_wakes": 0}
+        self.workers.append(worker)
+        threading.Thread(target=self._read_results, args=(worker, on_result),
+                         name=f"iotc-frame-ring-{kind}", daemon=True).start()
+        return worker
+
+    def write(self, frame, now=None, consumers=None):
+        """Copy one PIL frame into the next slot and wake consumers (default: all); False if it did not fit."""
+        now = time.time() if now is None else now
+        seg = self.segment
+        if seg is None:
+            return False
+        with self.lock:
+            if self.last_frame is not None and self.last_frame[0] is frame:
+                seq = self.last_frame[1]
+            else:
+                seq = self._copy(seg, frame, now)
+        if seq is None:
+            return False
+        for worker in self.workers if consumers is None else consumers:
+            worker["asked"] = seq
+            try:
+                worker["proc"].stdin.write(b"\x01")
+            except BlockingIOError:
+                worker["lost_wakes"] += 1    # pipe full: the consumer is far behind
+            except OSError:
+                pass
+        return True
+
+    def _copy(self, seg, frame, now):
+        # Called with self.lock held; returns the frame's seq, or None if it does not fit
+        image = frame if frame.mode == "RGB" else frame.convert("RGB")
+        w, h = image.size
+        if w * h * 3 > seg.slot_bytes:
+            self.counters["oversize"] += 1
+            return None
+        seq = int(seg.control[2])
+        slot = seq % seg.slots
+        seg.seq[slot] = -1    # being written
+        seg.width[slot] = w
+        seg.height[slot] = h
+        seg.stamp[slot] = now
+        seg.data[slot, :w * h * 3] = np.frombuffer(image.tobytes(), dtype=np.uint8)
+        seg.seq[slot] = seq
+        seg.control[2] = seq + 1
+        self.counters["written"] += 1
+        if self.last_write is not None:
+            gap = now - self.last_write
+            self.interval = gap if self.interval is None else self.interval * 0.9 + gap * 0.1
+        self.last_write = now
+        self.last_frame = (frame, seq)
+        return seq
+
+    def _read_results(self, worker, on_result):
+        out = worker["proc"].stdout
+        while True:
+            head = _read_exact(out, _RESULT.size)
+            if not head:
+                break
+            seq, stamp, length = _RESULT.unpack(head)
+            payload = _read_exact(out, length)
+            if len(payload) != length:
+                break
+            with self.lock:
+                self.counters["results"] += 1
+            try:
+                on_result(seq, stamp, payload)
+            except Exception as e:
+                print(f"frame ring {worker['kind']} callback failed: {e}")
+        with self.lock:
+            self.counters["worker_errors"] += 1
+        print(f"frame ring consumer {worker['kind']} exited ({worker['proc'].poll()})")
+
+    def fields(self):
+        """FRAME_RING_FIELDS telemetry (worst consumer)."""
+        stats = self.stats()
+        consumers = stats["consumers"].values()
+        return {
+            "capture_fps": stats["capture_fps"],
+            "consumer_lag": max((c["lag"] for c in consumers), default=0),
+            "dropped_frames": sum(c["dropped"] for c in consumers),
+        }
+
+    def stats(self):
+        seg = self.segment
+        with self.lock:
+            c = dict(self.counters)
+            c["capture_fps"] = round(1.0 / self.interval, 2) if self.interval else 0.0
+        c["enabled"] = seg is not None
+        consumers = {}
+        if seg is not None:
+            newest = int(seg.control[2]) - 1
+            c["slots"] = seg.slots
+            c["ring_bytes"] = seg.shm.size
+            for worker in self.workers:
+                last, frames, dropped, torn, work_us = (int(v) for v in seg.consumers[worker["index"]])
+                consumers[worker["kind"]] = {
+                    "frames": frames,
+                    "dropped": dropped + worker["lost_wakes"],
+                    "torn": torn,
+                    "work_ms": round(work_us / 1000.0, 3),
+                    "mean_work_ms": round(work_us / 1000.0 / frames, 3) if frames else 0.0,
+                    "lag": max(0, worker["asked"] - last),
+                    "alive": worker["proc"].poll() is None,
+                }
+        c["consumers"] = consumers
+        return c
+
+    def close(self):
+        for worker in self.workers:
+            try:
+                worker["proc"].stdin.close()
+            except OSError:
+                pass
+        if self.shm is not None:
+            self.shm.close()
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _jpeg(frame, options):
+    from PIL import Image
+    image = Image.fromarray(frame, "RGB")
+    width = int(options.get("width", 0))
+    if width and image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=int(options.get("quality", 100)))
+    return buffer.getvalue()
+
+
+def _preview(frame, options):
+    return base64.b64encode(_jpeg(frame, options))
+
+
+CONSUMERS = {"jpeg": _jpeg, "preview": _preview}
+
+
+def _consume(name, index, kind, options):
+    work = CONSUMERS[kind]
+    shm = _attach(name)
+    seg = _Segment(shm)
+    counters = seg.consumers[index]
+    wake = sys.stdin.buffer
+    out = sys.stdout.buffer
+    while True:
+        wakes = wake.read1(4096)
+        if not wakes:
+            break
+        newest = int(seg.control[2]) - 1
+        if newest <= int(counters[0]):
+            continue    # already done (the same frame written for another consumer)
+        # Every wake-up asked for a frame; only the newest one gets done
+        counters[2] += len(wakes) - 1
+        counters[0] = newest
+        slot = newest % seg.slots
+        stamp = float(seg.stamp[slot])
+        if int(seg.seq[slot]) != newest:
+            counters[3] += 1
+            continue
+        start = time.perf_counter()
+        payload = work(seg.frame(slot), options)
+        counters[4] += int((time.perf_counter() - start) * 1e6)
+        if int(seg.seq[slot]) != newest:
+            counters[3] += 1    # overwritten while we read it
+            continue
+        counters[1] += 1
+        out.write(_RESULT.pack(newest, stamp, len(payload)))
+        out.write(payload)
+        out.flush()
+
+
+def main():
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(2)
+    options = dict(arg.split("=", 1) for arg in sys.argv[4:])
+    try:
+        _consume(sys.argv[1], int(sys.argv[2]), sys.argv[3], options)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
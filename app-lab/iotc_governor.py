@@ -0,0 +1,177 @@
+"""Frame-rate governor for the video apps.
+
+The video bricks call back at whatever rate they run, and in a busy scene the
+per-frame work in the app (UI messages, telemetry) competes with the relay,
+the web UI and other apps for the UNO Q's CPU. RateGovernor sits in the
+on_detect_all callback after the tracker and window updates, which are cheap
+and must see every frame to keep their counts right:
+
+- admit() is a credit counter: each callback adds fps_limit x (time since the
+  previous one) of credit and a frame is processed only when a whole credit is
+  there; at most one credit carries over, so after a quiet spell no more than
+  two frames pass back to back. Excess frames are skipped evenly,
+- every IOTC_GOVERNOR_SEC (default 1) it samples this process's CPU use
+  (psutil when installed, os.times() otherwise) and the callback
+  inter-arrival rate. Above IOTC_CPU_BUDGET (percent of one core, default 50)
+  fps_limit drops by a fifth, down to IOTC_VIDEO_MIN_FPS (default 1); below
+  80 % of the budget it grows by a tenth, up to IOTC_VIDEO_FPS (default 10),
+- fields() reports incoming_fps, achieved_fps, skipped_frames (since the last
+  call), process_cpu and fps_limit for the interval telemetry; totals are
+  under "governor" in /metrics.
+
+The brick itself keeps its own rate: it has no setting for it, so what is
+governed is the UI and telemetry work this process does per frame. A skipped
+frame has already been through inference in the brick; skipped_frames counts
+the frames whose UI messages and telemetry were left out, not inference saved.
+The governor is the only limit on that work: the apps build their UIStream
+with fps=0 so admitted frames go out inline instead of being capped a second
+time by IOTC_UI_FPS.
+
+Usage in an app:
+    from iotc_governor import RateGovernor
+    GOVERNOR = RateGovernor()
+    def send_detections_to_ui(detections):
+        TRACKER.update(detections)        # statistics first, on every frame
+        if not GOVERNOR.admit():
+            return
+        STREAM.publish(dets)              # STREAM = UIStream(ui, fps=0)
+    payload.update(GOVERNOR.fields())
+"""
+
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from iotc_profiling import register_source
+
+GOVERNOR_FIELDS = ("incoming_fps", "achieved_fps", "skipped_frames", "process_cpu", "fps_limit")
+
+
+class _CpuMeter:
+    """Process CPU percent (of one core) since the previous sample."""
+
+    def __init__(self):
+        self.process = psutil.Process() if psutil is not None else None
+        if self.process is not None:
+            self.process.cpu_percent(None)
+        self.last_wall = time.monotonic()
+        self.last_cpu = self._cpu_seconds()
+
+    def _cpu_seconds(self):
+        t = os.times()
+        return t.user + t.system
+
+    def sample(self):
+        if self.process is not None:
+            return self.process.cpu_percent(None)
+        wall = time.monotonic()
+        cpu = self._cpu_seconds()
+        elapsed = wall - self.last_wall
+        percent = (cpu - self.last_cpu) / elapsed * 100.0 if elapsed > 0 else 0.0
+        self.last_wall, self.last_cpu = wall, cpu
+        return percent
+
+
+class RateGovernor:
+    def __init__(self, target_fps=None, cpu_budget=None, min_fps=None, adjust_sec=None, name="governor"):
+        if target_fps is None:
+            target_fps = float(os.environ.get("IOTC_VIDEO_FPS", "10"))
+        if cpu_budget is None:
+            cpu_budget = float(os.environ.get("IOTC_CPU_BUDGET", "50"))
+        if min_fps is None:
+            min_fps = float(os.environ.get("IOTC_VIDEO_MIN_FPS", "1"))
+        if adjust_sec is None:
+            adjust_sec = float(os.environ.get("IOTC_GOVERNOR_SEC", "1"))
+        self.target_fps = max(0.1, target_fps)
+        self.min_fps = max(0.1, min(min_fps, self.target_fps))
+        self.cpu_budget = cpu_budget
+        self.adjust_sec = max(0.1, adjust_sec)
+        self.fps_limit = self.target_fps
+        self.lock = threading.Lock()
+        self.cpu = _CpuMeter()
+        self.credit = 1.0
+        self.last_arrival = None
+        self.window_start = time.monotonic()
+        self.window_in = 0
+        self.window_out = 0
+        self.incoming_fps = 0.0
+        self.achieved_fps = 0.0
+        self.process_cpu = 0.0
+        self.skipped_since_report = 0
+        self.counters = {"frames": 0, "admitted": 0, "skipped": 0, "slowdowns": 0, "speedups": 0}
+        register_source(name, self.stats)
+
+    def admit(self, now=None):
+        """Whether to process this callback's frame."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.counters["frames"] += 1
+            self.window_in += 1
+            if self.last_arrival is not None:
+                self.credit += self.fps_limit * (now - self.last_arrival)
+            self.last_arrival = now
+            admitted = self.credit >= 1.0
+            if admitted:
+                self.credit = min(1.0, self.credit - 1.0)
+                self.counters["admitted"] += 1
+                self.window_out += 1
+            else:
+                self.counters["skipped"] += 1
+                self.skipped_since_report += 1
+            if now - self.window_start >= self.adjust_sec:
+                self._adjust(now)
+        return admitted
+
+    def _adjust(self, now):
+        elapsed = now - self.window_start
+        self.incoming_fps = self.window_in / elapsed
+        self.achieved_fps = self.window_out / elapsed
+        self.window_start = now
+        self.window_in = 0
+        self.window_out = 0
+        self.process_cpu = self.cpu.sample()
+        if self.process_cpu > self.cpu_budget and self.fps_limit > self.min_fps:
+            self.fps_limit = max(self.min_fps, self.fps_limit * 0.8)
+            self.counters["slowdowns"] += 1
+        elif self.process_cpu < self.cpu_budget * 0.8 and self.fps_limit < self.target_fps:
+            self.fps_limit = min(self.target_fps, self.fps_limit * 1.1)
+            self.counters["speedups"] += 1
+
+    def fields(self):
+        """GOVERNOR_FIELDS telemetry; skipped_frames counts since the previous call.
+
+        A skipped frame was still inferred by the brick; only its UI and
+        telemetry work was skipped.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.adjust_sec:
+                # No callbacks lately: report the quiet period, not the last busy one
+                self._adjust(now)
+            skipped, self.skipped_since_report = self.skipped_since_report, 0
+            return {
+                "incoming_fps": round(self.incoming_fps, 2),
+                "achieved_fps": round(self.achieved_fps, 2),
+                "skipped_frames": skipped,
+                "process_cpu": round(self.process_cpu, 1),
+                "fps_limit": round(self.fps_limit, 2),
+            }
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c.update({
+                "fps_limit": round(self.fps_limit, 2),
+                "target_fps": self.target_fps,
+                "cpu_budget": self.cpu_budget,
+                "incoming_fps": round(self.incoming_fps, 2),
+                "achieved_fps": round(self.achieved_fps, 2),
+                "process_cpu": round(self.process_cpu, 1),
+                "cpu_source": "psutil" if psutil is not None else "os.times",
+            })
+        return c
@@ -0,0 +1,232 @@
+"""Bounded inference executor for the image apps.
+
+The WebUI and relay threads only parse the request and call submit(); decode,
+inference, drawing and encoding run on a fixed number of worker threads.
+
+- Admission control: a bounded queue. When it is full, or when the images
+  already admitted (queued + running) exceed the in-flight byte cap, submit()
+  raises BusyError right away instead of piling up work.
+- A job can add to its byte charge while it runs with charge(), e.g. the
+  decoded size once the image header is known. Over the cap, charge() raises
+  BusyError inside the job.
+- queue_ms() gives the running job how long it waited, for telemetry.
+- stats() (also under "inference" in /metrics) reports depth, rejections,
+  in-flight bytes and queue/run times.
+
+Environment overrides: IOTC_INFER_WORKERS (default 1), IOTC_INFER_QUEUE
+(default 4), IOTC_INFER_MAX_MB (default 64).
+
+Usage in an app:
+    from iotc_inference import BusyError, InferenceExecutor, charge, queue_ms
+    INFERENCE = InferenceExecutor()
+
+    def on_detect_objects(client_id, data):
+        try:
+            INFERENCE.submit(run_detect_objects, client_id, data, cost_bytes=len(data.get("image") or ""))
+        except BusyError as e:
+            ui.send_message("detection_error", {"error": "busy", "reason": e.reason})
+"""
+
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+from iotc_profiling import register_source
+
+
+class BusyError(Exception):
+    """The executor cannot admit more work right now."""
+
+    def __init__(self, reason, queue_depth=0, in_flight_bytes=0):
+        super().__init__(f"busy: {reason}")
+        self.reason = reason
+        self.queue_depth = queue_depth
+        self.in_flight_bytes = in_flight_bytes
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "cost", "enqueued", "started")
+
+    def __init__(self, fn, args, kwargs, cost):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.cost = cost
+        self.enqueued = time.monotonic()
+        self.started = None
+
+
+_local = threading.local()
+
+
+class InferenceExecutor:
+    def __init__(self, workers=None, queue_size=None, max_inflight_bytes=None, name="inference"):
+        if workers is None:
+            workers = int(os.environ.get("IOTC_INFER_WORKERS", "1"))
+        if queue_size is None:
+            queue_size = int(os.environ.get("IOTC_INFER_QUEUE", "4"))
+        if max_inflight_bytes is None:
+            max_inflight_bytes = int(float(os.environ.get("IOTC_INFER_MAX_MB", "64")) * 1024 * 1024)
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_inflight_bytes = max_inflight_bytes
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.lock = threading.Lock()
+        # Notified when a job leaves the queue or finishes, for blocking submit()
+        self.changed = threading.Condition(self.lock)
+        self.in_flight_bytes = 0
+        self.running = 0
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected_queue_full": 0,
+            "rejected_bytes": 0,
+            "peak_in_flight_bytes": 0,
+            "queue_ms_total": 0.0,
+            "queue_ms_max": 0.0,
+            "run_ms_total": 0.0,
+            "run_ms_max": 0.0,
+        }
+        self.threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        register_source(name, self.stats)
+
+    def _over_budget(self, nbytes, own=0):
+        # Caller holds self.lock. A job is always admitted when nothing else is
+        # in flight, so one large image cannot be rejected forever.
+        others = self.in_flight_bytes - own
+        return bool(nbytes) and others > 0 and self.in_flight_bytes + nbytes > self.max_inflight_bytes
+
+    def _reserve(self, nbytes, own=0):
+        # Caller holds self.lock.
+        if self._over_budget(nbytes, own):
+            self.counters["rejected_bytes"] += 1
+            raise BusyError("bytes", self.queue.qsize(), self.in_flight_bytes)
+        self.in_flight_bytes += nbytes
+        if self.in_flight_bytes > self.counters["peak_in_flight_bytes"]:
+            self.counters["peak_in_flight_bytes"] = self.in_flight_bytes
+
+    def submit(self, fn, *args, cost_bytes=0, block=False, **kwargs):
+        """Queue fn(*args, **kwargs); returns a Future or raises BusyError.
+
+        With block=True the caller waits for room instead (for batch producers;
+        never call it from a worker of the same executor).
+        """
+        job = _Job(fn, args, kwargs, int(cost_bytes or 0))
+        with self.lock:
+            while True:
+                if self._over_budget(job.cost):
+                    reason = "bytes"
+                elif self.queue.full():
+                    reason = "queue_full"
+                else:
+                    break
+                if not block:
+                    self.counters[f"rejected_{reason}"] += 1
+                    raise BusyError(reason, self.queue.qsize(), self.in_flight_bytes)
+                self.changed.wait()
+            self._reserve(job.cost)
+            job.enqueued = time.monotonic()
+            # Only workers take from the queue, and they never add to it: room seen above stays
+            self.queue.put_nowait(job)
+            self.counters["submitted"] += 1
+        return job.future
+
+    def charge(self, job, nbytes):
+        with self.lock:
+            self._reserve(nbytes, own=job.cost)
+            job.cost += nbytes
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            job.started = time.monotonic()
+            waited_ms = (job.started - job.enqueued) * 1000.0
+            with self.lock:
+                self.running += 1
+                self.changed.notify_all()
+                self.counters["queue_ms_total"] += waited_ms
+                self.counters["queue_ms_max"] = max(self.counters["queue_ms_max"], waited_ms)
+            _local.job = job
+            _local.executor = self
+            ok = False
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                    ok = True
+            except BaseException as e:
+                job.future.set_exception(e)
+                if not isinstance(e, BusyError):
+                    print(f"{self.name} job failed: {e}")
+                    print(traceback.format_exc())
+            finally:
+                _local.job = None
+                _local.executor = None
+                run_ms = (time.monotonic() - job.started) * 1000.0
+                with self.lock:
+                    self.running -= 1
+                    self.in_flight_bytes -= job.cost
+                    self.counters["completed" if ok else "failed"] += 1
+                    self.counters["run_ms_total"] += run_ms
+                    self.counters["run_ms_max"] = max(self.counters["run_ms_max"], run_ms)
+                    self.changed.notify_all()
+                self.queue.task_done()
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            running = self.running
+            in_flight_bytes = self.in_flight_bytes
+        finished = c["completed"] + c["failed"]
+        started = finished + running
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue.maxsize,
+            "queue_depth": self.queue.qsize(),
+            "running": running,
+            "in_flight_bytes": in_flight_bytes,
+            "max_in_flight_bytes": self.max_inflight_bytes,
+            "peak_in_flight_bytes": c["peak_in_flight_bytes"],
+            "submitted": c["submitted"],
+            "completed": c["completed"],
+            "failed": c["failed"],
+            "rejected_queue_full": c["rejected_queue_full"],
+            "rejected_bytes": c["rejected_bytes"],
+            "queue_ms_mean": round(c["queue_ms_total"] / started, 3) if started else 0.0,
+            "queue_ms_max": round(c["queue_ms_max"], 3),
+            "run_ms_mean": round(c["run_ms_total"] / finished, 3) if finished else 0.0,
+            "run_ms_max": round(c["run_ms_max"], 3),
+        }
+
+
+def queue_ms():
+    """Milliseconds the current job waited in the queue (0 outside a job)."""
+    job = getattr(_local, "job", None)
+    if job is None or job.started is None:
+        return 0.0
+    return (job.started - job.enqueued) * 1000.0
+
+
+def charge(nbytes):
+    """Add nbytes to the current job's in-flight charge; raises BusyError over the cap."""
+    job = getattr(_local, "job", None)
+    executor = getattr(_local, "executor", None)
+    if job is None or executor is None or nbytes <= 0:
+        return
+    executor.charge(job, int(nbytes))
+
+
+def decoded_size(image):
+    """Bytes a PIL image takes once decoded (known from the header, before load())."""
+    return image.width * image.height * len(image.getbands())
@@ -0,0 +1,155 @@
+"""Queue-backed logging for the IOTCONNECT hot paths.
+
+print() on every telemetry frame formats the payload and blocks on the terminal
+write in the caller's thread. Loggers from get_logger() instead hand the raw
+record to a bounded queue; a single background thread formats and writes it.
+
+- Levels: IOTC_LOG_LEVEL=DEBUG|INFO|WARNING (default INFO). Debug output such
+  as raw model results costs one level check when disabled.
+- Lazy formatting: use logger.info("x=%s", obj), not f-strings. Arguments are
+  formatted by the writer thread, so do not mutate them after logging.
+- Per-key sampling: log_telemetry() logs 1 in N successful sends for a key.
+  N comes from IOTC_LOG_SAMPLE ("telemetry=10,ui=50") or configure(). Failed
+  sends are always logged.
+- If the queue is full (stdout stuck), records are dropped and counted instead
+  of blocking the app.
+"""
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+DEFAULT_FORMAT = "%(levelname)s [%(name)s] %(message)s"
+QUEUE_SIZE = 1000
+
+_lock = threading.Lock()
+_listener = None
+_handler = None
+_level = "INFO"
+_sample_every = {}
+_counters = {}
+
+
+def _parse_samples(spec):
+    samples = {}
+    for item in (spec or "").split(","):
+        key, _, every = item.partition("=")
+        if key.strip() and every.strip():
+            try:
+                samples[key.strip()] = max(1, int(every))
+            except ValueError:
+                pass
+    return samples
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread and never blocks."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The writer thread is still draining, so a blocking put is safe here.
+        self.queue.put(self._sentinel)
+
+
+def _ensure_started(fmt=None, stream=None):
+    global _listener, _handler
+    with _lock:
+        if _handler is not None:
+            return _handler
+        q = queue.Queue(maxsize=QUEUE_SIZE)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(logging.Formatter(fmt or DEFAULT_FORMAT))
+        _handler = _LazyQueueHandler(q)
+        _listener = _Listener(q, output, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown)
+        _sample_every.update(_parse_samples(os.environ.get("IOTC_LOG_SAMPLE")))
+        return _handler
+
+
+def _effective_level():
+    return os.environ.get("IOTC_LOG_LEVEL", _level).upper()
+
+
+def configure(level=None, sample=None, fmt=None, stream=None):
+    """Optional explicit setup from app code. IOTC_LOG_LEVEL / IOTC_LOG_SAMPLE still win."""
+    global _level
+    _ensure_started(fmt=fmt, stream=stream)
+    if sample:
+        from_env = _parse_samples(os.environ.get("IOTC_LOG_SAMPLE"))
+        for key, every in sample.items():
+            if key not in from_env:
+                _sample_every[key] = max(1, int(every))
+                _counters.pop(key, None)
+    if level is not None:
+        _level = logging.getLevelName(level) if isinstance(level, int) else str(level)
+        for logger in _loggers():
+            logger.setLevel(_effective_level())
+
+
+def _loggers():
+    manager = logging.Logger.manager
+    return [
+        lg for lg in manager.loggerDict.values()
+        if isinstance(lg, logging.Logger) and _handler in lg.handlers
+    ]
+
+
+def get_logger(name):
+    handler = _ensure_started()
+    logger = logging.getLogger(f"iotc.{name}")
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger.setLevel(_effective_level())
+    return logger
+
+
+def sampled(key):
+    """True for 1 in N calls for this key (N from configure()/IOTC_LOG_SAMPLE, default 1)."""
+    every = _sample_every.get(key, 1)
+    if every <= 1:
+        return True
+    counter = _counters.get(key)
+    if counter is None:
+        counter = _counters.setdefault(key, itertools.count())
+    return next(counter) % every == 0
+
+
+def log_telemetry(logger, payload, ok=True, key="telemetry"):
+    """Replacement for print("IOTCONNECT send:", payload) + print("IOTCONNECT send result:", ok)."""
+    if ok is False:
+        logger.warning("IOTCONNECT send failed: %s", payload)
+    elif sampled(key) and logger.isEnabledFor(logging.INFO):
+        logger.info("IOTCONNECT send: %s", payload)
+
+
+def dropped():
+    return _handler.dropped if _handler is not None else 0
+
+
+def shutdown():
+    global _listener
+    listener = _listener
+    _listener = None
+    if listener is not None:
+        listener.stop()
@@ -0,0 +1,163 @@
+"""Throttled live camera preview for code-detector.
+
+on_frame() used to JPEG-encode every camera frame at quality 100, base64 it
+and broadcast it, whether or not a browser was open. PreviewStream decides
+per frame whether a preview is wanted at all:
+
+- with no UI connection (tracked through ui.on_connect / ui.on_disconnect)
+  nothing is encoded,
+- at most IOTC_PREVIEW_FPS frames a second are encoded (default 5); the
+  frames in between are skipped,
+- frames are scaled down to IOTC_PREVIEW_WIDTH (default 640) and encoded at
+  IOTC_PREVIEW_QUALITY (default 80),
+- encoding happens in the FrameRing "preview" process when a ring is given,
+  otherwise on one background thread; either way the newest frame wins, so a
+  slow encoder sends the current scene, not a backlog.
+
+Frames offered / skipped, encode time and bytes a second (last 10 s) are
+under "preview" in /metrics.
+
+Usage in an app:
+    from iotc_preview import PreviewStream
+    PREVIEW = PreviewStream(ui, RING)
+    ui.on_connect(PREVIEW.on_connect)
+    ui.on_disconnect(PREVIEW.on_disconnect)
+    PREVIEW.offer(frame)                  # in on_frame
+"""
+
+import base64
+import collections
+import io
+import os
+import threading
+import time
+from datetime import datetime, UTC
+
+from iotc_profiling import register_source
+
+RATE_WINDOW_SEC = 10.0
+
+
+class PreviewStream:
+    def __init__(self, ui, ring=None, fps=None, width=None, quality=None, message_type="frame_detected",
+                 name="preview"):
+        if fps is None:
+            fps = float(os.environ.get("IOTC_PREVIEW_FPS", "5"))
+        if width is None:
+            width = int(os.environ.get("IOTC_PREVIEW_WIDTH", "640"))
+        if quality is None:
+            quality = int(os.environ.get("IOTC_PREVIEW_QUALITY", "80"))
+        self.ui = ui
+        self.ring = ring
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.width = max(16, width)
+        self.quality = quality
+        self.message_type = message_type
+        self.lock = threading.Condition()
+        self.viewers = set()
+        self.next_due = 0.0
+        self.pending = None    # (frame, stamp) for the inline encoder
+        self.thread = None
+        self.sent = collections.deque()    # (time, bytes) over the last RATE_WINDOW_SEC
+        self.encode_ms = 0.0
+        self.counters = {"offered": 0, "no_viewers": 0, "throttled": 0, "coalesced": 0, "encoded": 0,
+                         "sent": 0, "bytes": 0}
+        self.consumer = None
+        if ring is not None:
+            self.consumer = ring.start_consumer("preview", self._from_ring, quality=quality, width=self.width)
+        register_source(name, self.stats)
+
+    def on_connect(self, sid, data=None):
+        with self.lock:
+            self.viewers.add(sid)
+
+    def on_disconnect(self, sid, data=None):
+        with self.lock:
+            self.viewers.discard(sid)
+
+    def offer(self, frame, now=None):
+        """Hand over one camera frame; encoded only when someone watches and the rate allows."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.counters["offered"] += 1
+            if not self.viewers:
+                self.counters["no_viewers"] += 1
+                return
+            if now < self.next_due:
+                self.counters["throttled"] += 1
+                return
+            # Keep the cadence, but do not bank time from a quiet spell
+            self.next_due = max(self.next_due + self.interval, now + self.interval * 0.5)
+        if self.consumer is not None and self.ring.write(frame, now, consumers=[self.consumer]):
+            return
+        with self.lock:
+            if self.pending is not None:
+                self.counters["coalesced"] += 1
+            self.pending = (frame, now)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._encode_loop, name="iotc-preview", daemon=True)
+                self.thread.start()
+            self.lock.notify()
+
+    def _encode_loop(self):
+        while True:
+            with self.lock:
+                while self.pending is None:
+                    self.lock.wait()
+                (frame, stamp), self.pending = self.pending, None
+            start = time.perf_counter()
+            image = frame.convert("RGB")
+            if image.width > self.width:
+                image = image.resize((self.width, max(1, round(image.height * self.width / image.width))))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality)
+            b64_frame = base64.b64encode(buffer.getbuffer())
+            with self.lock:
+                self.encode_ms += (time.perf_counter() - start) * 1000.0
+                self.counters["encoded"] += 1
+            self._send(stamp, b64_frame)
+
+    def _from_ring(self, seq, stamp, b64_frame):
+        self._send(stamp, b64_frame)
+
+    def _send(self, stamp, b64_frame):
+        entry = {
+            "timestamp": datetime.fromtimestamp(stamp, UTC).isoformat(),
+            "image": b64_frame.decode("ascii"),
+            "image_type": "image/jpeg",
+        }
+        try:
+            self.ui.send_message(self.message_type, entry)
+        except Exception as e:
+            print(f"preview send failed: {e}")
+            return
+        now = time.time()
+        with self.lock:
+            self.counters["sent"] += 1
+            self.counters["bytes"] += len(b64_frame)
+            self.sent.append((now, len(b64_frame)))
+            while self.sent and now - self.sent[0][0] > RATE_WINDOW_SEC:
+                self.sent.popleft()
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            now = time.time()
+            recent = sum(size for t, size in self.sent if now - t <= RATE_WINDOW_SEC)
+            c["viewers"] = len(self.viewers)
+            c["bytes_per_sec"] = round(recent / RATE_WINDOW_SEC, 1)
+            encoded = c["encoded"]
+            encode_ms = self.encode_ms
+        if self.consumer is not None:
+            # Encoded in the ring's consumer process
+            ring = self.ring.stats()["consumers"].get("preview", {})
+            encoded = ring.get("frames", 0)
+            encode_ms = ring.get("work_ms", 0.0)
+            c["encoded"] = encoded
+        c["encode_ms"] = round(encode_ms, 3)
+        c["mean_encode_ms"] = round(encode_ms / encoded, 3) if encoded else 0.0
+        c["fps_cap"] = round(1.0 / self.interval, 3) if self.interval else 0.0
+        c["width"] = self.width
+        c["quality"] = self.quality
+        c["encoder"] = "process" if self.consumer is not None else "thread"
+        return c
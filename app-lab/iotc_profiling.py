@@ -0,0 +1,314 @@
+"""Per-handler latency profiling for the App Lab entry points.
+
+instrument() wraps every handler registered afterwards through
+Bridge.provide(), ui.on_message() and ui.expose_api(). For each handler it keeps:
+
+- calls, in-flight and peak in-flight counts,
+- exclusive time (time spent in nested instrumented handlers is charged to
+  them, not to the caller) as a power-of-two microsecond histogram, split by
+  outcome (ok / error = the handler raised).
+
+Results are served as JSON from GET /metrics and, optionally, sent as a small
+telemetry digest every IOTC_DIGEST_SEC seconds (default 60, 0 disables).
+Other modules can add their own counters to /metrics with register_source().
+
+Usage in an app (before the handlers are registered):
+    from iotc_profiling import DIGEST_FIELDS, instrument, start_digest
+    TELEMETRY = load_encoder(..., optional=DIGEST_FIELDS)
+    ui = WebUI()
+    instrument(ui, Bridge)
+    ...
+    start_digest(relay, UNOQ_DEMO_NAME)
+
+Measure the wrapper overhead:
+    python3 app-lab/iotc_profiling.py
+"""
+
+import functools
+import inspect
+import os
+import threading
+import time
+
+from iotc_log import get_logger, log_telemetry
+
+# Bucket i counts calls that took < 2**i microseconds (and >= 2**(i-1)).
+BUCKETS = 32
+OK = 0
+ERROR = 1
+# Telemetry fields owned by the digest; pass as load_encoder(optional=...) so
+# regular frames do not overwrite them with defaults.
+DIGEST_FIELDS = ("handler_calls", "handler_errors", "slowest_handler", "slowest_p95_ms")
+
+_lock = threading.Lock()
+_handlers = {}          # name -> HandlerStats
+_sources = {}           # name -> callable returning a JSON-able dict
+_local = threading.local()
+_started = time.time()
+_digest_thread = None
+
+
+class HandlerStats:
+    __slots__ = ("name", "lock", "calls", "in_flight", "max_in_flight", "count", "total_ns", "max_ns", "hist")
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.count = [0, 0]
+        self.total_ns = [0, 0]
+        self.max_ns = [0, 0]
+        self.hist = ([0] * BUCKETS, [0] * BUCKETS)
+
+    def enter(self):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            if self.in_flight > self.max_in_flight:
+                self.max_in_flight = self.in_flight
+
+    def exit(self, outcome, exclusive_ns):
+        bucket = min((exclusive_ns // 1000).bit_length(), BUCKETS - 1)
+        with self.lock:
+            self.in_flight -= 1
+            self.count[outcome] += 1
+            self.total_ns[outcome] += exclusive_ns
+            if exclusive_ns > self.max_ns[outcome]:
+                self.max_ns[outcome] = exclusive_ns
+            self.hist[outcome][bucket] += 1
+
+    def copy(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "count": list(self.count),
+                "total_ns": list(self.total_ns),
+                "max_ns": list(self.max_ns),
+                "hist": (list(self.hist[OK]), list(self.hist[ERROR])),
+            }
+
+
+def _stats(name):
+    stats = _handlers.get(name)
+    if stats is None:
+        with _lock:
+            stats = _handlers.setdefault(name, HandlerStats(name))
+    return stats
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def profiled(name, fn):
+    """Wrap fn so its calls are recorded under name. The signature is kept for FastAPI."""
+    if getattr(fn, "__iotc_profiled__", None) == name:
+        return fn
+    stats = _stats(name)
+    clock = time.perf_counter_ns
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            # Awaited time is not exclusive time, but wall time is what the caller sees.
+            stats.enter()
+            outcome = ERROR
+            start = clock()
+            try:
+                result = await fn(*args, **kwargs)
+                outcome = OK
+                return result
+            finally:
+                stats.exit(outcome, clock() - start)
+        async_wrapper.__iotc_profiled__ = name
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stack = _stack()
+        frame = [0]             # ns spent in nested instrumented handlers
+        stack.append(frame)
+        stats.enter()
+        outcome = ERROR
+        start = clock()
+        try:
+            result = fn(*args, **kwargs)
+            outcome = OK
+            return result
+        finally:
+            elapsed = clock() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            stats.exit(outcome, elapsed - frame[0])
+    wrapper.__iotc_profiled__ = name
+    return wrapper
+
+
+def instrument(ui=None, bridge=None, metrics_path="/metrics"):
+    """Wrap future ui.on_message / ui.expose_api / bridge.provide registrations and expose metrics_path."""
+    if bridge is not None and not getattr(bridge, "__iotc_profiled__", False):
+        provide = bridge.provide
+
+        def profiled_provide(name, fn, *args, **kwargs):
+            return provide(name, profiled(f"bridge:{name}", fn), *args, **kwargs)
+
+        bridge.provide = staticmethod(profiled_provide)
+        bridge.__iotc_profiled__ = True
+
+    if ui is not None and not getattr(ui, "__iotc_profiled__", False):
+        on_message = ui.on_message
+        expose_api = ui.expose_api
+
+        def profiled_on_message(message_type, fn, *args, **kwargs):
+            return on_message(message_type, profiled(f"ui:{message_type}", fn), *args, **kwargs)
+
+        def profiled_expose_api(method, path, fn, *args, **kwargs):
+            return expose_api(method, path, profiled(f"api:{method.upper()} {path}", fn), *args, **kwargs)
+
+        ui.on_message = profiled_on_message
+        ui.expose_api = profiled_expose_api
+        ui.__iotc_profiled__ = True
+        if metrics_path:
+            expose_api("GET", metrics_path, snapshot)
+
+
+def register_source(name, fn):
+    """Add fn() (a JSON-able dict) under "sources" in /metrics."""
+    _sources[name] = fn
+
+
+def _percentile_ms(hist, count, pct):
+    # Upper edge of the bucket holding the pct-th call: within 2x of the real value.
+    if not count:
+        return 0.0
+    rank = count * pct / 100.0
+    seen = 0
+    for bucket, n in enumerate(hist):
+        seen += n
+        if n and seen >= rank:
+            return (1 << bucket) / 1000.0
+    return (1 << (BUCKETS - 1)) / 1000.0
+
+
+def _summary(stats, outcome):
+    count = stats["count"][outcome]
+    hist = stats["hist"][outcome]
+    max_ms = round(stats["max_ns"][outcome] / 1e6, 3)
+    return {
+        "count": count,
+        "mean_ms": round(stats["total_ns"][outcome] / count / 1e6, 3) if count else 0.0,
+        "p50_ms": min(_percentile_ms(hist, count, 50), max_ms),
+        "p95_ms": min(_percentile_ms(hist, count, 95), max_ms),
+        "p99_ms": min(_percentile_ms(hist, count, 99), max_ms),
+        "max_ms": max_ms,
+        "histogram_us": {f"<{1 << i}": n for i, n in enumerate(hist) if n},
+    }
+
+
+def snapshot():
+    """Everything /metrics returns."""
+    handlers = {}
+    for name, stats in sorted(_handlers.items()):
+        data = stats.copy()
+        handlers[name] = {
+            "calls": data["calls"],
+            "in_flight": data["in_flight"],
+            "max_in_flight": data["max_in_flight"],
+            "ok": _summary(data, OK),
+            "error": _summary(data, ERROR),
+        }
+    sources = {}
+    for name, fn in list(_sources.items()):
+        try:
+            sources[name] = fn()
+        except Exception as e:
+            sources[name] = {"error": str(e)}
+    return {
+        "uptime_sec": int(time.time() - _started),
+        "handlers": handlers,
+        "sources": sources,
+    }
+
+
+class _Digest:
+    """Per-interval deltas for the telemetry digest."""
+
+    def __init__(self):
+        self.previous = {}
+
+    def build(self):
+        calls = 0
+        errors = 0
+        slowest = ("", 0.0)
+        for name, stats in list(_handlers.items()):
+            data = stats.copy()
+            before = self.previous.get(name)
+            self.previous[name] = data
+            if before is not None:
+                data = {
+                    "count": [a - b for a, b in zip(data["count"], before["count"])],
+                    "hist": tuple(
+                        [a - b for a, b in zip(now, then)] for now, then in zip(data["hist"], before["hist"])
+                    ),
+                }
+            calls += data["count"][OK] + data["count"][ERROR]
+            errors += data["count"][ERROR]
+            p95 = _percentile_ms(data["hist"][OK], data["count"][OK], 95)
+            if p95 > slowest[1]:
+                slowest = (name, p95)
+        return {
+            "handler_calls": calls,
+            "handler_errors": errors,
+            "slowest_handler": slowest[0],
+            "slowest_p95_ms": slowest[1],
+        }
+
+
+def start_digest(relay, demo_name, interval_sec=None):
+    """Send handler_calls/handler_errors/slowest_handler/slowest_p95_ms every interval_sec."""
+    global _digest_thread
+    if interval_sec is None:
+        interval_sec = float(os.environ.get("IOTC_DIGEST_SEC", "60"))
+    if interval_sec <= 0 or _digest_thread is not None:
+        return
+    logger = get_logger(demo_name)
+    digest = _Digest()
+
+    def loop():
+        while True:
+            time.sleep(interval_sec)
+            payload = {"UnoQdemo": demo_name}
+            payload.update(digest.build())
+            if payload["handler_calls"]:
+                ok = relay.send_telemetry(payload)
+                log_telemetry(logger, payload, ok, key="digest")
+
+    _digest_thread = threading.Thread(target=loop, name="iotc-digest", daemon=True)
+    _digest_thread.start()
+
+
+def main():
+    import timeit
+
+    def handler(sid, data):
+        return data
+
+    wrapped = profiled("ui:bench", handler)
+    loops = 200000
+    bare = min(timeit.repeat(lambda: handler("sid", 1), number=loops, repeat=5)) / loops * 1e6
+    timed = min(timeit.repeat(lambda: wrapped("sid", 1), number=loops, repeat=5)) / loops * 1e6
+    print(f"bare call      {bare:6.2f} us")
+    print(f"profiled call  {timed:6.2f} us")
+    print(f"overhead       {timed - bare:6.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
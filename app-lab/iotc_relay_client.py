@@ -130,9 +130,11 @@ class IoTConnectRelayClient:
             self.socket = None
 
     def _send_message(self, message):
+        return self._send_raw(json.dumps(message))
+
+    def _send_raw(self, message_str):
         try:
-            message_str = json.dumps(message) + "\n"
-            self.socket.sendall(message_str.encode("utf-8"))
+            self.socket.sendall((message_str + "\n").encode("utf-8"))
             return True
         except Exception as e:
             print(f"Error sending message: {e}")
@@ -152,6 +154,19 @@ class IoTConnectRelayClient:
 
             return self._send_message(message)
 
+    def send_telemetry_json(self, data_json):
+        """Send telemetry that is already rendered as a JSON object string
+        (for example by iotc_telemetry_schema.TelemetryEncoder.encode_json)."""
+        with self.lock:
+            if not self.connected:
+                return False
+
+            message_str = (
+                '{"type": "telemetry", "client_id": ' + json.dumps(self.client_id)
+                + ', "data": ' + data_json + "}"
+            )
+            return self._send_raw(message_str)
+
     def _receive_loop(self):
         buffer = ""
 
@@ -0,0 +1,218 @@
+"""Result-image encoding for the detection apps.
+
+The annotated result used to be saved as lossless PNG and base64-encoded,
+which often took longer than inference and produced multi-MB websocket
+messages. ResultEncoder makes the format selectable:
+
+- png / jpeg / webp with a quality setting (jpeg and webp; png ignores it),
+- max_dim: downscale so the longer side is at most max_dim (0 keeps the size),
+- boxes_only: no image at all; the UI message carries the detections with
+  coordinates normalized to 0..1 of the original image, for the browser to
+  draw over the picture it uploaded. The stock App Lab page does not draw
+  these, so boxes_only needs a UI that does.
+
+Defaults come from IOTC_RESULT_FORMAT (png, as before; jpeg and webp are
+opt-in), IOTC_RESULT_QUALITY (85) and IOTC_RESULT_MAX_DIM (0); the set-result-format command changes them at run
+time and a request can override them with result_format / result_quality /
+result_max_dim keys. WebP falls back to JPEG when PIL was built without it.
+
+Usage in an app:
+    from iotc_result_image import ResultEncoder
+    RESULTS = ResultEncoder()
+    settings = RESULTS.settings_for(parsed)
+    encoded = RESULTS.encode(img_with_boxes, settings, detections, decoded.original_size)
+    ui.send_message("detection_result", {"success": True, **encoded.message})
+    send_telemetry({..., "encode_ms": encoded.encode_ms, "result_bytes": encoded.result_bytes})
+"""
+
+import base64
+import io
+import json
+import os
+import shlex
+import threading
+import time
+
+from PIL import Image, features
+
+from iotc_profiling import register_source
+
+FORMATS = ("png", "jpeg", "webp", "boxes_only")
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+_ALIASES = {"jpg": "jpeg", "boxes": "boxes_only", "none": "boxes_only"}
+
+HAS_WEBP = features.check("webp")
+
+
+class ResultSettings:
+    __slots__ = ("format", "quality", "max_dim")
+
+    def __init__(self, format="png", quality=85, max_dim=0):
+        self.format = format
+        self.quality = quality
+        self.max_dim = max_dim
+
+    @property
+    def boxes_only(self):
+        return self.format == "boxes_only"
+
+    def as_dict(self):
+        return {"format": self.format, "quality": self.quality, "max_dim": self.max_dim}
+
+
+class EncodedResult:
+    __slots__ = ("message", "encode_ms", "result_bytes")
+
+    def __init__(self, message, encode_ms, result_bytes):
+        self.message = message
+        self.encode_ms = encode_ms
+        self.result_bytes = result_bytes
+
+
+def _format(value):
+    name = str(value).strip().lower()
+    name = _ALIASES.get(name, name)
+    if name not in FORMATS:
+        raise ValueError(f"unknown result format {value!r}, expected one of {', '.join(FORMATS)}")
+    return name
+
+
+def _quality(value):
+    return max(1, min(100, int(float(value))))
+
+
+def _max_dim(value):
+    return max(0, int(float(value)))
+
+
+def normalized_boxes(detections, image_size):
+    """Detections (x, y, w, h in pixels of image_size) with coordinates as 0..1 fractions."""
+    width, height = image_size
+    boxes = []
+    for det in detections:
+        box = {k: v for k, v in det.items() if k not in ("x", "y", "w", "h")}
+        for key, extent in (("x", width), ("y", height), ("w", width), ("h", height)):
+            value = det.get(key)
+            if isinstance(value, (int, float)) and extent:
+                box[key] = round(value / extent if value > 1.0 else value, 5)
+        boxes.append(box)
+    return boxes
+
+
+class ResultEncoder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.settings = ResultSettings(
+            _format(os.environ.get("IOTC_RESULT_FORMAT", "png")),
+            _quality(os.environ.get("IOTC_RESULT_QUALITY", "85")),
+            _max_dim(os.environ.get("IOTC_RESULT_MAX_DIM", "0")),
+        )
+        self.counters = {}
+        register_source("result_image", self.stats)
+
+    def update(self, format=None, quality=None, max_dim=None):
+        """Change the defaults; raises ValueError for bad values and leaves them unchanged."""
+        with self.lock:
+            current = self.settings
+            self.settings = ResultSettings(
+                _format(format) if format not in (None, "") else current.format,
+                _quality(quality) if quality not in (None, "") else current.quality,
+                _max_dim(max_dim) if max_dim not in (None, "") else current.max_dim,
+            )
+            return self.settings
+
+    def update_from_command(self, parameters):
+        """set-result-format: {"format", "quality", "max_dim"} or "format [quality] [max_dim]"."""
+        if isinstance(parameters, dict):
+            return self.update(parameters.get("format"), parameters.get("quality"), parameters.get("max_dim"))
+        raw = str(parameters or "").strip()
+        if raw.startswith("{") and raw.endswith("}"):
+            return self.update_from_command(json.loads(raw))
+        tokens = shlex.split(raw)
+        return self.update(*tokens[:3])
+
+    def settings_for(self, request):
+        """Defaults with the request's result_format / result_quality / result_max_dim applied."""
+        base = self.settings
+        if not isinstance(request, dict):
+            return base
+        fmt = request.get("result_format")
+        quality = request.get("result_quality")
+        max_dim = request.get("result_max_dim")
+        if fmt is None and quality is None and max_dim is None:
+            return base
+        try:
+            return ResultSettings(
+                _format(fmt) if fmt not in (None, "") else base.format,
+                _quality(quality) if quality not in (None, "") else base.quality,
+                _max_dim(max_dim) if max_dim not in (None, "") else base.max_dim,
+            )
+        except (TypeError, ValueError) as e:
+            print(f"Ignoring result settings in request: {e}")
+            return base
+
+    def encode(self, image, settings, detections=(), image_size=None):
+        """Encode image (or only the boxes) for the detection_result UI message."""
+        start = time.perf_counter()
+        if settings.boxes_only or image is None:
+            size = image_size or (image.size if image is not None else (0, 0))
+            message = {
+                "result_format": "boxes_only",
+                "image_width": size[0],
+                "image_height": size[1],
+                "boxes": normalized_boxes(detections, size),
+            }
+            result_bytes = len(json.dumps(message["boxes"]))
+            fmt = "boxes_only"
+        else:
+            fmt = settings.format
+            if fmt == "webp" and not HAS_WEBP:
+                fmt = "jpeg"
+            if settings.max_dim and max(image.size) > settings.max_dim:
+                scale = settings.max_dim / max(image.size)
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                image = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            buf = io.BytesIO()
+            if fmt == "png":
+                image.save(buf, format="PNG")
+            elif fmt == "webp":
+                # method 1 of 0-6: close to the default size at a fraction of the time
+                image.save(buf, format="WEBP", quality=settings.quality, method=1)
+            else:
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                image.save(buf, format="JPEG", quality=settings.quality)
+            data = buf.getbuffer()
+            result_bytes = data.nbytes
+            message = {
+                "result_image": base64.b64encode(data).decode("ascii"),
+                "result_format": fmt,
+                "result_mime": MIME_TYPES[fmt],
+            }
+            data.release()
+        encode_ms = (time.perf_counter() - start) * 1000.0
+        self._count(fmt, encode_ms, result_bytes)
+        return EncodedResult(message, encode_ms, result_bytes)
+
+    def _count(self, fmt, encode_ms, result_bytes):
+        with self.lock:
+            c = self.counters.setdefault(fmt, {"count": 0, "encode_ms_total": 0.0, "encode_ms_max": 0.0, "bytes_total": 0})
+            c["count"] += 1
+            c["encode_ms_total"] += encode_ms
+            c["encode_ms_max"] = max(c["encode_ms_max"], encode_ms)
+            c["bytes_total"] += result_bytes
+
+    def stats(self):
+        with self.lock:
+            settings = self.settings.as_dict()
+            counters = {fmt: dict(c) for fmt, c in self.counters.items()}
+        by_format = {}
+        for fmt, c in counters.items():
+            n = c["count"]
+            by_format[fmt] = {
+                "count": n,
+                "encode_ms_mean": round(c["encode_ms_total"] / n, 3),
+                "encode_ms_max": round(c["encode_ms_max"], 3),
+                "bytes_mean": round(c["bytes_total"] / n),
+            }
+        return {"settings": settings, "webp": HAS_WEBP, "formats": by_format}
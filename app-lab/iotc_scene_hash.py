@@ -0,0 +1,139 @@
+"""Perceptual-hash pre-check: reuse the last result for an unchanged scene.
+
+An inspection station resubmits the same surface over and over, with only
+sensor noise or JPEG differences between shots. The detection cache only
+catches byte-identical images; SceneCache catches near-identical ones:
+
+1. dhash(): the decoded image is box-filtered down to 9x8 grayscale and each
+   pixel is compared to its right neighbour, giving a 64-bit difference hash
+   (well under a millisecond on a model-size image),
+2. the hash is compared with the last IOTC_SCENE_HISTORY submissions
+   (default 8; 0 disables the pre-check) that had the same key (e.g. the
+   original size and result settings),
+3. at a Hamming distance of at most IOTC_SCENE_DISTANCE bits (default 4 of
+   64) the stored result is returned instead of running the model.
+
+Reused results are marked so in the UI message and telemetry; a request can
+force a fresh run with "reuse": false. Checks, reuses, skip rate and hash cost
+are reported under "scene_hash" in /metrics.
+
+Usage in an app:
+    from iotc_scene_hash import SCENE_FIELDS, SceneCache
+    SCENES = SceneCache()
+    match = SCENES.lookup(pil_image, decoded.original_size)
+    if match.value is None:
+        ...run the model...
+        SCENES.store(match, outputs)
+    send_telemetry({..., **match.fields()})
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from iotc_profiling import register_source
+
+# Telemetry for the pre-check; pass as load_encoder(optional=...)
+SCENE_FIELDS = ("scene_reused", "scene_distance", "hash_ms")
+
+_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def dhash(image, size=8):
+    """64-bit (for size 8) difference hash of a PIL image, as a Python int."""
+    small = image.resize((size + 1, size), Image.Resampling.BOX).convert("L")
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(value, others):
+    """Bit distances between value and each hash in others (uint64 array)."""
+    diff = np.bitwise_xor(np.asarray(others, dtype=np.uint64), np.uint64(value))
+    return _BITS[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class SceneMatch:
+    __slots__ = ("hash", "key", "value", "distance", "hash_ms")
+
+    def __init__(self, hash, key, value, distance, hash_ms):
+        self.hash = hash
+        self.key = key
+        self.value = value
+        self.distance = distance
+        self.hash_ms = hash_ms
+
+    @property
+    def reused(self):
+        return self.value is not None
+
+    def fields(self):
+        """SCENE_FIELDS telemetry for this lookup."""
+        fields = {"scene_reused": self.reused, "hash_ms": round(self.hash_ms, 3)}
+        if self.distance is not None:
+            fields["scene_distance"] = int(self.distance)
+        return fields
+
+
+class SceneCache:
+    def __init__(self, max_distance=None, history=None, name="scene_hash"):
+        if max_distance is None:
+            max_distance = int(os.environ.get("IOTC_SCENE_DISTANCE", "4"))
+        if history is None:
+            history = int(os.environ.get("IOTC_SCENE_HISTORY", "8"))
+        self.max_distance = max_distance
+        self.history = max(0, history)
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=max(1, self.history))    # (hash, key, value)
+        self.counters = {"checks": 0, "reused": 0, "stored": 0, "hash_ms_total": 0.0, "hash_ms_max": 0.0}
+        register_source(name, self.stats)
+
+    def lookup(self, image, *key, reuse=True):
+        """Hash image and return a SceneMatch; .value is the stored result for a close-enough scene."""
+        start = time.perf_counter()
+        value = dhash(image)
+        hash_ms = (time.perf_counter() - start) * 1000.0
+        found = None
+        distance = None
+        with self.lock:
+            self.counters["checks"] += 1
+            self.counters["hash_ms_total"] += hash_ms
+            self.counters["hash_ms_max"] = max(self.counters["hash_ms_max"], hash_ms)
+            candidates = [e for e in self.entries if e[1] == key] if self.history else []
+            if candidates:
+                distances = hamming(value, [e[0] for e in candidates])
+                best = int(np.argmin(distances))
+                distance = int(distances[best])
+                if reuse and distance <= self.max_distance:
+                    found = candidates[best][2]
+                    self.counters["reused"] += 1
+        return SceneMatch(value, key, found, distance, hash_ms)
+
+    def store(self, match, value):
+        """Remember value as the result for match's scene."""
+        if not self.history or value is None:
+            return
+        with self.lock:
+            self.entries.append((match.hash, match.key, value))
+            self.counters["stored"] += 1
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            entries = len(self.entries) if self.history else 0
+        checks = c["checks"]
+        return {
+            "checks": checks,
+            "reused": c["reused"],
+            "stored": c["stored"],
+            "skip_rate": round(c["reused"] / checks, 3) if checks else 0.0,
+            "hash_ms_mean": round(c["hash_ms_total"] / checks, 3) if checks else 0.0,
+            "hash_ms_max": round(c["hash_ms_max"], 3),
+            "entries": entries,
+            "history": self.history,
+            "max_distance": self.max_distance,
+        }
@@ -0,0 +1,116 @@
+"""Per-stage latency spans for the image apps.
+
+processing_time_ms only covers the model call. A Spans object is created per
+request and each stage is timed into it:
+
+    fetch_ms   image_url download
+    decode_ms  base64 decode + image decode
+    infer_ms   model call (or cache lookup)
+    draw_ms    drawing boxes / markers
+    encode_ms  result image encoding
+    send_ms    websocket send of the result
+
+The fields go into the request's telemetry frame. record() also adds them, plus
+relay_ms (the telemetry send itself, which cannot be in its own frame), to a
+rolling window of the last IOTC_SPAN_WINDOW requests (default 256) whose
+p50/p95/p99 are served from GET /spans and under "spans" in /metrics.
+
+Usage in an app:
+    from iotc_spans import SPAN_FIELDS, Spans, record, span_summary
+    spans = Spans()
+    with spans.span("decode_ms"):
+        decoded = decode_image(...)
+    send_telemetry({..., **spans.fields()})
+    ui.expose_api("GET", "/spans", span_summary)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from iotc_profiling import register_source
+
+SPAN_FIELDS = ("fetch_ms", "decode_ms", "infer_ms", "draw_ms", "encode_ms", "send_ms")
+
+_clock = time.perf_counter
+
+
+class Spans:
+    __slots__ = ("ms", "started")
+
+    def __init__(self):
+        self.ms = {}
+        self.started = _clock()
+
+    @contextmanager
+    def span(self, name):
+        start = _clock()
+        try:
+            yield
+        finally:
+            self.add(name, (_clock() - start) * 1000.0)
+
+    def add(self, name, ms):
+        self.ms[name] = self.ms.get(name, 0.0) + ms
+
+    def fields(self):
+        """Telemetry fields for the stages that ran."""
+        return {name: round(self.ms[name], 3) for name in SPAN_FIELDS if name in self.ms}
+
+    def total_ms(self):
+        return (_clock() - self.started) * 1000.0
+
+
+class SpanWindow:
+    """Last `size` values per span name, with percentiles computed on read."""
+
+    def __init__(self, size=None):
+        if size is None:
+            size = int(os.environ.get("IOTC_SPAN_WINDOW", "256"))
+        self.size = max(1, size)
+        self.lock = threading.Lock()
+        self.values = {}
+        self.requests = 0
+
+    def record(self, spans, **extra_ms):
+        with self.lock:
+            self.requests += 1
+            for name, ms in list(spans.ms.items()) + list(extra_ms.items()) + [("total_ms", spans.total_ms())]:
+                window = self.values.get(name)
+                if window is None:
+                    window = self.values[name] = deque(maxlen=self.size)
+                window.append(ms)
+
+    def summary(self):
+        with self.lock:
+            values = {name: list(window) for name, window in self.values.items()}
+            requests = self.requests
+        stages = {}
+        for name, data in values.items():
+            data.sort()
+            n = len(data)
+            stages[name] = {
+                "count": n,
+                "mean_ms": round(sum(data) / n, 3),
+                "p50_ms": round(data[min(n - 1, int(n * 0.50))], 3),
+                "p95_ms": round(data[min(n - 1, int(n * 0.95))], 3),
+                "p99_ms": round(data[min(n - 1, int(n * 0.99))], 3),
+                "max_ms": round(data[-1], 3),
+            }
+        return {"requests": requests, "window": self.size, "stages": stages}
+
+
+WINDOW = SpanWindow()
+register_source("spans", WINDOW.summary)
+
+
+def record(spans, **extra_ms):
+    """Add a finished request's spans (and e.g. relay_ms=...) to the rolling window."""
+    WINDOW.record(spans, **extra_ms)
+
+
+def span_summary():
+    """Handler for GET /spans."""
+    return WINDOW.summary()
@@ -0,0 +1,160 @@
+"""Startup orchestration: warm the model and connect the relay in parallel.
+
+The first detect / classify call used to pay for loading the model in the
+inference runner, so the first user request took seconds, and relay.start()
+blocked module import for up to its connect timeout before the web UI even
+came up. Startup runs both in background threads instead:
+
+- warm_up(fn): one dummy inference on a synthetic noise image of the model
+  input size (IOTC_WARMUP=0 skips it),
+- start_relay(relay): the relay's initial connect; it keeps retrying in the
+  background as before if that fails, and the task finishes once the relay
+  is connected.
+
+Request handlers call STARTUP.wait() (bounded by IOTC_STARTUP_WAIT_SEC,
+default 30) before their first inference, so an early request queues behind
+the warm-up instead of racing it. Only the warm-up gates wait(); a relay that
+is slow or down does not hold up inference. Once the warm-up is done and the
+relay is connected, the on_ready callback runs; the apps send one telemetry
+frame with startup_ms (from Startup() to the end of the warm-up) and
+first_inference_ms (the warm-up call). Task times are also under "startup"
+in /metrics.
+
+Usage in an app:
+    from iotc_startup import STARTUP_FIELDS, Startup
+    STARTUP = Startup()                   # as early as possible
+    STARTUP.start_relay(relay)
+    STARTUP.warm_up(lambda image: object_detection.detect(image), INPUT_SIZE)
+    STARTUP.start(lambda: send_telemetry({"status": "startup", **STARTUP.fields()}))
+    STARTUP.wait()                        # in the request handler
+"""
+
+import os
+import threading
+import time
+import traceback
+
+import numpy as np
+from PIL import Image
+
+from iotc_profiling import register_source
+
+STARTUP_FIELDS = ("startup_ms", "first_inference_ms")
+
+
+def synthetic_image(size=(640, 640), seed=0):
+    """RGB noise image for the warm-up (a flat one could take shortcuts real input does not)."""
+    width, height = size if size else (640, 640)
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), "RGB")
+
+
+class Startup:
+    def __init__(self, wait_sec=None, name="startup"):
+        if wait_sec is None:
+            wait_sec = float(os.environ.get("IOTC_STARTUP_WAIT_SEC", "30"))
+        self.started = time.perf_counter()
+        self.wait_sec = wait_sec
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.queued = []    # (name, fn, gate) until start()
+        self.pending = 0
+        self.gating = 0    # pending tasks that wait() blocks on
+        self.tasks = {}    # name -> {"ms", "ok"}
+        self.callback = None
+        self.startup_ms = None
+        self.first_inference_ms = None
+        register_source(name, self.stats)
+
+    def add(self, name, fn, gate=True):
+        """Register fn() as a startup task; it runs on its own thread from start().
+
+        wait() blocks until the gate tasks are done; on_ready waits for all of them.
+        """
+        self.queued.append((name, fn, gate))
+
+    def start(self, on_ready=None):
+        """Start every task; on_ready() runs once they have all finished."""
+        tasks, self.queued = self.queued, []
+        with self.lock:
+            self.callback = on_ready
+            self.pending = len(tasks)
+            self.gating = sum(1 for _, _, gate in tasks if gate)
+        if not self.gating:
+            self._set_ready()
+        if not tasks:
+            self._finish()
+            return
+        for name, fn, gate in tasks:
+            threading.Thread(target=self._task, args=(name, fn, gate), name=f"startup-{name}", daemon=True).start()
+
+    def _task(self, name, fn, gate):
+        start = time.perf_counter()
+        ok = True
+        try:
+            fn()
+        except Exception as e:
+            ok = False
+            print(f"startup task {name} failed: {e}")
+            print(traceback.format_exc())
+        elapsed = (time.perf_counter() - start) * 1000.0
+        with self.lock:
+            self.tasks[name] = {"ms": round(elapsed, 3), "ok": ok}
+            if name == "warm_up" and ok:
+                self.first_inference_ms = elapsed
+            self.pending -= 1
+            done = self.pending == 0
+            if gate:
+                self.gating -= 1
+            gate_done = gate and self.gating == 0
+        if gate_done:
+            self._set_ready()
+        if done:
+            self._finish()
+
+    def _set_ready(self):
+        self.startup_ms = (time.perf_counter() - self.started) * 1000.0
+        self.ready.set()
+
+    def _finish(self):
+        if self.callback is not None:
+            try:
+                self.callback()
+            except Exception as e:
+                print(f"startup on_ready callback failed: {e}")
+
+    def warm_up(self, infer, size=None):
+        """One dummy inference, infer(image), on a synthetic image of size (model input size)."""
+        if os.environ.get("IOTC_WARMUP", "1") == "0":
+            return
+        self.add("warm_up", lambda: infer(synthetic_image(size)))
+
+    def start_relay(self, relay, poll_sec=0.5):
+        def connect():
+            relay.start()
+            # on_ready sends telemetry: hold it until the background retries get through
+            while not relay.is_connected():
+                time.sleep(poll_sec)
+
+        self.add("relay", connect, gate=False)
+
+    def wait(self, timeout=None):
+        """Block until the warm-up is done (at most wait_sec); returns whether it is."""
+        if self.ready.is_set():
+            return True
+        return self.ready.wait(self.wait_sec if timeout is None else timeout)
+
+    def fields(self):
+        """STARTUP_FIELDS telemetry (only the ones that are known)."""
+        fields = {}
+        if self.startup_ms is not None:
+            fields["startup_ms"] = round(self.startup_ms, 3)
+        if self.first_inference_ms is not None:
+            fields["first_inference_ms"] = round(self.first_inference_ms, 3)
+        return fields
+
+    def stats(self):
+        with self.lock:
+            tasks = {name: dict(t) for name, t in self.tasks.items()}
+            pending = self.pending
+        return {"ready": self.ready.is_set(), "pending": pending, "tasks": tasks, **self.fields()}
@@ -0,0 +1,283 @@
+"""Schema-compiled telemetry encoders for the UNO Q demo apps.
+
+Each app's config.json declares its telemetry names and IOTCONNECT types
+(STRING, INTEGER, DECIMAL). load_encoder() compiles that list once at startup
+into a TelemetryEncoder that:
+
+- coerces values to the declared type (bool -> "true"/"false", dict/list ->
+  JSON string for STRING fields, "3.0" -> 3 for INTEGER fields); a value that
+  does not convert (including inf / nan for numbers) becomes the default,
+- drops keys the template does not know,
+- fills defaults for missing fields (optional; fields listed in `optional`
+  are left out instead, for values that only some frames carry),
+- renders JSON from pre-keyed fragments ('"name": ') so the relay client can
+  send the frame without re-encoding it (IoTConnectRelayClient.send_telemetry_json).
+
+Usage in an app:
+    from iotc_telemetry_schema import load_encoder
+    TELEMETRY = load_encoder(Path(__file__).with_name("iotc_config.json"))
+    relay.send_telemetry_json(TELEMETRY.encode_json(payload))
+
+Validate a config against its device template and benchmark the encoder:
+    python3 app-lab/iotc_telemetry_schema.py app-configs/object-detection
+"""
+
+import json
+import math
+from json.encoder import encode_basestring_ascii
+
+TYPE_DEFAULTS = {
+    "STRING": "",
+    "INTEGER": 0,
+    "DECIMAL": 0.0,
+}
+
+_MISSING = object()
+
+
+def _to_string(value):
+    if type(value) is str:
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _to_integer(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        return int(float(value.strip()))
+    return int(value)
+
+
+def _to_decimal(value):
+    if type(value) is float:
+        result = value
+    else:
+        result = float(value.strip()) if isinstance(value, str) else float(value)
+    if not math.isfinite(result):
+        raise ValueError(f"non-finite DECIMAL: {value!r}")
+    return result
+
+
+COERCERS = {
+    "STRING": _to_string,
+    "INTEGER": _to_integer,
+    "DECIMAL": _to_decimal,
+}
+
+# JSON renderers for already-coerced values
+_RENDERERS = {
+    "STRING": encode_basestring_ascii,
+    "INTEGER": int.__repr__,
+    "DECIMAL": float.__repr__,
+}
+
+
+class TelemetryEncoder:
+    """Coerces, filters and renders telemetry for one app schema."""
+
+    def __init__(self, fields, defaults=None, fill_defaults=True, optional=()):
+        # fields: list of (name, type) tuples, in config.json order
+        self.fields = []
+        self.types = {}
+        for name, type_name in fields:
+            type_name = str(type_name).upper()
+            if type_name not in COERCERS:
+                raise ValueError(f"Unsupported telemetry type {type_name} for {name}")
+            self.fields.append((name, type_name))
+            self.types[name] = type_name
+        self.fill_defaults = fill_defaults
+        self.optional = frozenset(optional)
+        self.defaults = {name: TYPE_DEFAULTS[t] for name, t in self.fields}
+        if defaults:
+            for name, value in defaults.items():
+                if name in self.types:
+                    self.defaults[name] = COERCERS[self.types[name]](value)
+        self._compile()
+
+    def _compile(self):
+        # Generate one straight-line function per schema so the hot path has no
+        # per-field dict lookups of the type table.
+        namespace = {"MISSING": _MISSING}
+        dict_lines = ["def encode(data):", "    get = data.get", "    out = {}"]
+        json_lines = ["def encode_json(data):", "    get = data.get", "    parts = []", "    add = parts.append"]
+        for i, (name, type_name) in enumerate(self.fields):
+            key = f"K{i}"
+            coerce = f"C{i}"
+            render = f"R{i}"
+            prefix = f"P{i}"
+            default = f"D{i}"
+            default_fragment = f"F{i}"
+            namespace[key] = name
+            namespace[coerce] = COERCERS[type_name]
+            namespace[render] = _RENDERERS[type_name]
+            namespace[prefix] = encode_basestring_ascii(name) + ": "
+            namespace[default] = self.defaults[name]
+            namespace[default_fragment] = namespace[prefix] + _RENDERERS[type_name](self.defaults[name])
+
+            if self.fill_defaults and name not in self.optional:
+                on_missing_dict = f"        out[{key}] = {default}"
+                on_missing_json = f"        add({default_fragment})"
+            else:
+                on_missing_dict = "        pass"
+                on_missing_json = "        pass"
+
+            dict_lines += [
+                f"    v = get({key}, MISSING)",
+                "    if v is MISSING:",
+                on_missing_dict,
+                "    elif v is None:",
+                f"        out[{key}] = None",
+                "    else:",
+                "        try:",
+                f"            out[{key}] = {coerce}(v)",
+                "        except (TypeError, ValueError, OverflowError):",
+                f"            out[{key}] = {default}",
+            ]
+            json_lines += [
+                f"    v = get({key}, MISSING)",
+                "    if v is MISSING:",
+                on_missing_json,
+                "    elif v is None:",
+                f"        add({prefix} + 'null')",
+                "    else:",
+                "        try:",
+                f"            add({prefix} + {render}({coerce}(v)))",
+                "        except (TypeError, ValueError, OverflowError):",
+                f"            add({default_fragment})",
+            ]
+        dict_lines.append("    return out")
+        json_lines.append("    return '{' + ', '.join(parts) + '}'")
+        exec("\n".join(dict_lines), namespace)
+        exec("\n".join(json_lines), namespace)
+        self.encode = namespace["encode"]
+        self.encode_json = namespace["encode_json"]
+
+    @property
+    def names(self):
+        return [name for name, _ in self.fields]
+
+    def unknown_keys(self, data):
+        return [k for k in data if k not in self.types]
+
+
+def read_fields(config_path):
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    fields = []
+    for t in cfg.get("telemetry", []):
+        if isinstance(t, dict) and t.get("name"):
+            fields.append((t["name"], t.get("type", "STRING")))
+    return fields
+
+
+def load_encoder(config_path, defaults=None, fill_defaults=True, optional=()):
+    return TelemetryEncoder(
+        read_fields(config_path), defaults=defaults, fill_defaults=fill_defaults, optional=optional
+    )
+
+
+def validate_against_template(config_path, template_path):
+    """Return a list of mismatches between config.json telemetry and device-template.json attributes."""
+    with open(template_path, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    attributes = {a.get("name"): str(a.get("type", "")).upper() for a in template.get("attributes", [])}
+    problems = []
+    seen = set()
+    for name, type_name in read_fields(config_path):
+        if name in seen:
+            problems.append(f"duplicate telemetry field in config: {name}")
+        seen.add(name)
+        if name not in attributes:
+            problems.append(f"{name}: missing from device template")
+        elif attributes[name] != str(type_name).upper():
+            problems.append(f"{name}: config type {type_name} != template type {attributes[name]}")
+    for name in attributes:
+        if name not in seen:
+            problems.append(f"{name}: in device template but not in config")
+    return problems
+
+
+def _sample_payload(encoder):
+    # Values in the shapes the apps produce before conversion (numpy-ish floats
+    # as strings, ints as floats, bools), plus one unknown key.
+    sample = {"not_in_template": 1}
+    for name, type_name in encoder.fields:
+        if type_name == "INTEGER":
+            sample[name] = 42.0
+        elif type_name == "DECIMAL":
+            sample[name] = "0.8125"
+        else:
+            sample[name] = True if name.startswith("has_") else name
+    return sample
+
+
+def benchmark(encoder, loops=20000):
+    import timeit
+
+    sample = _sample_payload(encoder)
+    message_prefix = '{"type": "telemetry", "client_id": "bench", "data": '
+
+    # What the apps do today: a literal dict with an inline conversion per
+    # field, then json.dumps of the whole relay message.
+    namespace = {"sample": sample, "json": json}
+    namespace.update({f"C{i}": COERCERS[t] for i, (_, t) in enumerate(encoder.fields)})
+    entries = ", ".join(f"{name!r}: C{i}(sample[{name!r}])" for i, (name, _) in enumerate(encoder.fields))
+    exec(
+        "def hand_built():\n"
+        f"    payload = {{{entries}}}\n"
+        "    return json.dumps({'type': 'telemetry', 'client_id': 'bench', 'data': payload})\n",
+        namespace,
+    )
+    hand_built = namespace["hand_built"]
+
+    def compiled():
+        return message_prefix + encoder.encode_json(sample) + "}"
+
+    assert json.loads(compiled())["data"] == json.loads(hand_built())["data"]
+    results = {}
+    for label, fn in (("hand_built_dict+json.dumps", hand_built), ("compiled_encode_json", compiled)):
+        best = min(timeit.repeat(fn, number=loops, repeat=5))
+        results[label] = best / loops * 1e6
+    return results
+
+
+def main():
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Validate and benchmark an app's telemetry schema.")
+    parser.add_argument("app_dirs", nargs="+", help="app-configs/<example> directories")
+    parser.add_argument("--loops", type=int, default=20000)
+    parser.add_argument("--no-bench", action="store_true", help="Only validate")
+    args = parser.parse_args()
+
+    failed = False
+    for app_dir in args.app_dirs:
+        config_path = os.path.join(app_dir, "config.json")
+        template_path = os.path.join(app_dir, "device-template.json")
+        if not os.path.exists(config_path):
+            continue
+        print(f"== {app_dir}")
+        if os.path.exists(template_path):
+            problems = validate_against_template(config_path, template_path)
+            for p in problems:
+                print(f"  [WARN] {p}")
+            if not problems:
+                print("  [OK] config.json matches device-template.json")
+            failed = failed or bool(problems)
+        encoder = load_encoder(config_path)
+        # Non-finite numbers must fall back to defaults, not raise inside a send
+        json.loads(encoder.encode_json({name: float("inf") for name in encoder.names}))
+        if not args.no_bench:
+            for label, us in benchmark(encoder, args.loops).items():
+                print(f"  {label:28s} {us:8.2f} us/frame ({len(encoder.fields)} fields)")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
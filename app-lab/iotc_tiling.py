@@ -0,0 +1,259 @@
+"""Tiled object detection for large photos.
+
+Single-shot detection squeezes a 4000x3000 photo into the model input, so
+objects a few dozen pixels wide disappear. TiledDetector instead:
+
+1. cuts the full-resolution image into overlapping tiles of the model input
+   size (IOTC_TILE_OVERLAP, default 0.2 of a tile),
+2. runs the brick on the tiles from IOTC_TILE_WORKERS threads (default 2),
+3. shifts each tile's boxes back to image coordinates,
+4. merges duplicates from the overlaps with class-aware NumPy NMS. Besides IoU
+   (IOTC_TILE_IOU, default 0.5), a box mostly contained in a higher-scoring
+   one of the same class is dropped too; that is how an object cut in half by
+   a tile edge merges with the whole one from the neighbouring tile.
+
+compare() runs both paths on the same image and reports timing and the recall
+of the single-shot detections in the tiled result, so the trade-off can be
+measured on the device with real photos.
+
+Requests opt in with "tile": true (or IOTC_TILE=1 for all), and with
+"tile_compare": true to also run the single-shot path for comparison.
+
+Usage in an app:
+    from iotc_tiling import TILE_FIELDS, TiledDetector, tile_fields, wants_tiling
+    TILER = TiledDetector(object_detection.detect, INPUT_SIZE)
+    results, info = TILER.detect(pil_image, confidence)
+    send_telemetry({..., **tile_fields(info)})
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from iotc_profiling import register_source
+
+# Drop a box when this much of it lies inside a better box of the same class
+CONTAINMENT = 0.8
+# Telemetry sent with tiled results; pass as load_encoder(optional=...)
+TILE_FIELDS = ("tile_count", "tile_ms", "tiles_per_sec", "single_ms", "tile_recall", "tile_new")
+_INFO_FIELDS = {"tiles": "tile_count", "tile_ms": "tile_ms", "tiles_per_sec": "tiles_per_sec",
+                "single_ms": "single_ms", "recall": "tile_recall", "new": "tile_new"}
+
+
+def _truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def wants_tiling(request):
+    """(tiled, compare) from the request's tile / tile_compare keys; IOTC_TILE=1 tiles by default."""
+    tiled = _truthy(request.get("tile", os.environ.get("IOTC_TILE", "0")))
+    compare = _truthy(request.get("tile_compare", False))
+    return tiled or compare, compare
+
+
+def tile_fields(info):
+    """TILE_FIELDS telemetry from a detect() / compare() info dict."""
+    return {_INFO_FIELDS[k]: round(v, 3) if isinstance(v, float) else v for k, v in info.items() if k in _INFO_FIELDS}
+
+
+def tile_grid(width, height, tile_w, tile_h, overlap=0.2):
+    """(x0, y0, x1, y1) tiles covering the image; edge tiles are shifted inward, not shrunk."""
+    def starts(size, tile):
+        if size <= tile:
+            return [0]
+        step = max(1, int(tile * (1.0 - overlap)))
+        positions = list(range(0, size - tile, step))
+        positions.append(size - tile)
+        return positions
+
+    return [
+        (x, y, min(x + tile_w, width), min(y + tile_h, height))
+        for y in starts(height, tile_h)
+        for x in starts(width, tile_w)
+    ]
+
+
+def nms(boxes, scores, classes=None, iou_threshold=0.5, containment=CONTAINMENT):
+    """Indices of boxes (N x 4, xyxy) kept by greedy NMS, best score first.
+
+    With classes, boxes of different classes never suppress each other.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if boxes.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    if classes is not None:
+        # Offset each class into its own coordinate range
+        _, class_ids = np.unique(np.asarray(classes, dtype=object).astype(str), return_inverse=True)
+        offset = (boxes.max() + 1.0) * class_ids.astype(np.float64)
+        boxes = boxes + offset[:, None]
+    x1, y1, x2, y2 = boxes.T
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-9)
+        contained = inter / np.maximum(areas[rest], 1e-9)
+        order = rest[(iou <= iou_threshold) & (contained <= containment)]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _items(results):
+    if isinstance(results, dict) and isinstance(results.get("detection"), list):
+        return results["detection"]
+    if isinstance(results, list):
+        return results
+    return []
+
+
+def _xyxy(item):
+    box = item.get("bounding_box_xyxy")
+    if isinstance(box, (list, tuple)) and len(box) >= 4:
+        return [float(v) for v in box[:4]]
+    box = item.get("bbox")
+    if isinstance(box, (list, tuple)) and len(box) >= 4:
+        x, y, w, h = (float(v) for v in box[:4])
+        return [x, y, x + w, y + h]
+    if all(isinstance(item.get(k), (int, float)) for k in ("x", "y", "w", "h")):
+        return [item["x"], item["y"], item["x"] + item["w"], item["y"] + item["h"]]
+    return None
+
+
+def _score(item):
+    try:
+        return float(item.get("confidence", item.get("score", 0.0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def recall(reference, candidate, iou_threshold=0.5):
+    """(fraction of reference boxes matched in candidate, candidate boxes matching none)."""
+    ref = [b for b in (_xyxy(i) for i in _items(reference)) if b is not None]
+    cand = [b for b in (_xyxy(i) for i in _items(candidate)) if b is not None]
+    if not ref:
+        return 1.0, len(cand)
+    if not cand:
+        return 0.0, 0
+    a = np.asarray(ref)[:, None, :]
+    b = np.asarray(cand)[None, :, :]
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    iou = inter / np.maximum(area_a + area_b - inter, 1e-9)
+    matched = iou >= iou_threshold
+    return float(matched.any(axis=1).mean()), int((~matched.any(axis=0)).sum())
+
+
+class TiledDetector:
+    def __init__(self, detect, tile_size, overlap=None, workers=None, iou_threshold=None, name="tiling"):
+        if overlap is None:
+            overlap = float(os.environ.get("IOTC_TILE_OVERLAP", "0.2"))
+        if workers is None:
+            workers = int(os.environ.get("IOTC_TILE_WORKERS", "2"))
+        if iou_threshold is None:
+            iou_threshold = float(os.environ.get("IOTC_TILE_IOU", "0.5"))
+        self.detect_fn = detect
+        self.tile_size = tuple(tile_size or (640, 640))
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.iou_threshold = iou_threshold
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.counters = {"images": 0, "tiles": 0, "tile_ms_total": 0.0, "raw_boxes": 0, "kept_boxes": 0,
+                         "compares": 0, "recall_total": 0.0, "single_ms_total": 0.0, "tiled_ms_total": 0.0}
+        register_source(name, self.stats)
+
+    def _detect_tile(self, image, box, confidence):
+        tile = image.crop(box)
+        start = time.perf_counter()
+        results = self.detect_fn(tile, confidence=confidence)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        x0, y0 = box[0], box[1]
+        shifted = []
+        for item in _items(results):
+            xyxy = _xyxy(item) if isinstance(item, dict) else None
+            if xyxy is None:
+                continue
+            out = {k: v for k, v in item.items() if k not in ("bbox", "x", "y", "w", "h")}
+            out["bounding_box_xyxy"] = [xyxy[0] + x0, xyxy[1] + y0, xyxy[2] + x0, xyxy[3] + y0]
+            shifted.append(out)
+        return shifted, elapsed
+
+    def detect(self, image, confidence=None):
+        """({"detection": [...]} in image coordinates, info dict with tiles / tile_ms)."""
+        start = time.perf_counter()
+        grid = tile_grid(image.width, image.height, self.tile_size[0], self.tile_size[1], self.overlap)
+        futures = [self.pool.submit(self._detect_tile, image, box, confidence) for box in grid]
+        items = []
+        busy_ms = 0.0
+        for future in futures:
+            shifted, elapsed = future.result()
+            items.extend(shifted)
+            busy_ms += elapsed
+        if items:
+            keep = nms(
+                [i["bounding_box_xyxy"] for i in items],
+                [_score(i) for i in items],
+                [i.get("class_name", "") for i in items],
+                self.iou_threshold,
+            )
+            merged = [items[i] for i in keep]
+        else:
+            merged = []
+        wall_ms = (time.perf_counter() - start) * 1000.0
+        with self.lock:
+            self.counters["images"] += 1
+            self.counters["tiles"] += len(grid)
+            self.counters["tile_ms_total"] += busy_ms
+            self.counters["raw_boxes"] += len(items)
+            self.counters["kept_boxes"] += len(merged)
+        info = {"tiles": len(grid), "tile_ms": wall_ms, "tiles_per_sec": len(grid) / (wall_ms / 1000.0) if wall_ms else 0.0}
+        return {"detection": merged}, info
+
+    def compare(self, image, confidence=None):
+        """Run single-shot and tiled detection; returns (tiled results, info with single_ms / recall / new)."""
+        start = time.perf_counter()
+        single = self.detect_fn(image, confidence=confidence)
+        single_ms = (time.perf_counter() - start) * 1000.0
+        tiled, info = self.detect(image, confidence)
+        found, new = recall(single, tiled)
+        info.update({"single_ms": single_ms, "recall": found, "new": new})
+        with self.lock:
+            self.counters["compares"] += 1
+            self.counters["recall_total"] += found
+            self.counters["single_ms_total"] += single_ms
+            self.counters["tiled_ms_total"] += info["tile_ms"]
+        return tiled, info
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+        images = c["images"]
+        compares = c["compares"]
+        return {
+            "tile_size": list(self.tile_size),
+            "overlap": self.overlap,
+            "workers": self.workers,
+            "images": images,
+            "tiles": c["tiles"],
+            "tile_ms_mean": round(c["tile_ms_total"] / c["tiles"], 3) if c["tiles"] else 0.0,
+            "boxes_before_nms": c["raw_boxes"],
+            "boxes_after_nms": c["kept_boxes"],
+            "compares": compares,
+            "recall_mean": round(c["recall_total"] / compares, 3) if compares else None,
+            "single_ms_mean": round(c["single_ms_total"] / compares, 3) if compares else None,
+            "tiled_ms_mean": round(c["tiled_ms_total"] / compares, 3) if compares else None,
+        }
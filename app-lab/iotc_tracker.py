@@ -0,0 +1,222 @@
+"""Multi-object tracker for the video apps: enter / exit / dwell events.
+
+A periodic snapshot of what is visible cannot tell one person lingering from
+several people passing, and every snapshot repeats the whole detection list.
+Tracker follows the on_detect_all stream and keeps a persistent ID per
+object:
+
+- detections are matched to live tracks of the same class by IoU
+  (IOTC_TRACK_IOU, default 0.3) or, failing that, by centroid distance
+  (within half the track's box diagonal); without boxes in the callback,
+  tracks are matched by class alone,
+- an unmatched detection opens a track ("enter"), a track unseen for
+  IOTC_TRACK_TTL seconds (default 1.5) closes ("exit", with its dwell time),
+  and a track present for IOTC_TRACK_DWELL_SEC (default 10) reports "dwell"
+  once,
+- events queue until drain(), which the apps call when they send telemetry;
+  fields() turns them into compact track_* fields and changed() tells
+  whether there is anything new to send. The queue holds at most
+  IOTC_TRACK_MAX_EVENTS (default 50); further events are dropped but still
+  counted in tracks_entered / tracks_exited, and track_events_dropped says
+  how many are missing from track_events_json.
+
+Closed tracks are only noticed on the next update() or drain(), so an exit is
+reported at the first callback or send after the TTL.
+
+Usage in an app:
+    from iotc_tracker import Tracker
+    TRACKER = Tracker()
+    TRACKER.update(detections)            # in the on_detect_all callback
+    payload.update(TRACKER.fields())      # when sending telemetry
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from iotc_profiling import register_source
+
+TRACK_FIELDS = ("active_tracks", "tracks_entered", "tracks_exited", "max_dwell_sec",
+                "track_counts_json", "track_events_json", "track_events_dropped")
+
+
+def observations(detections):
+    """[(class_name, confidence, xyxy box or None)] from an on_detect_all payload."""
+    found = []
+    for name, value in (detections or {}).items():
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            box = None
+            if isinstance(item, dict):
+                conf = item.get("confidence", 0.0)
+                xyxy = item.get("bounding_box_xyxy")
+                if isinstance(xyxy, (list, tuple)) and len(xyxy) >= 4:
+                    box = [float(v) for v in xyxy[:4]]
+            else:
+                conf = item
+            try:
+                conf = float(conf)
+            except (TypeError, ValueError):
+                conf = 0.0
+            found.append((name, conf, box))
+    return found
+
+
+def _iou(boxes, box):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = np.clip(np.minimum(boxes[:, 2], box[2]) - np.maximum(boxes[:, 0], box[0]), 0, None)
+    h = np.clip(np.minimum(boxes[:, 3], box[3]) - np.maximum(boxes[:, 1], box[1]), 0, None)
+    inter = w * h
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    own = (box[2] - box[0]) * (box[3] - box[1])
+    return inter / np.maximum(area + own - inter, 1e-9)
+
+
+def _near(track_box, box):
+    cx = (track_box[0] + track_box[2] - box[0] - box[2]) / 2.0
+    cy = (track_box[1] + track_box[3] - box[1] - box[3]) / 2.0
+    diag = np.hypot(track_box[2] - track_box[0], track_box[3] - track_box[1])
+    return np.hypot(cx, cy) <= diag / 2.0
+
+
+class Track:
+    __slots__ = ("id", "class_name", "first_seen", "last_seen", "box", "confidence", "dwell_reported")
+
+    def __init__(self, track_id, class_name, now, box, confidence):
+        self.id = track_id
+        self.class_name = class_name
+        self.first_seen = now
+        self.last_seen = now
+        self.box = box
+        self.confidence = confidence
+        self.dwell_reported = False
+
+    def dwell(self, now=None):
+        return (now if now is not None else self.last_seen) - self.first_seen
+
+
+class Tracker:
+    def __init__(self, iou=None, ttl=None, dwell_sec=None, max_events=None, name="tracker"):
+        if iou is None:
+            iou = float(os.environ.get("IOTC_TRACK_IOU", "0.3"))
+        if ttl is None:
+            ttl = float(os.environ.get("IOTC_TRACK_TTL", "1.5"))
+        if dwell_sec is None:
+            dwell_sec = float(os.environ.get("IOTC_TRACK_DWELL_SEC", "10"))
+        if max_events is None:
+            max_events = int(os.environ.get("IOTC_TRACK_MAX_EVENTS", "50"))
+        self.iou = iou
+        self.ttl = ttl
+        self.dwell_sec = dwell_sec
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.tracks = {}    # id -> Track
+        self.next_id = 1
+        self.events = []
+        self.since_drain = {"enter": 0, "exit": 0, "dropped": 0}
+        self.counters = {"updates": 0, "entered": 0, "exited": 0, "dwell": 0, "dropped_events": 0}
+        register_source(name, self.stats)
+
+    def _event(self, kind, track, now):
+        if kind in self.since_drain:
+            self.since_drain[kind] += 1
+        if len(self.events) >= self.max_events:
+            self.since_drain["dropped"] += 1
+            self.counters["dropped_events"] += 1
+            return
+        event = {"e": kind, "id": track.id, "c": track.class_name, "t": round(now, 1)}
+        if kind != "enter":
+            event["dwell"] = round(track.dwell(now if kind == "dwell" else None), 1)
+        self.events.append(event)
+
+    def _expire(self, now):
+        for track_id, track in list(self.tracks.items()):
+            if now - track.last_seen > self.ttl:
+                del self.tracks[track_id]
+                self.counters["exited"] += 1
+                self._event("exit", track, now)
+            elif not track.dwell_reported and track.dwell(now) >= self.dwell_sec:
+                track.dwell_reported = True
+                self.counters["dwell"] += 1
+                self._event("dwell", track, now)
+
+    def update(self, detections, now=None):
+        """Feed one on_detect_all payload."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.counters["updates"] += 1
+            free = {}
+            for track in self.tracks.values():
+                free.setdefault(track.class_name, []).append(track)
+            # Most confident first, so strong detections claim their tracks first
+            for name, conf, box in sorted(observations(detections), key=lambda o: -o[1]):
+                candidates = free.get(name) or []
+                match = None
+                if candidates and box is not None:
+                    boxed = [t for t in candidates if t.box is not None]
+                    if boxed:
+                        overlap = _iou([t.box for t in boxed], box)
+                        best = int(np.argmax(overlap))
+                        if overlap[best] >= self.iou or _near(boxed[best].box, box):
+                            match = boxed[best]
+                if match is None and candidates and (box is None or all(t.box is None for t in candidates)):
+                    match = max(candidates, key=lambda t: t.last_seen)
+                if match is not None:
+                    candidates.remove(match)
+                    match.last_seen = now
+                    match.box = box
+                    match.confidence = conf
+                    continue
+                track = Track(self.next_id, name, now, box, conf)
+                self.next_id += 1
+                self.tracks[track.id] = track
+                self.counters["entered"] += 1
+                self._event("enter", track, now)
+            self._expire(now)
+
+    def changed(self):
+        """Whether events are waiting for the next drain()."""
+        with self.lock:
+            self._expire(time.time())
+            return bool(self.events)
+
+    def drain(self, now=None):
+        """(events since the last drain, live tracks); expires stale tracks first."""
+        events, tracks, _ = self._drain(now)
+        return events, tracks
+
+    def _drain(self, now):
+        now = time.time() if now is None else now
+        with self.lock:
+            self._expire(now)
+            events, self.events = self.events, []
+            totals, self.since_drain = self.since_drain, {"enter": 0, "exit": 0, "dropped": 0}
+            tracks = list(self.tracks.values())
+        return events, tracks, totals
+
+    def fields(self, now=None):
+        """Drain and return the track_* telemetry fields."""
+        now = time.time() if now is None else now
+        events, tracks, totals = self._drain(now)
+        counts = {}
+        for track in tracks:
+            counts[track.class_name] = counts.get(track.class_name, 0) + 1
+        return {
+            "active_tracks": len(tracks),
+            "tracks_entered": totals["enter"],
+            "tracks_exited": totals["exit"],
+            "max_dwell_sec": round(max((t.dwell(now) for t in tracks), default=0.0), 1),
+            "track_counts_json": json.dumps(counts, separators=(",", ":")),
+            "track_events_json": json.dumps(events, separators=(",", ":")),
+            "track_events_dropped": totals["dropped"],
+        }
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            c["active"] = len(self.tracks)
+            c["queued_events"] = len(self.events)
+        return c
@@ -0,0 +1,126 @@
+"""Rate-capped, coalesced UI detection messages for the video apps.
+
+The video bricks report every frame, and the apps sent one websocket message
+per detected class per frame, each with its own timestamp. In a busy scene
+that is hundreds of messages a second for the browser to render. UIStream
+sits between the detection callback and ui.send_message():
+
+- a frame's detections become one list of messages with one timestamp,
+- frames are sent by a background thread at most IOTC_UI_FPS times a second
+  (default 10; 0 sends inline, uncapped),
+- latest wins: a frame that arrives while the previous one is still waiting
+  replaces it, so a slow consumer sees the current scene, not a backlog,
+- a browser that connects gets the latest frame right away.
+
+Messages are broadcast, so the cap holds for every connection alike.
+
+With IOTC_UI_COMPACT=1 a frame is a single "detections" message,
+{"timestamp": ..., "items": [[class_name, confidence], ...]}, for a page that
+handles it. Otherwise the messages keep the shape the stock App Lab pages
+expect (one "detection" per class, or one "classifications" JSON list).
+Frames in / sent / coalesced are reported under "ui_stream" in /metrics.
+
+Usage in an app:
+    from iotc_ui_stream import UIStream
+    STREAM = UIStream(ui)
+    ui.on_connect(STREAM.on_connect)
+    STREAM.publish(from_scores(detections))
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, UTC
+
+from iotc_profiling import register_source
+
+
+def frame_messages(dets, compact=False, legacy="detection"):
+    """[(message_type, message)] for one frame of Detections."""
+    timestamp = datetime.now(UTC).isoformat()
+    pairs = [(d.get("class_name", ""), round(float(d.get("confidence", 0.0)), 4)) for d in dets.items]
+    if compact:
+        return [("detections", {"timestamp": timestamp, "items": [list(p) for p in pairs]})]
+    entries = [{"content": name, "confidence": conf, "timestamp": timestamp} for name, conf in pairs]
+    if legacy == "classifications":
+        return [("classifications", json.dumps(entries))] if entries else []
+    return [(legacy, entry) for entry in entries]
+
+
+class UIStream:
+    def __init__(self, ui, fps=None, compact=None, legacy="detection", name="ui_stream"):
+        if fps is None:
+            fps = float(os.environ.get("IOTC_UI_FPS", "10"))
+        if compact is None:
+            compact = os.environ.get("IOTC_UI_COMPACT", "0") == "1"
+        self.ui = ui
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.compact = compact
+        self.legacy = legacy
+        self.cond = threading.Condition()
+        self.pending = None
+        self.latest = None
+        self.thread = None
+        self.counters = {"frames_in": 0, "frames_sent": 0, "coalesced": 0, "messages_sent": 0, "replays": 0}
+        register_source(name, self.stats)
+
+    def publish(self, dets):
+        """Queue one frame (a Detections); replaces a frame that has not been sent yet."""
+        messages = frame_messages(dets, self.compact, self.legacy)
+        if not self.interval:
+            with self.cond:
+                self.counters["frames_in"] += 1
+                self.latest = messages
+            self._send(messages)
+            return
+        with self.cond:
+            self.counters["frames_in"] += 1
+            if self.pending is not None:
+                self.counters["coalesced"] += 1
+            self.pending = messages
+            self.latest = messages
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="iotc-ui-stream", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                messages, self.pending = self.pending, None
+            started = time.monotonic()
+            self._send(messages)
+            # Frames arriving during this pause coalesce into the next send
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _send(self, messages, room=None):
+        for message_type, message in messages:
+            try:
+                if room is None:
+                    self.ui.send_message(message_type, message=message)
+                else:
+                    self.ui.send_message(message_type, message=message, room=room)
+            except Exception as e:
+                print(f"ui stream send failed: {e}")
+        with self.cond:
+            self.counters["frames_sent"] += 1
+            self.counters["messages_sent"] += len(messages)
+
+    def on_connect(self, sid, data=None):
+        """ui.on_connect handler: send the latest frame to the new connection."""
+        with self.cond:
+            messages = self.latest
+            if messages:
+                self.counters["replays"] += 1
+        if messages:
+            self._send(messages, room=sid)
+
+    def stats(self):
+        with self.cond:
+            c = dict(self.counters)
+        c["fps_cap"] = round(1.0 / self.interval, 3) if self.interval else 0.0
+        c["compact"] = self.compact
+        return c
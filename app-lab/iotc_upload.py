@@ -0,0 +1,192 @@
+"""Binary image upload endpoint for the image apps.
+
+Sending a photo through the websocket means base64 inside JSON: a third
+larger, parsed as one multi-MB str, then decoded into a second copy.
+upload_endpoint() returns a handler for ui.expose_api("POST", ...) that takes
+the image as an HTTP body instead:
+
+- raw body (Content-Type image/* or application/octet-stream), or
+- multipart/form-data with the image as a file part; other small parts are
+  read as parameters,
+- plain or chunked transfer encoding: the body is read from request.stream()
+  into one bytearray (preallocated from Content-Length when there is one),
+  capped at IOTC_UPLOAD_MAX_MB (default 16), and never becomes a str.
+
+Parameters (confidence, image_type, result_format, ...) come from the query
+string and/or multipart fields. The bytes are handed to the app's run
+function as parsed["image_bytes"] on the inference executor; the HTTP
+response is whatever that function returns (the detection_result message),
+and the result is still pushed to the websocket as before. A request turned
+away as busy, at submit() or by a BusyError the job raises (charge()), gets
+503 with the reason; 422 means the detection itself failed.
+
+    curl -X POST --data-binary @photo.jpg -H "Content-Type: image/jpeg" \\
+        "$APP_URL/detect_objects?confidence=0.4"
+    curl -X POST -F image=@photo.jpg -F confidence=0.4 "$APP_URL/detect_objects"
+
+($APP_URL being wherever the app's WebUI serves its API routes.)
+
+Usage in an app:
+    from iotc_upload import upload_endpoint
+    ui.expose_api("POST", "/detect_objects", upload_endpoint(INFERENCE, run_detect_objects, reject_busy))
+"""
+
+import asyncio
+import os
+
+from iotc_inference import BusyError
+
+try:
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+except ImportError:
+    # Off-device tools (the harness) run without the web stack
+    Request = None
+    JSONResponse = None
+
+MAX_FIELD_BYTES = 4096
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _max_bytes():
+    return int(float(os.environ.get("IOTC_UPLOAD_MAX_MB", "16")) * 1024 * 1024)
+
+
+def _respond(payload, status=200):
+    if JSONResponse is None:
+        return payload
+    return JSONResponse(payload, status_code=status)
+
+
+async def read_body(request, max_bytes):
+    """Whole request body as a bytearray, refusing more than max_bytes."""
+    length = request.headers.get("content-length")
+    expected = int(length) if length and length.isdigit() else None
+    if expected is not None and expected > max_bytes:
+        raise UploadError(f"body is {expected} bytes, limit is {max_bytes}", 413)
+    if expected is not None:
+        body = bytearray(expected)
+        view = memoryview(body)
+        size = 0
+        async for chunk in request.stream():
+            end = size + len(chunk)
+            if end > expected:
+                raise UploadError("body longer than Content-Length")
+            view[size:end] = chunk
+            size = end
+        view.release()
+        del body[size:]
+        return body
+    # Chunked transfer: no length up front, grow as chunks arrive
+    body = bytearray()
+    async for chunk in request.stream():
+        if len(body) + len(chunk) > max_bytes:
+            raise UploadError(f"body exceeds {max_bytes} bytes", 413)
+        body += chunk
+    return body
+
+
+def _content_type(headers):
+    value = headers.get("content-type") or ""
+    main, _, rest = value.partition(";")
+    params = {}
+    for item in rest.split(";"):
+        key, _, val = item.strip().partition("=")
+        if key:
+            params[key.lower()] = val.strip().strip('"')
+    return main.strip().lower(), params
+
+
+def split_multipart(body, boundary):
+    """(image bytes, fields) from a multipart body; the image is cut out of body in place."""
+    delimiter = b"--" + boundary.encode("latin-1")
+    fields = {}
+    image_span = None
+    pos = body.find(delimiter)
+    while pos >= 0:
+        start = pos + len(delimiter)
+        if body[start:start + 2] == b"--":
+            break
+        header_end = body.find(b"\r\n\r\n", start)
+        if header_end < 0:
+            break
+        headers = bytes(body[start:header_end]).decode("latin-1").lower()
+        data_start = header_end + 4
+        next_pos = body.find(b"\r\n" + delimiter, data_start)
+        if next_pos < 0:
+            break
+        name = None
+        for part in headers.split(";"):
+            key, _, val = part.strip().partition("=")
+            if key == "name":
+                name = val.strip('"')
+        is_file = "filename=" in headers or "content-type: image/" in headers
+        if is_file and image_span is None:
+            image_span = (data_start, next_pos)
+        elif name and next_pos - data_start <= MAX_FIELD_BYTES:
+            fields[name] = bytes(body[data_start:next_pos]).decode("utf-8", "replace")
+        pos = next_pos + 2
+    if image_span is None:
+        raise UploadError("multipart body has no file part")
+    # Trim around the file part instead of copying it out
+    del body[image_span[1]:]
+    del body[:image_span[0]]
+    return body, fields
+
+
+def _coerce(fields):
+    params = {}
+    for key, value in fields.items():
+        if key == "confidence":
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+        params[key] = value
+    return params
+
+
+def upload_endpoint(executor, run, on_busy=None, max_bytes=None):
+    """Async expose_api handler that runs run(client_id, parsed) with parsed["image_bytes"]."""
+    limit = max_bytes if max_bytes is not None else _max_bytes()
+
+    async def upload_image(request: Request):
+        params = dict(request.query_params)
+        try:
+            body = await read_body(request, limit)
+            content_type, ct_params = _content_type(request.headers)
+            if content_type == "multipart/form-data":
+                if not ct_params.get("boundary"):
+                    raise UploadError("multipart body without boundary")
+                body, fields = split_multipart(body, ct_params["boundary"])
+                params.update(fields)
+            elif content_type and not (content_type.startswith("image/") or content_type == "application/octet-stream"):
+                raise UploadError(f"unsupported content type {content_type}", 415)
+            if not body:
+                raise UploadError("empty body")
+        except UploadError as e:
+            return _respond({"success": False, "error": str(e)}, e.status)
+
+        parsed = _coerce(params)
+        parsed["image_bytes"] = body
+        try:
+            future = executor.submit(run, "http", parsed, cost_bytes=len(body))
+        except BusyError as e:
+            if on_busy is not None:
+                on_busy(e, parsed)
+            return _respond({"success": False, "error": "busy", "reason": e.reason, "queue_depth": e.queue_depth}, 503)
+        try:
+            result = await asyncio.wrap_future(future)
+        except BusyError as e:
+            # Raised inside the job (charge()); the run function already called on_busy
+            return _respond({"success": False, "error": "busy", "reason": e.reason, "queue_depth": e.queue_depth}, 503)
+        if result is None:
+            return _respond({"success": False, "error": "detection failed"}, 422)
+        return _respond(result)
+
+    return upload_image
@@ -0,0 +1,168 @@
+"""Rolling per-class detection statistics over 1 s / 10 s / 60 s windows.
+
+Interval telemetry used to be one snapshot of the frame that happened to
+arrive when IOTC_INTERVAL_SEC had passed; everything between two snapshots
+was lost. RollingWindows keeps a ring of time buckets instead
+(IOTC_WINDOW_RES seconds each, default 0.5, covering the longest window) with
+fixed NumPy arrays per bucket:
+
+- frames seen and frames with at least one detection,
+- per class: detection count, confidence sum and confidence max.
+
+update() touches one bucket row (plus clearing buckets skipped since the last
+call), so the cost per callback does not depend on the window length.
+Classes get a column on first sight, up to IOTC_WINDOW_MAX_CLASSES (default
+32); later ones are counted under "other". Windows are summed only when
+fields() builds the telemetry:
+
+    detections_1s / detections_10s / detections_60s
+    active_ratio_60s    share of frames with a detection
+    window_json         {"1s": {class: [count, mean, max]}, "10s": ..., "60s": ...}
+
+Usage in an app:
+    from iotc_windows import RollingWindows
+    WINDOWS = RollingWindows()
+    WINDOWS.update(dets)                  # Detections, in the callback
+    payload.update(WINDOWS.fields())      # in the interval telemetry
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from iotc_profiling import register_source
+
+WINDOWS_SEC = (1, 10, 60)
+WINDOW_FIELDS = ("detections_1s", "detections_10s", "detections_60s", "active_ratio_60s", "window_json")
+OTHER = "other"
+
+
+class RollingWindows:
+    def __init__(self, windows=WINDOWS_SEC, resolution=None, max_classes=None, name="windows"):
+        if resolution is None:
+            resolution = float(os.environ.get("IOTC_WINDOW_RES", "0.5"))
+        if max_classes is None:
+            max_classes = int(os.environ.get("IOTC_WINDOW_MAX_CLASSES", "32"))
+        self.windows = tuple(windows)
+        self.resolution = max(0.05, resolution)
+        self.slots = int(math.ceil(max(self.windows) / self.resolution))
+        self.max_classes = max(1, max_classes)
+        self.lock = threading.Lock()
+        self.classes = {}    # class_name -> column
+        self.bucket = np.full(self.slots, -1, dtype=np.int64)    # bucket number held by each slot
+        self.frames = np.zeros(self.slots, dtype=np.int64)
+        self.active = np.zeros(self.slots, dtype=np.int64)
+        self.count = np.zeros((self.slots, self.max_classes), dtype=np.int64)
+        self.conf_sum = np.zeros((self.slots, self.max_classes), dtype=np.float64)
+        self.conf_max = np.zeros((self.slots, self.max_classes), dtype=np.float64)
+        self.last = None
+        self.updates = 0
+        register_source(name, self.stats)
+
+    def _column(self, name):
+        column = self.classes.get(name)
+        if column is None:
+            if len(self.classes) < self.max_classes - 1:
+                column = self.classes[name] = len(self.classes)
+            else:
+                column = self.classes.setdefault(OTHER, self.max_classes - 1)
+        return column
+
+    def _advance(self, bucket):
+        # Clear the slots for every bucket between the last update and this one
+        if self.last is not None and bucket <= self.last:
+            return
+        start = bucket - self.slots + 1 if self.last is None else max(self.last + 1, bucket - self.slots + 1)
+        for b in range(start, bucket + 1):
+            slot = b % self.slots
+            self.bucket[slot] = b
+            self.frames[slot] = 0
+            self.active[slot] = 0
+            self.count[slot] = 0
+            self.conf_sum[slot] = 0.0
+            self.conf_max[slot] = 0.0
+        self.last = bucket
+
+    def update(self, dets, now=None):
+        """Count one frame's Detections."""
+        now = time.time() if now is None else now
+        bucket = int(now // self.resolution)
+        with self.lock:
+            self._advance(bucket)
+            slot = bucket % self.slots
+            if self.bucket[slot] != bucket:
+                return    # older than the ring
+            self.updates += 1
+            self.frames[slot] += 1
+            if len(dets):
+                self.active[slot] += 1
+            for item in dets.items:
+                column = self._column(str(item.get("class_name", "")))
+                conf = float(item.get("confidence", 0.0))
+                self.count[slot, column] += 1
+                self.conf_sum[slot, column] += conf
+                if conf > self.conf_max[slot, column]:
+                    self.conf_max[slot, column] = conf
+
+    def summary(self, now=None):
+        """{window_sec: {"frames", "active_frames", "detections", "classes": {name: [count, mean, max]}}}."""
+        now = time.time() if now is None else now
+        current = int(now // self.resolution)
+        with self.lock:
+            self._advance(current)
+            bucket = self.bucket.copy()
+            frames = self.frames.copy()
+            active = self.active.copy()
+            count = self.count.copy()
+            conf_sum = self.conf_sum.copy()
+            conf_max = self.conf_max.copy()
+            classes = dict(self.classes)
+        result = {}
+        for window in self.windows:
+            span = max(1, int(round(window / self.resolution)))
+            mask = bucket > current - span
+            counts = count[mask].sum(axis=0)
+            sums = conf_sum[mask].sum(axis=0)
+            maxes = conf_max[mask].max(axis=0) if mask.any() else np.zeros(self.max_classes)
+            per_class = {}
+            for name, column in classes.items():
+                n = int(counts[column])
+                if n:
+                    per_class[name] = [n, round(float(sums[column] / n), 3), round(float(maxes[column]), 3)]
+            result[window] = {
+                "frames": int(frames[mask].sum()),
+                "active_frames": int(active[mask].sum()),
+                "detections": int(counts.sum()),
+                "classes": per_class,
+            }
+        return result
+
+    def fields(self, now=None):
+        """WINDOW_FIELDS telemetry for the standard 1 s / 10 s / 60 s windows."""
+        summary = self.summary(now)
+        fields = {}
+        for window in self.windows:
+            fields[f"detections_{window}s"] = summary[window]["detections"]
+        longest = summary[max(self.windows)]
+        fields[f"active_ratio_{max(self.windows)}s"] = (
+            round(longest["active_frames"] / longest["frames"], 3) if longest["frames"] else 0.0)
+        fields["window_json"] = json.dumps(
+            {f"{w}s": summary[w]["classes"] for w in self.windows}, separators=(",", ":"))
+        return fields
+
+    def stats(self):
+        summary = self.summary()
+        with self.lock:
+            updates = self.updates
+            classes = len(self.classes)
+        return {
+            "updates": updates,
+            "classes": classes,
+            "resolution_sec": self.resolution,
+            "slots": self.slots,
+            "windows": {f"{w}s": summary[w] for w in self.windows},
+        }
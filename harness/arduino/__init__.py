@@ -0,0 +1 @@
+"""Headless stand-in for the Arduino App Lab runtime (see harness/README.md)."""
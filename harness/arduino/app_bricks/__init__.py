@@ -0,0 +1,5 @@
+"""Headless stand-ins for arduino.app_bricks.
+
+Each brick records its calls in harness_runtime.STATE and returns scripted
+results from the scenario's "bricks" section (keyed "<Class>.<method>").
+"""
@@ -0,0 +1,15 @@
+"""Callback-driven bricks. Scenario events fire them with {"callback": "<Class>.<method>[:<label>]"}."""
+
+from harness_runtime import STATE
+
+
+class CallbackBrick:
+    def __init__(self, **kwargs):
+        self.options = kwargs
+
+    def _on(self, method, callback, label=None):
+        key = f"{type(self).__name__}.{method}"
+        STATE.register(f"{key}:{label}" if label is not None else key, callback)
+
+    def _count(self, method):
+        STATE.recorder.count(f"{type(self).__name__}.{method}")
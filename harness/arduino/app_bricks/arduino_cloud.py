@@ -0,0 +1,9 @@
+from arduino.app_bricks._streams import CallbackBrick
+
+
+class ArduinoCloud(CallbackBrick):
+    def register(self, name, value=None, on_write=None):
+        # Fire with {"callback": "ArduinoCloud.on_write:<name>", "args": [null, <value>]}
+        self._count("register")
+        if on_write is not None:
+            self._on("on_write", on_write, name)
@@ -0,0 +1,10 @@
+from harness_runtime import STATE
+
+
+class AudioClassification:
+    def __init__(self, **kwargs):
+        pass
+
+    @staticmethod
+    def classify_from_file(audio, confidence=None):
+        return STATE.brick_call("AudioClassification.classify_from_file")
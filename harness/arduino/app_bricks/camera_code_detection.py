@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+
+from arduino.app_bricks._streams import CallbackBrick
+from harness_runtime import STATE
+
+
+@dataclass
+class Detection:
+    content: str
+    type: str
+    coords: tuple = (0, 0, 0, 0)
+
+
+class CameraCodeDetection(CallbackBrick):
+    def __init__(self, camera=None, **kwargs):
+        super().__init__(**kwargs)
+        self.camera = camera
+
+    def on_detect(self, callback):
+        self._on("on_detect", callback)
+
+    def on_frame(self, callback):
+        self._on("on_frame", callback)
+
+    def on_error(self, callback):
+        self._on("on_error", callback)
+
+    def detect(self, image):
+        # Scripted as a list of {"content": ..., "type": ...}
+        return [Detection(**d) for d in STATE.brick_call("CameraCodeDetection.detect", [])]
+
+
+def draw_bounding_box(frame, detection):
+    STATE.recorder.count("camera_code_detection.draw_bounding_box")
+    return frame
@@ -0,0 +1,23 @@
+from harness_runtime import STATE
+
+
+class CloudModel:
+    GOOGLE_GEMINI = "google-gemini"
+    OPENAI_GPT = "openai-gpt"
+    ANTHROPIC_CLAUDE = "anthropic-claude"
+
+
+class CloudLLM:
+    def __init__(self, model=None, system_prompt="", **kwargs):
+        self.model = model
+        self.system_prompt = system_prompt
+
+    def with_memory(self, *args, **kwargs):
+        return self
+
+    def chat(self, prompt):
+        return "".join(self.chat_stream(prompt))
+
+    def chat_stream(self, prompt):
+        chunks = STATE.brick_call("CloudLLM.chat_stream", ["<p>Once upon a time.</p>"])
+        yield from chunks
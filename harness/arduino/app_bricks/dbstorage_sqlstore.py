@@ -0,0 +1,35 @@
+import threading
+
+from harness_runtime import STATE
+
+
+class SQLStore:
+    """In-memory table store."""
+
+    def __init__(self, database_name="", **kwargs):
+        self.database_name = database_name
+        self.lock = threading.Lock()
+        self.tables = {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def create_table(self, table, columns=None):
+        with self.lock:
+            self.tables.setdefault(table, [])
+
+    def store(self, table, data, create_table=True):
+        STATE.recorder.count("SQLStore.store")
+        with self.lock:
+            self.tables.setdefault(table, []).append(dict(data))
+
+    def read(self, table, condition=None, order_by=None, limit=None, **kwargs):
+        STATE.recorder.count("SQLStore.read")
+        with self.lock:
+            rows = list(self.tables.get(table, []))
+        if order_by and "desc" in str(order_by).lower():
+            rows.reverse()
+        return rows[:limit] if limit else rows
@@ -0,0 +1,29 @@
+import threading
+
+from harness_runtime import STATE
+
+
+class TimeSeriesStore:
+    """In-memory store; read_samples() returns (measure, ts, value) rows like the real brick."""
+
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def write_sample(self, measure, value, ts=None):
+        STATE.recorder.count("TimeSeriesStore.write_sample")
+        with self.lock:
+            self.samples.setdefault(measure, []).append((measure, ts, value))
+
+    def read_samples(self, measure=None, start_from=None, end_till=None, aggr_window=None,
+                     aggr_func=None, limit=None, **kwargs):
+        STATE.recorder.count("TimeSeriesStore.read_samples")
+        with self.lock:
+            rows = list(self.samples.get(measure, []))
+        return rows[-limit:] if limit else rows
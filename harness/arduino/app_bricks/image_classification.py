@@ -0,0 +1,9 @@
+from harness_runtime import STATE
+
+
+class ImageClassification:
+    def __init__(self, confidence=0.3, **kwargs):
+        self.confidence = confidence
+
+    def classify(self, image, image_type=None, confidence=None):
+        return STATE.brick_call("ImageClassification.classify", {"classification": []})
@@ -0,0 +1,6 @@
+from arduino.app_bricks._streams import CallbackBrick
+
+
+class KeywordSpotting(CallbackBrick):
+    def on_detect(self, keyword, callback):
+        self._on("on_detect", callback, keyword)
@@ -0,0 +1,13 @@
+from arduino.app_bricks._streams import CallbackBrick
+
+
+class MotionDetection(CallbackBrick):
+    def __init__(self, confidence=0.4, **kwargs):
+        super().__init__(**kwargs)
+        self.confidence = confidence
+
+    def on_movement_detection(self, label, callback):
+        self._on("on_movement_detection", callback, label)
+
+    def accumulate_samples(self, sample):
+        self._count("accumulate_samples")
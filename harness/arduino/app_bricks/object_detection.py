@@ -0,0 +1,13 @@
+from harness_runtime import STATE
+
+
+class ObjectDetection:
+    def __init__(self, confidence=0.3, **kwargs):
+        self.confidence = confidence
+
+    def detect(self, image, image_type=None, confidence=None):
+        return STATE.brick_call("ObjectDetection.detect", {"detection": []})
+
+    def draw_bounding_boxes(self, image, detections):
+        STATE.recorder.count("ObjectDetection.draw_bounding_boxes")
+        return image
@@ -0,0 +1,13 @@
+from arduino.app_bricks._streams import CallbackBrick
+
+
+class VibrationAnomalyDetection(CallbackBrick):
+    def __init__(self, anomaly_detection_threshold=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.anomaly_detection_threshold = anomaly_detection_threshold
+
+    def on_anomaly(self, callback):
+        self._on("on_anomaly", callback)
+
+    def accumulate_samples(self, sample):
+        self._count("accumulate_samples")
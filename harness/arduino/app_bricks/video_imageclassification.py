@@ -0,0 +1,18 @@
+from arduino.app_bricks._streams import CallbackBrick
+
+
+class VideoImageClassification(CallbackBrick):
+    def __init__(self, confidence=0.3, debounce_sec=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.confidence = confidence
+        self.debounce_sec = debounce_sec
+
+    def on_detect_all(self, callback):
+        self._on("on_detect_all", callback)
+
+    def on_detect(self, label, callback):
+        self._on("on_detect", callback, label)
+
+    def override_threshold(self, value):
+        self._count("override_threshold")
+        self.confidence = float(value)
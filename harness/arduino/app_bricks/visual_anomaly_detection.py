@@ -0,0 +1,9 @@
+from harness_runtime import STATE
+
+
+class VisualAnomalyDetection:
+    def __init__(self, **kwargs):
+        pass
+
+    def detect(self, image, image_type=None):
+        return STATE.brick_call("VisualAnomalyDetection.detect", {"detection": []})
@@ -0,0 +1,22 @@
+from harness_runtime import STATE
+
+
+class WaveGenerator:
+    def __init__(self, **kwargs):
+        self.state = {"frequency": 440.0, "amplitude": 0.0, "volume": 100}
+        self.state.update({k: v for k, v in kwargs.items() if k in self.state})
+
+    def set_frequency(self, value):
+        STATE.recorder.count("WaveGenerator.set_frequency")
+        self.state["frequency"] = float(value)
+
+    def set_amplitude(self, value):
+        STATE.recorder.count("WaveGenerator.set_amplitude")
+        self.state["amplitude"] = float(value)
+
+    def set_volume(self, value):
+        STATE.recorder.count("WaveGenerator.set_volume")
+        self.state["volume"] = int(value)
+
+    def get_state(self):
+        return dict(self.state)
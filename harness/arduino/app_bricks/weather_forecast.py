@@ -0,0 +1,15 @@
+from types import SimpleNamespace
+
+from harness_runtime import STATE
+
+
+class WeatherForecast:
+    def __init__(self, **kwargs):
+        pass
+
+    def get_forecast_by_city(self, city):
+        result = STATE.brick_call(
+            "WeatherForecast.get_forecast_by_city",
+            {"category": "sunny", "description": "Clear sky"},
+        )
+        return SimpleNamespace(**result)
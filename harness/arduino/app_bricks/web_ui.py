@@ -0,0 +1,21 @@
+from harness_runtime import STATE
+
+
+class WebUI:
+    def __init__(self, *args, **kwargs):
+        STATE.recorder.count("WebUI.__init__")
+
+    def on_message(self, message_type, callback):
+        STATE.register(f"ui:{message_type}", callback)
+
+    def on_connect(self, callback):
+        STATE.register("connect", callback)
+
+    def on_disconnect(self, callback):
+        STATE.register("disconnect", callback)
+
+    def expose_api(self, method, path, callback):
+        STATE.register(f"api:{method.upper()} {path}", callback)
+
+    def send_message(self, message_type, message=None, room=None):
+        STATE.recorder.ui_message(message_type, message)
@@ -0,0 +1,14 @@
+from harness_runtime import STATE
+
+
+class USBCamera:
+    def __init__(self, resolution=(640, 480), fps=10, **kwargs):
+        self.resolution = tuple(resolution)
+        self.fps = fps
+        STATE.recorder.count("USBCamera.__init__")
+
+    def start(self):
+        STATE.recorder.count("USBCamera.start")
+
+    def stop(self):
+        STATE.recorder.count("USBCamera.stop")
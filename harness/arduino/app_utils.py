@@ -0,0 +1,55 @@
+"""Headless stand-ins for arduino.app_utils."""
+
+import logging
+import sys
+
+from harness_runtime import STATE
+
+__all__ = ["App", "Bridge", "Logger", "FrameDesigner", "draw_anomaly_markers"]
+
+
+class App:
+    @staticmethod
+    def run(user_loop=None):
+        # On the board this blocks forever; here it plays the scenario and returns.
+        STATE.run_scenario(user_loop)
+
+
+class Bridge:
+    @staticmethod
+    def provide(name, fn):
+        STATE.register(f"bridge:{name}", fn)
+
+    @staticmethod
+    def call(name, *args, **kwargs):
+        return STATE.brick_call(f"Bridge.call:{name}")
+
+    @staticmethod
+    def notify(name, *args, **kwargs):
+        STATE.brick_call(f"Bridge.notify:{name}")
+
+
+class Logger(logging.Logger):
+    def __init__(self, name, level=logging.INFO):
+        super().__init__(name, level)
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(levelname)s [%(name)s] %(message)s"))
+        self.addHandler(handler)
+
+
+class FrameDesigner:
+    width = 13
+    height = 8
+
+    def __init__(self, *args, **kwargs):
+        STATE.recorder.count("FrameDesigner.__init__")
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            return STATE.brick_call(f"FrameDesigner.{name}")
+        return method
+
+
+def draw_anomaly_markers(image, results, *args, **kwargs):
+    STATE.recorder.count("draw_anomaly_markers")
+    return image
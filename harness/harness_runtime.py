@@ -0,0 +1,560 @@
+"""Shared state for the headless app harness.
+
+The fake arduino package (harness/arduino) and run_app.py both import STATE from
+here. It holds:
+
+- VirtualClock: replaces time.time / time.monotonic / time.sleep. Virtual time
+  only moves when the scenario advances it; sleeping threads wake at their own
+  deadlines, in order.
+- Recorder: per-handler call counts, errors and real (perf_counter) latency,
+  plus counters for brick calls, UI messages, Bridge.call and relay telemetry.
+- Handler registry: everything the app registers (Bridge.provide, ui.on_message,
+  ui.expose_api, ui.on_connect, brick callbacks) so scenario events can call it.
+- Scripted brick results and simulated brick latency from the scenario file.
+- RelayPeer: the relay-server end of a socketpair used by HarnessRelayClient, so
+  the app's real IoTConnectRelayClient encoding and receive loop are exercised.
+"""
+
+import asyncio
+import base64
+import collections
+import copy
+import heapq
+import importlib
+import inspect
+import itertools
+import json
+import math
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+_real_time = time.time
+_real_monotonic = time.monotonic
+_real_sleep = time.sleep
+
+# How long advance_to() waits for woken sleepers to go back to sleep before it
+# moves the clock again (real seconds).
+SETTLE_TIMEOUT_SEC = 0.05
+
+
+class VirtualClock:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.base_wall = _real_time()
+        self.base_mono = _real_monotonic()
+        self.offset = 0.0
+        self.deadlines = []     # heap of pending sleeper deadlines
+        self.sleeping = 0
+        self.running = True
+        self.installed = False
+        self.local = threading.local()
+
+    def now(self):
+        return self.offset
+
+    def time(self):
+        return self.base_wall + self.offset
+
+    def monotonic(self):
+        return self.base_mono + self.offset
+
+    def sleep(self, seconds):
+        if not self.running or seconds is None or seconds <= 0:
+            _real_sleep(0)
+            return
+        started = _real_monotonic()
+        with self.cond:
+            deadline = self.offset + float(seconds)
+            heapq.heappush(self.deadlines, deadline)
+            self.sleeping += 1
+            try:
+                while self.running and self.offset < deadline:
+                    self.cond.wait()
+            finally:
+                self.sleeping -= 1
+                self.deadlines.remove(deadline)
+                heapq.heapify(self.deadlines)
+                self.cond.notify_all()
+        self.local.slept = self.slept() + (_real_monotonic() - started)
+
+    def slept(self):
+        """Real seconds this thread has spent blocked in sleep()."""
+        return getattr(self.local, "slept", 0.0)
+
+    def advance_to(self, target):
+        # Step through sleeper deadlines so periodic loops see every tick.
+        with self.cond:
+            while self.offset < target:
+                due = self.deadlines[0] if self.deadlines else None
+                if due is None or due > target:
+                    self.offset = target
+                    self.cond.notify_all()
+                    return
+                before = self.sleeping
+                self.offset = max(self.offset, due)
+                self.cond.notify_all()
+                # Let woken threads run and go back to sleep (or time out).
+                self.cond.wait_for(
+                    lambda: self.sleeping >= before and (not self.deadlines or self.deadlines[0] > self.offset),
+                    timeout=SETTLE_TIMEOUT_SEC,
+                )
+
+    def install(self):
+        time.time = self.time
+        time.monotonic = self.monotonic
+        time.sleep = self.sleep
+        self.installed = True
+
+    def stop(self):
+        """Wake every sleeper; later sleep() calls return immediately."""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def release(self):
+        self.stop()
+        if self.installed:
+            time.time = _real_time
+            time.monotonic = _real_monotonic
+            time.sleep = _real_sleep
+            self.installed = False
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    if lo == hi:
+        return sorted_values[int(k)]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = collections.defaultdict(list)   # handler key -> [ms]
+        self.errors = collections.Counter()
+        self.calls = collections.Counter()               # brick calls
+        self.ui_messages = collections.Counter()
+        self.ui_bytes = collections.Counter()
+        self.telemetry_frames = 0
+        self.telemetry_bytes = 0
+        self.telemetry_keys = collections.Counter()
+        self.started = None
+        self.finished = None
+
+    def record(self, key, duration_ms, ok=True):
+        with self.lock:
+            self.durations[key].append(duration_ms)
+            if not ok:
+                self.errors[key] += 1
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.calls[key] += n
+
+    def ui_message(self, message_type, message):
+        try:
+            size = len(json.dumps(message, default=str))
+        except Exception:
+            size = 0
+        with self.lock:
+            self.ui_messages[message_type] += 1
+            self.ui_bytes[message_type] += size
+
+    def telemetry(self, raw_line, data):
+        with self.lock:
+            self.telemetry_frames += 1
+            self.telemetry_bytes += len(raw_line)
+            if isinstance(data, dict):
+                self.telemetry_keys.update(data.keys())
+
+    def report(self):
+        elapsed = (self.finished or _real_monotonic()) - (self.started or _real_monotonic())
+        handlers = {}
+        with self.lock:
+            for key, values in sorted(self.durations.items()):
+                ordered = sorted(values)
+                handlers[key] = {
+                    "count": len(ordered),
+                    "errors": self.errors.get(key, 0),
+                    "mean_ms": sum(ordered) / len(ordered) if ordered else 0.0,
+                    "p50_ms": _percentile(ordered, 50),
+                    "p95_ms": _percentile(ordered, 95),
+                    "p99_ms": _percentile(ordered, 99),
+                    "max_ms": ordered[-1] if ordered else 0.0,
+                    "per_sec": len(ordered) / elapsed if elapsed > 0 else 0.0,
+                }
+            return {
+                "elapsed_sec": elapsed,
+                "virtual_sec": STATE.clock.now(),
+                "handlers": handlers,
+                "brick_calls": dict(sorted(self.calls.items())),
+                "ui_messages": {
+                    k: {"count": n, "bytes": self.ui_bytes[k]} for k, n in sorted(self.ui_messages.items())
+                },
+                "telemetry": {
+                    "frames": self.telemetry_frames,
+                    "bytes": self.telemetry_bytes,
+                    "keys": dict(sorted(self.telemetry_keys.items())),
+                },
+            }
+
+
+class RelayPeer:
+    """Relay-server side of the harness socketpair."""
+
+    def __init__(self):
+        self.sock = None
+        self.client_id = None
+        self.reader = None
+        self.send_lock = threading.Lock()
+        self.pending = 0
+        self.cond = threading.Condition()
+
+    def attach(self, sock):
+        self.sock = sock
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    def _read_loop(self):
+        for raw in self.sock.makefile("r", encoding="utf-8"):
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"[harness] invalid JSON from app relay client: {e}")
+                continue
+            if message.get("type") == "register":
+                self.client_id = message.get("client_id")
+                self.send({"type": "response", "status": "registered"})
+            elif message.get("type") == "telemetry":
+                STATE.recorder.telemetry(line, message.get("data"))
+
+    def send(self, message):
+        if self.sock is None:
+            return False
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self.send_lock:
+            self.sock.sendall(data)
+        return True
+
+    def command(self, command_name, parameters):
+        with self.cond:
+            self.pending += 1
+        if not self.send({"type": "command", "command_name": command_name, "parameters": parameters}):
+            self.command_done()
+            print(f"[harness] relay not connected, dropped command {command_name}")
+
+    def command_done(self):
+        with self.cond:
+            self.pending -= 1
+            self.cond.notify_all()
+
+    def wait_idle(self, timeout=10.0):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending <= 0, timeout=timeout)
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.join(timeout=2.0)
+
+
+def make_relay_client_class(base):
+    """Subclass the app-lab IoTConnectRelayClient to talk to RelayPeer over a socketpair."""
+
+    class HarnessRelayClient(base):
+        def connect(self):
+            if STATE.relay.sock is not None:
+                # One session per run; no reconnects after the harness closes it.
+                return False
+            app_end, harness_end = socket.socketpair()
+            self.socket = app_end
+            self.socket.settimeout(0.5)
+            self.connected = True
+            STATE.relay.attach(harness_end)
+            self._send_message({"type": "register", "client_id": self.client_id})
+            self.receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
+            self.receive_thread.start()
+            STATE.relays.append(self)
+            return True
+
+        def _handle_server_message(self, message):
+            if message.get("type") == "command":
+                command_name = message.get("command_name")
+                try:
+                    if self.command_callback:
+                        STATE.call_handler(
+                            f"relay:{command_name}",
+                            self.command_callback,
+                            command_name,
+                            message.get("parameters", ""),
+                        )
+                finally:
+                    STATE.relay.command_done()
+                return
+            super()._handle_server_message(message)
+
+    HarnessRelayClient.__name__ = base.__name__
+    return HarnessRelayClient
+
+
+class FakeRequest:
+    """Just enough of a starlette Request for upload endpoints: headers, query_params, stream()."""
+
+    def __init__(self, body, content_type, query=None, chunk_size=65536, chunked=False):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {"content-type": content_type}
+        if not chunked:
+            self.headers["content-length"] = str(len(body))
+        self.query_params = dict(query or {})
+
+    async def stream(self):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+
+def _multipart(field, filename, data, content_type, fields):
+    boundary = "harness-boundary"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode() + data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class HarnessState:
+    def __init__(self):
+        self.clock = VirtualClock()
+        self.recorder = Recorder()
+        self.relay = RelayPeer()
+        self.relays = []
+        self.handlers = collections.defaultdict(list)
+        self.scripts = {}
+        self._script_cycles = {}
+        self.scenario = {}
+        self.base_dir = "."
+        self.workers = 1
+        self.stopping = threading.Event()
+        self._reported_errors = set()
+        self._files = {}
+
+    # -- registration (called by the fake bricks) --
+
+    def register(self, key, fn):
+        self.handlers[key].append(fn)
+
+    def call_handler(self, key, fn, *args, **kwargs):
+        # Latency is real time minus time spent blocked in the virtual sleep().
+        start = time.perf_counter()
+        slept = self.clock.slept()
+        ok = True
+        try:
+            result = fn(*args, **kwargs)
+            if inspect.iscoroutine(result):
+                # async expose_api handlers (upload endpoints) run to completion here
+                result = asyncio.run(result)
+            return result
+        except Exception:
+            ok = False
+            if key not in self._reported_errors:
+                self._reported_errors.add(key)
+                print(f"[harness] {key} raised (further errors only counted):")
+                traceback.print_exc()
+            return None
+        finally:
+            busy = time.perf_counter() - start - (self.clock.slept() - slept)
+            self.recorder.record(key, busy * 1000.0, ok)
+
+    # -- scripted bricks --
+
+    def brick_call(self, key, default=None):
+        """Count a brick call and return its scripted result (or default)."""
+        self.recorder.count(key)
+        script = self.scripts.get(key)
+        if script is None:
+            return copy.deepcopy(default)
+        latency_ms = script.get("latency_ms", 0)
+        if latency_ms:
+            # Simulated compute time is real time: it is what the latency report measures.
+            _real_sleep(latency_ms / 1000.0)
+        if "results" in script:
+            cycle = self._script_cycles.get(key)
+            if cycle is None:
+                cycle = self._script_cycles.setdefault(key, itertools.cycle(script["results"]))
+            return copy.deepcopy(next(cycle))
+        if "result" in script:
+            return copy.deepcopy(script["result"])
+        return copy.deepcopy(default)
+
+    # -- scenario --
+
+    def _file_b64(self, path):
+        full = self._path(path)
+        if full not in self._files:
+            with open(full, "rb") as f:
+                self._files[full] = base64.b64encode(f.read()).decode("ascii")
+        return self._files[full]
+
+    def _path(self, path):
+        return path if os.path.isabs(path) else os.path.join(self.base_dir, path)
+
+    def _request(self, spec):
+        # body_file, content_type (default from the extension), query, chunked,
+        # chunk_size, and multipart: "<field>" with optional fields {...}
+        path = self._path(spec["body_file"])
+        with open(path, "rb") as f:
+            body = f.read()
+        content_type = spec.get("content_type")
+        if content_type is None:
+            ext = os.path.splitext(path)[1].lower().lstrip(".")
+            content_type = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}" if ext else "application/octet-stream"
+        if spec.get("multipart"):
+            body, content_type = _multipart(
+                spec["multipart"], os.path.basename(path), body, content_type, spec.get("fields", {}))
+        return FakeRequest(
+            body,
+            content_type,
+            query=spec.get("query"),
+            chunk_size=int(spec.get("chunk_size", 65536)),
+            chunked=bool(spec.get("chunked", False)),
+        )
+
+    def _resolve(self, value):
+        # {"$file_b64": "images/x.jpg"}  -> base64 string of that file
+        # {"$image": "images/x.jpg"}     -> PIL image (for camera/frame callbacks)
+        # {"$new": "pkg.mod.Class", "kwargs": {...}} -> Class(**kwargs)
+        # {"$request": {"body_file": ..., ...}} -> FakeRequest for upload endpoints
+        if isinstance(value, dict):
+            if set(value) == {"$file_b64"}:
+                return self._file_b64(value["$file_b64"])
+            if set(value) == {"$image"}:
+                from PIL import Image
+                image = Image.open(self._path(value["$image"]))
+                image.load()
+                return image
+            if "$request" in value:
+                return self._request(value["$request"])
+            if "$new" in value:
+                module_name, _, class_name = value["$new"].rpartition(".")
+                cls = getattr(importlib.import_module(module_name), class_name)
+                return cls(**self._resolve(value.get("kwargs", {})))
+            return {k: self._resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        return value
+
+    def _expand(self, events):
+        expanded = []
+        for order, event in enumerate(events):
+            repeat = int(event.get("repeat", 1))
+            every = float(event.get("every", 0.0))
+            values = event.get("values")
+            for i in range(repeat):
+                item = dict(event)
+                item["at"] = float(event.get("at", 0.0)) + i * every
+                if values:
+                    item["value"] = values[i % len(values)]
+                expanded.append((item["at"], order, i, item))
+        expanded.sort(key=lambda e: e[:3])
+        return [e[3] for e in expanded]
+
+    def _dispatch(self, event):
+        value = self._resolve(event.get("value"))
+        if "bridge" in event:
+            key = f"bridge:{event['bridge']}"
+            args = value if value is not None else event.get("args", [])
+            for fn in self.handlers.get(key, []):
+                self.call_handler(key, fn, *self._resolve(args))
+        elif "ui" in event:
+            key = f"ui:{event['ui']}"
+            data = value if value is not None else self._resolve(event.get("data"))
+            for fn in self.handlers.get(key, []):
+                self.call_handler(key, fn, event.get("sid", "harness"), data)
+        elif "api" in event:
+            key = f"api:{event['api']}"
+            args = value if value is not None else self._resolve(event.get("args", {}))
+            for fn in self.handlers.get(key, []):
+                if isinstance(args, dict):
+                    self.call_handler(key, fn, **args)
+                else:
+                    self.call_handler(key, fn, *args)
+        elif "connect" in event:
+            for fn in self.handlers.get("connect", []):
+                self.call_handler("ui:connect", fn, event.get("sid", "harness"))
+        elif "disconnect" in event:
+            for fn in self.handlers.get("disconnect", []):
+                self.call_handler("ui:disconnect", fn, event.get("sid", "harness"))
+        elif "callback" in event:
+            key = event["callback"]
+            args = value if value is not None else self._resolve(event.get("args", []))
+            for fn in self.handlers.get(key, []):
+                self.call_handler(f"callback:{key}", fn, *args)
+        elif "relay" in event:
+            params = value if value is not None else self._resolve(event.get("parameters", ""))
+            self.relay.command(event["relay"], params)
+        else:
+            print(f"[harness] unknown event: {event}")
+
+    def _user_loop(self, user_loop):
+        while not self.stopping.is_set():
+            self.call_handler("app:user_loop", user_loop)
+
+    def run_scenario(self, user_loop=None):
+        """Body of the fake App.run(): play the scenario, then return."""
+        events = self._expand(self.scenario.get("events", []))
+        duration = float(self.scenario.get("duration", events[-1]["at"] if events else 0.0))
+        self.recorder.started = _real_monotonic()
+
+        loop_thread = None
+        if user_loop is not None:
+            loop_thread = threading.Thread(target=self._user_loop, args=(user_loop,), daemon=True)
+            loop_thread.start()
+
+        pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        futures = []
+        # "speed": also wait real time between events (virtual seconds / speed),
+        # for apps that hand work to their own threads and need time to drain.
+        speed = float(self.scenario.get("speed", 0))
+        for event in events:
+            if speed > 0 and event["at"] > self.clock.now():
+                _real_sleep((event["at"] - self.clock.now()) / speed)
+            self.clock.advance_to(event["at"])
+            if pool is None:
+                self._dispatch(event)
+            else:
+                futures.append(pool.submit(self._dispatch, event))
+        self.clock.advance_to(duration)
+        if pool is not None:
+            pool.shutdown(wait=True)
+        if not self.relay.wait_idle():
+            print("[harness] timed out waiting for relay commands to finish")
+        settle = float(self.scenario.get("settle_sec", 0))
+        if settle > 0:
+            # Real time for work the app handed to its own threads (e.g. an executor).
+            _real_sleep(settle)
+
+        self.recorder.finished = _real_monotonic()
+        self.stopping.set()
+        self.clock.stop()
+        if loop_thread is not None:
+            loop_thread.join(timeout=2.0)
+        for client in self.relays:
+            client.stop()
+        self.relay.close()
+
+
+STATE = HarnessState()
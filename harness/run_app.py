@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Run an unmodified App Lab app headlessly against a scripted scenario.
+
+The app directory is staged the same way scripts/unoq_patch_app.sh patches it
+(app python/ files + app-lab/iotc_*.py + config.json as iotc_config.json), the
+fake arduino package in harness/ is put first on sys.path, the relay client is
+pointed at an in-process socketpair, and time.time/monotonic/sleep run on a
+virtual clock. App.run() plays the scenario events, then the harness prints
+per-handler throughput and latency.
+
+Examples:
+    python3 harness/run_app.py home-climate-monitoring-and-storage harness/scenarios/home-climate.json
+    python3 harness/run_app.py object-detection harness/scenarios/object-detection.json --json /tmp/od.json
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+
+HARNESS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HARNESS_DIR)
+APP_LAB_DIR = os.path.join(REPO_DIR, "app-lab")
+
+sys.path.insert(0, HARNESS_DIR)
+
+from harness_runtime import STATE, make_relay_client_class  # noqa: E402
+
+
+def stage_app(app_dir, dest):
+    shutil.copytree(os.path.join(app_dir, "python"), dest, dirs_exist_ok=True)
+    for helper in glob.glob(os.path.join(APP_LAB_DIR, "iotc_*.py")):
+        shutil.copy(helper, dest)
+    config = os.path.join(app_dir, "config.json")
+    if os.path.exists(config):
+        shutil.copy(config, os.path.join(dest, "iotc_config.json"))
+    return os.path.join(dest, "main.py")
+
+
+def install_relay_client(staged_dir):
+    path = os.path.join(staged_dir, "iotc_relay_client.py")
+    spec = importlib.util.spec_from_file_location("iotc_relay_client", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.IoTConnectRelayClient = make_relay_client_class(module.IoTConnectRelayClient)
+    sys.modules["iotc_relay_client"] = module
+
+
+def print_report(report):
+    print()
+    print(f"== harness report: {report['elapsed_sec']:.3f}s real, {report['virtual_sec']:.1f}s virtual")
+    header = f"{'handler':42s} {'count':>7s} {'err':>5s} {'mean':>9s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s} {'per_s':>9s}"
+    print(header)
+    print("-" * len(header))
+    for key, h in report["handlers"].items():
+        print(
+            f"{key[:42]:42s} {h['count']:7d} {h['errors']:5d} {h['mean_ms']:9.3f} {h['p50_ms']:9.3f} "
+            f"{h['p95_ms']:9.3f} {h['p99_ms']:9.3f} {h['max_ms']:9.3f} {h['per_sec']:9.1f}"
+        )
+    print("(latency in ms of real time, excluding virtual sleeps)")
+    telemetry = report["telemetry"]
+    frames = telemetry["frames"]
+    avg = telemetry["bytes"] / frames if frames else 0
+    print(f"telemetry: {frames} frames, {telemetry['bytes']} bytes ({avg:.0f} avg)")
+    if report["ui_messages"]:
+        print("ui messages: " + ", ".join(f"{k}={v['count']}" for k, v in report["ui_messages"].items()))
+    if report["brick_calls"]:
+        print("brick calls: " + ", ".join(f"{k}={n}" for k, n in report["brick_calls"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an App Lab app headlessly against a scenario.")
+    parser.add_argument("app", help="app-configs/<example> name or path")
+    parser.add_argument("scenario", help="Scenario JSON file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Dispatch events from N threads (default: scenario 'workers' or 1)")
+    parser.add_argument("--json", dest="json_out", help="Also write the report as JSON to this path")
+    parser.add_argument("--real-clock", action="store_true", help="Do not install the virtual clock")
+    args = parser.parse_args()
+
+    app_dir = args.app if os.path.isdir(args.app) else os.path.join(REPO_DIR, "app-configs", args.app)
+    if not os.path.isfile(os.path.join(app_dir, "python", "main.py")):
+        parser.error(f"no python/main.py under {app_dir}")
+    with open(args.scenario, "r", encoding="utf-8") as f:
+        scenario = json.load(f)
+
+    STATE.scenario = scenario
+    STATE.scripts = scenario.get("bricks", {})
+    STATE.workers = args.workers or int(scenario.get("workers", 1))
+    STATE.base_dir = REPO_DIR
+    for key, value in scenario.get("env", {}).items():
+        os.environ.setdefault(key, str(value))
+
+    with tempfile.TemporaryDirectory(prefix="iotc-harness-") as staged:
+        main_py = stage_app(app_dir, staged)
+        sys.path.insert(1, staged)
+        install_relay_client(staged)
+        if not args.real_clock:
+            STATE.clock.install()
+        cwd = os.getcwd()
+        os.chdir(staged)
+        try:
+            runpy.run_path(main_py, run_name="__main__")
+        finally:
+            os.chdir(cwd)
+            STATE.clock.release()
+
+    report = STATE.recorder.report()
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    failed = sum(h["errors"] for h in report["handlers"].values())
+    raise SystemExit(1 if failed and scenario.get("fail_on_error", True) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Superset aggregator for the UNO Q demo apps.
+
+Runs on the UNO Q host next to the IoTConnect relay server. Apps connect to the
+aggregator instead of the relay (same newline-delimited JSON protocol, so the
+stock IoTConnectRelayClient works unchanged), and the aggregator keeps a single
+upstream relay session registered as one device using the superset template.
+
+- Each app's latest telemetry frame is kept per client_id; a new frame
+  replaces the previous one, so stale keys are not sent again.
+- Every --interval seconds, each app that published since the previous flush
+  gets one superset-shaped frame upstream with its own UnoQdemo, so fields
+  that several apps share (status, confidence, ...) never mix.
+- Keys that are not attributes of the superset template are dropped; the
+  first time a key is dropped it is logged with the app that sent it, and
+  the counts per key are in the stats printed on exit.
+- Commands from IOTCONNECT are forwarded to every connected app, or only to one
+  app when the parameters carry {"target": "<client_id or UnoQdemo>"}.
+
+Example:
+    python3 scripts/iotc_superset_aggregator.py --listen tcp://0.0.0.0:8898
+
+Then point the apps at it:
+    RELAY_ENDPOINT = "tcp://172.17.0.1:8898"
+"""
+
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "app-lab"))
+
+from iotc_relay_client import IoTConnectRelayClient  # noqa: E402
+
+DEFAULT_TEMPLATE = os.path.join(REPO_DIR, "app-configs", "superset", "device-template.json")
+
+
+def load_template_attributes(path):
+    with open(path, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    return {a["name"] for a in template.get("attributes", []) if a.get("name")}
+
+
+class SupersetAggregator:
+    """Merges telemetry from many local relay clients into one upstream session."""
+
+    def __init__(self, upstream, client_id, interval_sec, attributes, verbose=False):
+        self.interval_sec = interval_sec
+        self.attributes = attributes
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.latest = {}        # client_id -> {key: value} of its newest frame
+        self.demo_names = {}    # client_id -> UnoQdemo
+        self.dirty = set()      # client_ids updated since the last flush
+        self.connections = {}   # client_id -> handler
+        self.stats = {
+            "frames_in": 0,
+            "frames_out": 0,
+            "keys_dropped": 0,
+            "commands_forwarded": 0,
+        }
+        self.unknown_keys = {}  # key -> times dropped
+        self.running = False
+        self.flush_thread = None
+        self.upstream = IoTConnectRelayClient(
+            upstream,
+            client_id=client_id,
+            command_callback=self.on_command,
+        )
+
+    def start(self):
+        self.running = True
+        self.upstream.start()
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.flush()
+        self.upstream.stop()
+
+    def register(self, client_id, handler):
+        with self.lock:
+            self.connections[client_id] = handler
+        print(f"Aggregator: registered {client_id} ({len(self.connections)} connected)")
+
+    def unregister(self, client_id, handler):
+        with self.lock:
+            if self.connections.get(client_id) is handler:
+                del self.connections[client_id]
+        print(f"Aggregator: {client_id} disconnected")
+
+    def publish(self, client_id, data):
+        if not isinstance(data, dict):
+            return
+        with self.lock:
+            self.stats["frames_in"] += 1
+            values = {}
+            for key, value in data.items():
+                if key == "UnoQdemo":
+                    self.demo_names[client_id] = str(value)
+                elif key in self.attributes:
+                    values[key] = value
+                else:
+                    self.stats["keys_dropped"] += 1
+                    if key not in self.unknown_keys:
+                        print(f"Aggregator: dropping {key!r} from {client_id}: not in the superset template")
+                    self.unknown_keys[key] = self.unknown_keys.get(key, 0) + 1
+            self.latest[client_id] = values
+            self.dirty.add(client_id)
+
+    def build_frames(self):
+        """One frame per app that published since the previous flush."""
+        with self.lock:
+            clients = sorted(self.dirty)
+            self.dirty.clear()
+            frames = []
+            for client_id in clients:
+                frame = dict(self.latest.get(client_id, {}))
+                frame["UnoQdemo"] = self.demo_names.get(client_id, client_id)
+                frame["interval_sec"] = int(self.interval_sec)
+                frames.append(frame)
+        return frames
+
+    def flush(self):
+        frames = self.build_frames()
+        if not frames:
+            return False
+        ok = True
+        for frame in frames:
+            sent = self.upstream.send_telemetry(frame)
+            if sent:
+                self.stats["frames_out"] += 1
+            ok = ok and bool(sent)
+            if self.verbose:
+                print(f"Aggregator send ({len(frame)} keys, ok={sent}): {frame}")
+        return ok
+
+    def _flush_loop(self):
+        next_flush = time.monotonic() + self.interval_sec
+        while self.running:
+            delay = next_flush - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_flush += self.interval_sec
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Aggregator flush failed: {e}")
+
+    def on_command(self, command_name, parameters):
+        target = parameters.get("target") if isinstance(parameters, dict) else None
+        message = {
+            "type": "command",
+            "command_name": command_name,
+            "parameters": parameters,
+        }
+        with self.lock:
+            if target:
+                handlers = [
+                    h for cid, h in self.connections.items()
+                    if target in (cid, self.demo_names.get(cid))
+                ]
+            else:
+                handlers = list(self.connections.values())
+        for handler in handlers:
+            if handler.send(message):
+                self.stats["commands_forwarded"] += 1
+        print(f"Aggregator command {command_name} -> {len(handlers)} app(s)")
+
+
+class AppConnectionHandler(socketserver.StreamRequestHandler):
+    """One connected app, speaking the relay server protocol."""
+
+    def setup(self):
+        super().setup()
+        self.client_id = None
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        try:
+            with self.send_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+            return True
+        except Exception as e:
+            print(f"Aggregator: send to {self.client_id} failed: {e}")
+            return False
+
+    def handle(self):
+        aggregator = self.server.aggregator
+        for raw in self.rfile:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Aggregator: invalid JSON from {self.client_id}: {e}")
+                continue
+
+            message_type = message.get("type")
+            if message_type == "register":
+                self.client_id = str(message.get("client_id") or self.client_address)
+                aggregator.register(self.client_id, self)
+                self.send({"type": "response", "status": "registered"})
+            elif message_type == "telemetry":
+                client_id = self.client_id or str(message.get("client_id"))
+                aggregator.publish(client_id, message.get("data"))
+
+    def finish(self):
+        if self.client_id is not None:
+            self.server.aggregator.unregister(self.client_id, self)
+        super().finish()
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(listen, aggregator):
+    if listen.startswith("tcp://"):
+        host, port = listen[len("tcp://"):].rsplit(":", 1)
+        server = ThreadingTCPServer((host.strip("[]"), int(port)), AppConnectionHandler)
+    else:
+        if os.path.exists(listen):
+            os.unlink(listen)
+        server = ThreadingUnixServer(listen, AppConnectionHandler)
+        os.chmod(listen, 0o666)
+    server.aggregator = aggregator
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge UNO Q demo app telemetry into one superset device.")
+    parser.add_argument("--listen", default="tcp://0.0.0.0:8898",
+                        help="tcp://host:port or Unix socket path the apps connect to (default: tcp://0.0.0.0:8898)")
+    parser.add_argument("--upstream", default="/tmp/iotconnect-relay.sock",
+                        help="Relay server socket (default: /tmp/iotconnect-relay.sock)")
+    parser.add_argument("--client-id", default="unoq_superset",
+                        help="Client id used for the single upstream registration")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="Seconds between superset frames (default: 5)")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE,
+                        help="Superset device template used to filter keys")
+    parser.add_argument("--verbose", action="store_true", help="Print every frame sent upstream")
+    args = parser.parse_args()
+
+    attributes = load_template_attributes(args.template)
+    aggregator = SupersetAggregator(
+        args.upstream,
+        client_id=args.client_id,
+        interval_sec=args.interval,
+        attributes=attributes,
+        verbose=args.verbose,
+    )
+    server = make_server(args.listen, aggregator)
+    aggregator.start()
+    print(f"Aggregator listening on {args.listen}, upstream {args.upstream}, "
+          f"{len(attributes)} superset attributes, interval {args.interval}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        aggregator.stop()
+        print(f"Aggregator stats: {aggregator.stats}")
+        if aggregator.unknown_keys:
+            print(f"Aggregator dropped keys: {aggregator.unknown_keys}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,8 @@ fi
 APP_DIR="$1"
 EXAMPLE_NAME="${2:-$(basename "$APP_DIR")}"
 MAIN_PY="$APP_DIR/python/main.py"
-RELAY_SRC="$(cd "$(dirname "$0")/.." && pwd)/app-lab/iotc_relay_client.py"
-RELAY_DST="$APP_DIR/python/iotc_relay_client.py"
+APP_LAB_DIR="$(cd "$(dirname "$0")/.." && pwd)/app-lab"
+RELAY_SRC="$APP_LAB_DIR/iotc_relay_client.py"
 CONFIG_PATH="$(cd "$(dirname "$0")/.." && pwd)/app-configs/$EXAMPLE_NAME/config.json"
 PREPATCH_MAIN="$(cd "$(dirname "$0")/.." && pwd)/app-configs/$EXAMPLE_NAME/python/main.py"
 
@@ -24,7 +24,15 @@ if [[ ! -f "$RELAY_SRC" ]]; then
   exit 1
 fi
 
-cp "$RELAY_SRC" "$RELAY_DST"
+# Relay client plus the shared iotc_* helper modules the pre-patched apps import
+cp "$APP_LAB_DIR"/iotc_*.py "$APP_DIR/python/"
+
+# Telemetry schema for iotc_telemetry_schema.load_encoder()
+if [[ -f "$CONFIG_PATH" ]]; then
+  cp "$CONFIG_PATH" "$APP_DIR/python/iotc_config.json"
+  python3 "$APP_LAB_DIR/iotc_telemetry_schema.py" --no-bench "$(dirname "$CONFIG_PATH")" || \
+    echo "Warning: config.json and device-template.json differ; fix them before creating the device."
+fi
 
 if [[ -f "$PREPATCH_MAIN" ]]; then
   cp "$PREPATCH_MAIN" "$MAIN_PY"
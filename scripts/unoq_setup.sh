@@ -11,13 +11,17 @@ FORCE_CONFIG="0"
 PIP_BREAK_SYSTEM_PACKAGES="1"
 RESTART_NEEDED="0"
 CONFIG_HASH_FILE=""
+WITH_AGGREGATOR="0"
+AGGREGATOR_PORT="8898"
+AGGREGATOR_INTERVAL="5"
+REPO_DIR="$(cd "$(dirname "$0")/.." && pwd)"
 
 RELAY_SERVER_URL="https://raw.githubusercontent.com/avnet-iotconnect/iotc-relay-service/main/relay-server/iotc-relay-server.py"
 RELAY_CLIENT_URL="https://raw.githubusercontent.com/avnet-iotconnect/iotc-relay-service/main/client-module/python/iotc_relay_client.py"
 
 usage() {
   cat <<EOF
-Usage: $0 [--demo-dir PATH] [--bridge-port PORT] [--skip-apt] [--no-systemd] [--skip-sdk] [--no-rename-certs] [--force-config] [--pip-break-system-packages]
+Usage: $0 [--demo-dir PATH] [--bridge-port PORT] [--skip-apt] [--no-systemd] [--skip-sdk] [--no-rename-certs] [--force-config] [--pip-break-system-packages] [--with-aggregator] [--aggregator-port PORT] [--aggregator-interval SEC]
 
   --demo-dir     Directory that contains iotcDeviceConfig.json and cert files
   --bridge-port  TCP port for the socat bridge (default: 8899)
@@ -27,6 +31,9 @@ Usage: $0 [--demo-dir PATH] [--bridge-port PORT] [--skip-apt] [--no-systemd] [--
   --no-rename-certs  Do not try to rename device cert/key files in demo dir
   --force-config     Overwrite existing config/cert/key files in demo dir
   --pip-break-system-packages  Allow pip to install system-wide packages
+  --with-aggregator      Install the superset aggregator service (one relay session for all apps)
+  --aggregator-port      TCP port the aggregator listens on (default: 8898)
+  --aggregator-interval  Seconds between superset frames (default: 5)
 EOF
 }
 
@@ -40,6 +47,9 @@ while [[ $# -gt 0 ]]; do
     --no-rename-certs) NO_RENAME_CERTS="1"; shift;;
     --force-config) FORCE_CONFIG="1"; shift;;
     --pip-break-system-packages) PIP_BREAK_SYSTEM_PACKAGES="1"; shift;;
+    --with-aggregator) WITH_AGGREGATOR="1"; shift;;
+    --aggregator-port) AGGREGATOR_PORT="$2"; shift 2;;
+    --aggregator-interval) AGGREGATOR_INTERVAL="$2"; shift 2;;
     -h|--help) usage; exit 0;;
     *) echo "Unknown arg: $1"; usage; exit 1;;
   esac
@@ -215,9 +225,32 @@ RestartSec=3
 WantedBy=multi-user.target
 EOF
 
+  if [[ "$WITH_AGGREGATOR" == "1" ]]; then
+    cat > /etc/systemd/system/iotc-aggregator.service <<EOF
+[Unit]
+Description=IoTConnect Superset Aggregator (one relay session for all demo apps)
+After=network.target iotc-relay.service
+Requires=iotc-relay.service
+
+[Service]
+Type=simple
+User=$RUN_USER
+ExecStartPre=/usr/local/bin/iotc-wait-relay-sock.sh
+ExecStart=/usr/bin/python3 $REPO_DIR/scripts/iotc_superset_aggregator.py --listen tcp://0.0.0.0:${AGGREGATOR_PORT} --interval ${AGGREGATOR_INTERVAL}
+Restart=always
+RestartSec=3
+
+[Install]
+WantedBy=multi-user.target
+EOF
+  fi
+
   systemctl daemon-reload
   systemctl enable --now iotc-relay.service
   systemctl enable --now iotc-socat.service
+  if [[ "$WITH_AGGREGATOR" == "1" ]]; then
+    systemctl enable --now iotc-aggregator.service
+  fi
 fi
 
 compute_config_hash() {
@@ -253,6 +286,9 @@ fi
 echo "Setup complete."
 echo "Demo dir: $DEMO_DIR"
 echo "Bridge port: $BRIDGE_PORT"
+if [[ "$WITH_AGGREGATOR" == "1" ]]; then
+  echo "Aggregator port: $AGGREGATOR_PORT (set RELAY_ENDPOINT = \"tcp://172.17.0.1:${AGGREGATOR_PORT}\" in the apps)"
+fi
 if [[ "$NO_SYSTEMD" == "1" ]]; then
   echo "Start manually:"
   echo "  python3 $DEMO_DIR/iotc-relay-server.py"
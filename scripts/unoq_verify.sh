@@ -56,6 +56,13 @@ if command -v systemctl >/dev/null 2>&1; then
   else
     warn "iotc-socat.service not active"
   fi
+  if [[ -f /etc/systemd/system/iotc-aggregator.service ]]; then
+    if systemctl is-active --quiet iotc-aggregator.service; then
+      ok "iotc-aggregator.service active"
+    else
+      warn "iotc-aggregator.service installed but not active"
+    fi
+  fi
 fi
 
 echo "Verify complete."